@@ -4,9 +4,12 @@ Created on Thu May  6 15:50:58 2021
 
 @author: LAB
 """
-
+import time
+_t_launch = time.perf_counter()
 
 from ScopeFoundry import BaseMicroscopeApp
+from HexSIM_Microscope.timing import StageTimer
+_t_scopefoundry = time.perf_counter() - _t_launch
 
 class FLIR_NI_App(BaseMicroscopeApp):
 
@@ -14,44 +17,103 @@ class FLIR_NI_App(BaseMicroscopeApp):
     # when storing data
     name = 'flir_ni_app'
     
+    # if True, simulated camera and analog outputs are used (start with --simulate)
+    simulate = False
+    
+    # if False, the HexSimAnalyser measurement is not loaded (start with --no-analyser)
+    load_analyser = True
+    
+    # if True, no window, figures or widgets are set up (see headless.py)
+    headless = False
+    
+    # the startup report warns if the application takes longer to start (s)
+    startup_target = 5.0
+    
     # You must define a setup function that adds all the 
     #capablities of the microscope and sets default settings
     def setup(self):
         
         #Add App wide settings
         
+        # time spent importing and setting up each component
+        timer = self.startup_timer = StageTimer()
+        
         #Add hardware components
         print("Adding Hardware Components")
-        from NIdaqmx_ScopeFoundry.ni_ao_hardware import NI_AO_hw
-        #from NIdaqmx_ScopeFoundry.ni_do_hardware import NI_DO_hw
-        #from NIdaqmx_ScopeFoundry.ni_co_hardware import NI_CO_hw
-        from Flir_ScopeFoundry.camera_hw import FlirHW
+        with timer('import hardware'):
+            if self.simulate:
+                from HexSIM_Microscope.simulated_hw import SimNI_AO_hw as NI_AO_hw
+                from HexSIM_Microscope.simulated_hw import SimFlirHW as FlirHW
+            else:
+                from NIdaqmx_ScopeFoundry.ni_ao_hardware import NI_AO_hw
+                #from NIdaqmx_ScopeFoundry.ni_do_hardware import NI_DO_hw
+                #from NIdaqmx_ScopeFoundry.ni_co_hardware import NI_CO_hw
+                from Flir_ScopeFoundry.camera_hw import FlirHW
         
-        self.add_hardware(NI_AO_hw(self, name='Analog_Output_0'))
-        self.add_hardware(NI_AO_hw(self, name='Analog_Output_1'))
+        with timer('setup Analog_Output_0'):
+            self.add_hardware(NI_AO_hw(self, name='Analog_Output_0'))
+        with timer('setup Analog_Output_1'):
+            self.add_hardware(NI_AO_hw(self, name='Analog_Output_1'))
         #self.add_hardware(NI_DO_hw(self))
         #self.add_hardware(NI_CO_hw(self))
-        self.add_hardware(FlirHW(self))
+        with timer('setup FLIRhw'):
+            self.add_hardware(FlirHW(self))
            
         # Add measurement components
         print("Create Measurement objects")
         
-        from HexSIM_Microscope.FLIR_NI_calibration_measure import FlirNImeasure
-        self.add_measurement(FlirNImeasure(self))
+        with timer('import FlirNImeasure'):
+            from HexSIM_Microscope.FLIR_NI_calibration_measure import FlirNImeasure
+        with timer('setup FlirNImeasure'):
+            self.add_measurement(FlirNImeasure(self))
         
-        from HexSimAnalyser.HexSimAnalyser_measurement import HexSimAnalysis
-        self.add_measurement(HexSimAnalysis)
+        if self.load_analyser:
+            with timer('import HexSimAnalysis'):
+                from HexSimAnalyser.HexSimAnalyser_measurement import HexSimAnalysis
+            with timer('setup HexSimAnalysis'):
+                self.add_measurement(HexSimAnalysis)
         
         
         # show ui
-        self.ui.show()
-        self.ui.activateWindow()
+        if not self.headless:
+            self.ui.show()
+            self.ui.activateWindow()
+    
+    def setup_default_ui(self):
+        if self.headless:
+            # ScopeFoundry updates the tree item of the hardware on disconnection
+            for hw in self.hardware.values():
+                hw.add_widgets_to_tree(tree=self.ui.hardware_treeWidget)
+            return
+        super().setup_default_ui()
+        
+    def startup_report(self):
+        """
+        Prints the import and setup time of each component, and the total 
+        time since the launch, with a warning if it exceeds startup_target
+        """
+        total = time.perf_counter() - _t_launch
+        stages = self.startup_timer.summary()
+        accounted = _t_scopefoundry + sum(stage['total'] for stage in stages.values()) * 1e-3
+        print('Startup time (ms):')
+        print(f'    {"import ScopeFoundry":28s}{_t_scopefoundry*1e3:8.0f}')
+        for name, stage in stages.items():
+            print(f'    {name:28s}{stage["total"]:8.0f}')
+        print(f'    {"user interface and other":28s}{(total-accounted)*1e3:8.0f}')
+        print(f'    {"total":28s}{total*1e3:8.0f}')
+        if total > self.startup_target:
+            print(f'Startup took longer than the target of {self.startup_target} s')
+        return total
 
 
 if __name__ == '__main__':
     import sys
     
+    FLIR_NI_App.simulate = '--simulate' in sys.argv
+    FLIR_NI_App.load_analyser = '--no-analyser' not in sys.argv
     app = FLIR_NI_App(sys.argv)
-    app.settings_load_ini(".\\Settings\\hexSIM.ini")
+    with app.startup_timer('load settings'):
+        app.settings_load_ini(".\\Settings\\hexSIM.ini")
+    app.startup_report()
     
     sys.exit(app.exec_())
\ No newline at end of file
@@ -9,15 +9,46 @@ from ScopeFoundry.helper_funcs import sibling_path, load_qt_ui_file
 from ScopeFoundry import h5_io
 import pyqtgraph as pg
 import numpy as np
+import h5py
 import os, time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 #from PyQt5.QtWidgets import QTableWidgetItem
 from qtpy.QtWidgets import QTableWidgetItem
-from HexSimProcessor.SIM_processing.hexSimProcessor import HexSimProcessor
+from HexSIM_Microscope.ao_sequence import load_phase_sequence
+from HexSIM_Microscope.voltage_sequence import VoltageSequence, VoltageSequenceError
+from HexSIM_Microscope.timing import StageTimer, append_json_line
+from HexSIM_Microscope.h5_writer import H5FrameWriter, H5StreamWriter, H5StackWriter, FLUSH_POLICIES, STREAM_LAYOUTS
+from HexSIM_Microscope.h5_compression import create_encoder, COMPRESSIONS
+from HexSIM_Microscope.frame_pool import FramePool
+from HexSIM_Microscope.storage import NpyFrameWriter, ZarrFrameWriter, open_zarr, settings_metadata, STORAGE_BACKENDS
+from HexSIM_Microscope.live_reconstruction import LiveReconstructor
+from HexSIM_Microscope.calibration_cache import CalibrationCache, CALIBRATION_ATTRS
+from HexSIM_Microscope.voltage_solver import VoltageSolver
+from HexSIM_Microscope.phase_estimation import carrier_phases, phase_steps, carrier_contrast
+from HexSIM_Microscope.frame_qc import FrameCheck
+from HexSIM_Microscope.display import DisplayDecimator, DISPLAY_MODES
+from HexSIM_Microscope.sensor_roi import set_sensor_roi, reset_sensor_roi, SensorROIError
+from HexSIM_Microscope.camera_reader import CameraReader
+from HexSIM_Microscope.settle import SettleTable, PipelinedWrite, transitions, deviation, settle_search, SETTLE_MODES
+from HexSIM_Microscope.calibration_map import calibrate_map, init_worker as init_map_worker
+from HexSIM_Microscope.mda import AcquisitionPlan, AcquisitionEngine, StackReconstructor, parse_positions
+from HexSIM_Microscope.fft_backend import FFTBackend, FFT_BACKENDS
+from HexSIM_Microscope.reconstruction import reconstructor_params, create_reconstructor, reconstructor_module, roi_slices, RECONSTRUCTOR_SETTINGS
 
 class FlirNImeasure(Measurement):
     
     name = "FLIR_NI_measurement"
     
+    # phase step of each carrier, in units of 2pi/num_phases per frame: 
+    # beams 1 and 2 are stepped by 1 and 2 units, carriers are their differences
+    carrier_phase_steps = [1, 2, 1]
+    
+    # stages whose p50/p95/max are shown in the timing_<stage> settings
+    timing_stages = ['stack', 'ao_write', 'settle', 'delay', 'grab', 'frame_wait', 'h5_queue', 'h5_write', 'h5_flush',
+                     'display', 'cut_roi', 'calibrate', 'calibration_map', 'find_phaseshifts', 'iteration',
+                     'mda_move', 'mda_wait', 'frame_qc']
+    
     def setup(self):
         """
         Runs once during App initialization.
@@ -26,8 +57,14 @@ class FlirNImeasure(Measurement):
         """
         
         self.ui_filename = sibling_path(__file__, "hexSIMcalibration.ui")
-        self.ui = load_qt_ui_file(self.ui_filename)    
+        # a headless app (see headless.py) has no user interface: run() and measure() do not need it
+        self.headless = getattr(self.app, 'headless', False)
+        self.ui = None if self.headless else load_qt_ui_file(self.ui_filename)
         self.settings.New('iterations', dtype=int, initial=1, vmin=0) 
+        self.settings.New('phase_tolerance', dtype=float, initial=0.05, vmin=0, spinbox_decimals=3, unit='rad') # stop when the rms error is below
+        self.settings.New('solver_gain', dtype=float, initial=1.0, vmin=0, vmax=1, spinbox_decimals=2)
+        self.settings.New('phase_per_volt', dtype=float, initial=1.0, spinbox_decimals=3, unit='rad/V') # initial guess of the response
+        self.settings.New('phase_error', dtype=float, initial=0.0, ro=True, spinbox_decimals=3, unit='rad')
         
         self.settings.New('magnification', dtype=float, initial=63, spinbox_decimals= 2)  
         self.settings.New('pixelsize', dtype=float, initial=5.86, spinbox_decimals= 2, unit='um') #For Pointgrey Grasshopper CMOS the pixelsize is: 5.86um 
@@ -40,38 +77,144 @@ class FlirNImeasure(Measurement):
         self.settings.New('w', dtype=float, initial=5.00, spinbox_decimals=2)
         self.settings.New('eta', dtype=float, initial=0.70, spinbox_decimals=2)
         self.settings.New('find_carrier', dtype=bool, initial=True)
+        self.settings.New('calibration_cache', dtype=bool, initial=True) # warm start from a previous calibration
+        self.settings.New('min_carrier_contrast', dtype=float, initial=3.0, vmin=1, spinbox_decimals=2) # a known carrier is used only if found in the frames
+        self.settings.New('calibration_cache_dir', dtype='file', is_dir=True,
+                          initial=sibling_path(__file__, 'calibration_cache'))
+        self.settings.New('calibration_cache_size', dtype=int, initial=32, vmin=1)
+        self.settings.New('calibration_source', dtype=str, initial='', ro=True) # 'searched', 'refined', 'cached' or 'map'
+        self.add_operation('invalidate_calibration', self.invalidate_calibration)
+        self.settings.New('calibration_map', dtype=bool, initial=False) # calibrate tiles of ROI_size on the whole frame
+        self.settings.New('map_workers', dtype=int, initial=max(os.cpu_count()//2, 1), vmin=1)
+        self.settings.New('map_phase_error', dtype=float, initial=0.0, ro=True, spinbox_decimals=3, unit='rad') # worst tile
+        self.calibration_map = None
         self.settings.New('gpu', dtype=bool, initial=False) 
+        self.settings.New('fft_backend', dtype=str, initial='numpy', choices=FFT_BACKENDS) # FFTs of the reconstructor, without gpu
+        self.settings.New('fft_workers', dtype=int, initial=os.cpu_count(), vmin=1) # threads of the scipy and pyfftw FFTs
+        self.settings.New('fft_wisdom', dtype='file', initial=sibling_path(__file__, 'Settings/fftw_wisdom.pkl'))
+        self.settings.fft_backend.add_listener(self.reset_fft)
+        self.settings.fft_workers.add_listener(self.reset_fft)
+        self.settings.fft_wisdom.add_listener(self.reset_fft)
+        self.fft = None
         self.settings.New('selectROI', dtype=bool, initial=False) 
         self.settings.New('roiX', dtype=int, initial=600)
         self.settings.New('roiY', dtype=int, initial=1200)
         self.settings.New('ROI_size', dtype=int, initial=512, vmin=1, vmax=2048) 
+        self.settings.New('sensor_roi', dtype=bool, initial=False) # read out only the ROI in calibration and measure
         
         self.auto_range = self.settings.New('auto_range', dtype=bool, initial=True)
         self.settings.New('auto_levels', dtype=bool, initial=True)
         self.settings.New('level_min', dtype=int, initial=60)
         self.settings.New('level_max', dtype=int, initial=4000)
+        self.settings.New('display_mode', dtype=str, initial='subsample', choices=DISPLAY_MODES)
+        self.settings.New('display_factor', dtype=int, initial=1, ro=True) # decimation of the displayed frame
+        self.settings.New('display_fps', dtype=float, initial=0.0, ro=True, spinbox_decimals=1)
+        self.settings.New('display_time', dtype=float, initial=0.0, ro=True, spinbox_decimals=2, unit='ms')
         
         self.settings.New('calibrate', dtype=bool, initial=False) 
         self.settings.New('measure', dtype=bool, initial=False)         
         self.settings.New('save_h5', dtype=bool, initial=False)         
+        self.settings.New('storage', dtype=str, initial='h5', choices=STORAGE_BACKENDS) # format of the measured stacks
+        self.settings.New('flush_policy', dtype=str, initial='every_n', choices=FLUSH_POLICIES)
+        self.settings.New('flush_every', dtype=int, initial=7, vmin=1)
+        self.settings.New('flush_interval', dtype=float, initial=1.0, vmin=0, unit='s')
+        self.settings.New('writer_queue_size', dtype=int, initial=16, vmin=1)
+        self.settings.New('writer_queue_depth', dtype=int, initial=0, ro=True)
+        self.settings.New('writer_blocked_time', dtype=float, initial=0.0, ro=True, spinbox_decimals=1, unit='ms')
+        self.settings.New('compression', dtype=str, initial='none', choices=COMPRESSIONS)
+        self.settings.New('compression_level', dtype=int, initial=4, vmin=0, vmax=9)
+        self.settings.New('compression_workers', dtype=int, initial=4, vmin=1)
+        self.settings.New('record', dtype=bool, initial=False) # stream to h5 in continuous mode
+        self.settings.New('record_layout', dtype=str, initial='cycles', choices=STREAM_LAYOUTS)
+        self.settings.New('rotate_size', dtype=float, initial=4096.0, vmin=0, unit='MB') # 0: never
+        self.settings.New('rotate_time', dtype=float, initial=0.0, vmin=0, unit='s') # 0: never
+        self.settings.New('cycle_phases', dtype=bool, initial=False) # cycle the AO table in continuous mode (needs hw_timed)
+        self.settings.New('live_sim', dtype=bool, initial=False) # reconstruct the ROI in continuous mode (needs hw_timed)
+        self.settings.New('sim_time', dtype=float, initial=0.0, ro=True, spinbox_decimals=1, unit='ms')
+        self.settings.New('sim_dropped', dtype=int, initial=0, ro=True)
+        self.settings.New('reader_queue_size', dtype=int, initial=8, vmin=1) # frames buffered between camera and consumers
+        self.settings.New('frames_dropped', dtype=int, initial=0, ro=True) # discarded because the consumers were late
+        self.settings.New('frames_late', dtype=int, initial=0, ro=True) # taken more than a frame period after readout
+        self.settings.New('camera_dropped', dtype=int, initial=0, ro=True) # not read out of the camera buffer in time
+        self.settings.New('mda', dtype=bool, initial=False) # run() acquires the multi-dimensional plan
+        self.settings.New('mda_time_points', dtype=int, initial=1, vmin=1)
+        self.settings.New('mda_interval', dtype=float, initial=0.0, vmin=0, unit='s')
+        self.settings.New('mda_positions', dtype=str, initial='') # 'x0, y0; x1, y1; ...'
+        self.settings.New('mda_z_start', dtype=float, initial=0.0, spinbox_decimals=3, unit='um')
+        self.settings.New('mda_z_step', dtype=float, initial=1.0, spinbox_decimals=3, unit='um')
+        self.settings.New('mda_z_slices', dtype=int, initial=0, vmin=0) # 0: z is not moved
+        self.settings.New('mda_x_setting', dtype=str, initial='') # settings moving the stage, e.g. hw/stage/x_target
+        self.settings.New('mda_y_setting', dtype=str, initial='')
+        self.settings.New('mda_z_setting', dtype=str, initial='')
+        self.settings.New('mda_reconstruct', dtype=bool, initial=False) # reconstruct the ROI of each stack
+        self.settings.New('mda_workers', dtype=int, initial=2, vmin=1)
+        self.settings.New('mda_point', dtype=str, initial='', ro=True)
         self.settings.New('refresh_period',dtype = float, unit ='s', spinbox_decimals = 3, initial = 0.05, vmin = 0)        
+        self.settings.New('timing', dtype=bool, initial=True) # stage timers, their settings and log
+        self.settings.New('timing_log', dtype='file', initial=sibling_path(__file__, 'log/flir_ni_timing.jsonl'))
+        for stage in self.timing_stages:
+            self.settings.New(f'timing_{stage}', dtype=str, initial='', ro=True) # p50 / p95 / max (ms)
         
         self.settings.New('num_phases', dtype=int, initial=7, vmin = 1)
         self.settings.New('num_channels', dtype=int, initial=2, vmin = 1)
+        self.sequence = VoltageSequence(channels=self.settings['num_channels'], steps=self.settings['num_phases'])
+        self.settings.New('voltage_sequence', dtype=str, initial=self.sequence.to_string()) # channels separated by ';'
+        self.settings.New('sequence_file', dtype='file', initial=sibling_path(__file__, 'Settings/voltage_sequence.csv')) # .npy or .csv
         self.settings.num_phases.hardware_set_func = self.resize_UItable
         self.settings.num_channels.hardware_set_func = self.resize_UItable
+        self.settings.voltage_sequence.add_listener(self.on_voltage_sequence)
         self.add_operation('write_table', self.write_UItable)
         self.add_operation('clear_table', self.clear_UItable)
+        self.add_operation('import_sequence', self.import_sequence)
+        self.add_operation('export_sequence', self.export_sequence)
         
         
         self.image_gen = self.app.hardware['FLIRhw']
        
         self.settings.New('delay', dtype=float, initial = 0.0 , unit = 's')
+        self.settings.New('hw_timed', dtype=bool, initial=False) # AO table clocked by the camera strobe
+        self.settings.New('settle_mode', dtype=str, initial='fixed', choices=SETTLE_MODES) # wait after each voltage write
+        self.settings.New('settle_time', dtype=float, initial=0.05, vmin=0, spinbox_decimals=3, unit='s') # fixed, or for steps not characterized
+        self.settings.New('settle_margin', dtype=float, initial=1.2, vmin=1.0, spinbox_decimals=2) # factor on the characterized times
+        self.settings.New('settle_file', dtype='file', initial=sibling_path(__file__, 'Settings/settle_times.json'))
+        self.settings.New('characterize_settle', dtype=bool, initial=False) # run() measures the settle times
+        self.settings.New('settle_tolerance', dtype=float, initial=0.05, vmin=0, spinbox_decimals=3) # relative to the step
+        self.settings.New('settle_max', dtype=float, initial=0.2, vmin=0, spinbox_decimals=3, unit='s')
+        self.settings.New('settle_resolution', dtype=float, initial=0.002, vmin=0.0001, spinbox_decimals=4, unit='s')
+        self.settings.New('pipelined', dtype=bool, initial=False) # write the next voltages during the readout
+        self.settings.New('pipeline_guard', dtype=float, initial=2.0, vmin=0, spinbox_decimals=1, unit='ms') # after the exposure
+        self.settings.New('acq_start_latency', dtype=float, initial=0.0, vmin=0, spinbox_decimals=1, unit='ms') # measured; 0: unknown
+        self.settings.New('frame_qc', dtype=bool, initial=False) # check each frame of measure(), acquire again those out of tolerance
+        self.settings.New('qc_intensity_tolerance', dtype=float, initial=0.1, vmin=0, spinbox_decimals=3) # relative to the median frame
+        self.settings.New('qc_modulation_tolerance', dtype=float, initial=0.3, vmin=0, vmax=1, spinbox_decimals=3) # relative loss
+        self.settings.New('qc_phase_tolerance', dtype=float, initial=0.0, vmin=0, spinbox_decimals=3, unit='rad') # 0: not checked
+        self.settings.New('qc_retries', dtype=int, initial=2, vmin=0) # times a frame out of tolerance is acquired again
+        self.settings.New('qc_retaken', dtype=int, initial=0, ro=True) # frames acquired again in the last stack
+        self.frame_check = None # FrameCheck of the last stack
+        self.qc_carrier_warned = False
+        self.settings.settle_file.add_listener(self.reset_settle_table)
+        self.settle_table = None
+        self.ao_voltages = None # last voltages written by write_voltages, None if unknown
+        self.ao_previous = None
+        self.ao_write_time = 0.0
         
         self.ni_ao_0 = self.app.hardware['Analog_Output_0']
         self.ni_ao_1 = self.app.hardware['Analog_Output_1']
         
-        self.setup_UItable()
+        self.timer = StageTimer()
+        self.settings.timing.add_listener(self.enable_timing)
+        self.timing_published = time.perf_counter()
+        self.sensor_window = None # (offset_x, offset_y, width, height) of the camera ROI, None for full frame
+        self.display = DisplayDecimator()
+        self.frame_counter = 0 # incremented at each new self.img, to skip redraws of the same frame
+        self.displayed_frame = -1
+        self.display_count = 0
+        self.display_count_start = time.perf_counter()
+        self.frame_pool = FramePool(self.settings['num_phases'])
+        self.data_file = None # the last data file created by measure() or run_mda()
+        
+        if not self.headless:
+            self.setup_UItable()
                 
     def setup_figure(self):
         """
@@ -106,6 +249,15 @@ class FlirNImeasure(Measurement):
         cmap = pg.ColorMap(pos=np.linspace(0.0, 1.0, 6), color=colors)
         self.imv.setColorMap(cmap)
         
+        # live SIM reconstruction, shown only when live_sim is active
+        self.imv_sim = pg.ImageView()
+        self.imv_sim.ui.menuBtn.hide()
+        self.imv_sim.ui.roiBtn.hide()
+        self.imv_sim.setColorMap(cmap)
+        self.imv_sim.setVisible(self.settings['live_sim'])
+        self.ui.image_groupBox.layout().addWidget(self.imv_sim)
+        self.settings.live_sim.add_listener(lambda: self.imv_sim.setVisible(self.settings['live_sim']))
+        
     def update_display(self):
         """
         Displays (plots) the numpy array self.buffer. 
@@ -118,20 +270,25 @@ class FlirNImeasure(Measurement):
             length = self.image_gen.frame_num.val
             self.settings['progress'] = (self.frame_index +1) * 100/length
         
-        if hasattr(self, 'img'):
-            self.imv.setImage(self.img,
-                                autoLevels = self.settings['auto_levels'],
-                                autoRange = self.auto_range.val,
-                                levelMode = 'mono'
-                                )
-            
-            if self.settings['auto_levels']:
-                lmin,lmax = self.imv.getHistogramWidget().getLevels()
-                self.settings['level_min'] = lmin
-                self.settings['level_max'] = lmax
-            else:
-                self.imv.setLevels( min= self.settings['level_min'],
-                                    max= self.settings['level_max'])
+        if hasattr(self, 'img') and self.frame_counter != self.displayed_frame:
+            self.displayed_frame = self.frame_counter
+            t = time.perf_counter()
+            self.show_image(self.img)
+            self.update_display_rate(time.perf_counter() - t)
+            self.timer.add('display', time.perf_counter() - t)
+        if time.perf_counter() - self.timing_published >= 1.0:
+            self.publish_timing()
+        live = getattr(self, 'live_reconstructor', None)
+        if live is not None:
+            result = live.result()
+            if result is not None:
+                _index, img_sim = result
+                self.imv_sim.setImage(img_sim, autoLevels = True, autoRange = self.auto_range.val)
+                self.settings['sim_time'] = live.last_duration * 1e3
+            if live.last_error is not None:
+                print(f'Live reconstruction failed: {live.last_error}')
+                live.last_error = None
+            self.settings['sim_dropped'] = live.dropped
         if hasattr(self, 'roi'):         
             x,y = self.roi.pos()
             s = self.settings['ROI_size']//2
@@ -139,96 +296,583 @@ class FlirNImeasure(Measurement):
             self.settings['roiY'] = y + s
                
     
+    def show_image(self, img):
+        """
+        Draws the frame decimated to the size of the widget, with levels 
+        estimated on a subsample. The image is scaled back, so that the 
+        coordinates of the view (and of the ROI) remain those of the full frame
+        """
+        self.display.mode = self.settings['display_mode']
+        factor = self.display.factor(img.shape, (self.imv.width(), self.imv.height()))
+        reduced = self.display.reduce(img, factor)
+        self.settings['display_factor'] = factor
+        if self.settings['auto_levels']:
+            lmin, lmax = self.display.levels(reduced)
+            self.settings['level_min'] = int(lmin)
+            self.settings['level_max'] = int(lmax)
+        levels = (self.settings['level_min'], self.settings['level_max'])
+        self.imv.setImage(reduced,
+                          autoLevels = False,
+                          levels = levels,
+                          autoRange = self.auto_range.val,
+                          autoHistogramRange = False,
+                          scale = (factor, factor),
+                          levelMode = 'mono'
+                          )
+    
+    def update_display_rate(self, duration):
+        """
+        Updates display_time (smoothed cost of a redraw) and display_fps (redraws per second)
+        """
+        self.settings['display_time'] = 0.9 * self.settings['display_time'] + 0.1 * duration * 1e3
+        self.display_count += 1
+        elapsed = time.perf_counter() - self.display_count_start
+        if elapsed >= 1.0:
+            self.settings['display_fps'] = self.display_count / elapsed
+            self.display_count = 0
+            self.display_count_start = time.perf_counter()
+    
+    def enable_timing(self):
+        self.timer.enabled = self.settings['timing']
+    
+    def publish_timing(self):
+        """
+        Shows p50 / p95 / max (ms) of the last durations of each stage in its timing setting
+        """
+        self.timing_published = time.perf_counter()
+        if not self.settings['timing']:
+            return
+        stages = self.timer.summary()
+        for stage in self.timing_stages:
+            if stage in stages:
+                s = stages[stage]
+                self.settings[f'timing_{stage}'] = f"{s['p50']:.2f} / {s['p95']:.2f} / {s['max']:.2f}"
+    
+    def pre_run(self):
+        self.ao_voltages = None
+        self.data_file = None
+        self.qc_carrier_warned = False
+        self.timer.reset()
+        self.run_start = time.time()
+        
+    def post_run(self):
+        """
+        Appends the timing of the run to the timing_log, as a JSON line
+        """
+        self.publish_timing()
+        if self.fft is not None:
+            self.fft.save_wisdom() # the FFTW plans measured by the run
+        if not self.settings['timing']:
+            return
+        camera = self.image_gen.settings
+        record = {'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.run_start)),
+                  'duration_s': time.time() - self.run_start,
+                  'mode': 'mda' if self.settings['mda'] else \
+                          'settle' if self.settings['characterize_settle'] else \
+                          'calibrate' if self.settings['calibrate'] else \
+                          'measure' if self.settings['measure'] else 'continuous',
+                  'num_phases': self.settings['num_phases'],
+                  'hw_timed': self.settings['hw_timed'],
+                  'storage': self.settings['storage'],
+                  'exposure_ms': camera['exposure_time'],
+                  'frame_shape': None if getattr(self, 'img', None) is None else list(self.img.shape),
+                  'stages_ms': self.timer.summary()}
+        try:
+            append_json_line(self.settings['timing_log'], record)
+        except OSError as err:
+            print(f'Timing log not written: {err}')
+    
     def measure(self,save_data):
+        with self.timer('stack'):
+            if self.settings['hw_timed']:
+                self.measure_hw_timed(save_data)
+            else:
+                self.measure_sw_timed(save_data)
+        
+    def measure_sw_timed(self,save_data):
+        """
+        Acquires the phases one frame at a time, setting the voltages of each
+        phase with the software before the frame. If pipelined, the voltages
+        of the next phase are written at the end of the exposure, so that they
+        settle during the readout (see PipelinedWrite). The end of the exposure
+        is the strobe of the camera if it reports it, else acq_start_latency
+        plus exposure_time after acq_start: pipelining is safe only with the
+        strobe or a measured acq_start_latency. Without both, the voltages are
+        written after the readout
+        """
         self.image_gen.settings['acquisition_mode'] = 'MultiFrame'
         self.settings['save_h5'] = save_data
         ph = self.image_gen.settings['frame_num'] = self.settings['num_phases']
                 
-        voltages = self.read_from_UItable()
         first_frame_acquired = False
         frame_num  = self.image_gen.frame_num.val
+        # voltages of each frame, as tuples of floats ready for write_voltages
+        steps = [tuple(step) for step in self.sequence.waveform(2, frame_num).T.tolist()] # ao_0, ao_1
         
         self.image_gen.camera.set_framenum(1) # acquire 1 frame at a time
         self.image_gen.camera.acq_start()
         
-        self.imgs = np.zeros([ph,
-                              self.image_gen.settings.image_height.val,
-                              self.image_gen.settings.image_width.val])
+        self.frame_pool.resize(ph)
+        pipelined = self.settings['pipelined']
+        write_delay = None
+        if self.settings['acq_start_latency'] > 0:
+            write_delay = (self.settings['acq_start_latency'] + self.image_gen.settings['exposure_time'] +
+                           self.settings['pipeline_guard']) * 1e-3
+        writer = None
+        check = self.create_frame_check(frame_num)
         
         for frame_idx in range(frame_num):
             
-            v0 = float(voltages[0][frame_idx])
-            v1 = float(voltages[1][frame_idx])
-            self.ni_ao_0.AO_device.write_constant_voltage(v0)
-            self.ni_ao_1.AO_device.write_constant_voltage(v1)
-            time.sleep(0.05) #TODO remove after solving the issue
+            if writer is None:
+                self.write_voltages(*steps[frame_idx])
+            with self.timer('settle'):
+                remaining = self.settle_time() - (time.perf_counter() - self.ao_write_time)
+                if remaining > 0:
+                    time.sleep(remaining)
             self.frame_index = frame_idx
-            self.image_gen.camera.acq_start()
-            self.img = self.image_gen.camera.get_nparray()
-            self.image_gen.camera.acq_stop()
-            self.imgs[frame_idx,:,:] = self.img                
-            if self.settings['save_h5']:
+            with self.timer('grab'):
+                writer = None
+                if pipelined and frame_idx+1 < frame_num:
+                    writer = PipelinedWrite(self.write_voltages, steps[frame_idx+1], self.image_gen.camera,
+                                            delay = write_delay,
+                                            guard = self.settings['pipeline_guard'] * 1e-3)
+                    writer.start()
+                self.image_gen.camera.acq_start()
+                self.img = self.frame_pool.grab(self.image_gen.camera, frame_idx)
+                self.frame_counter += 1
+                self.image_gen.camera.acq_stop()
+                if writer is not None:
+                    writer.finish()
+            if check is not None:
+                self.check_frame(check, frame_idx) # saved once the whole stack is checked
+            elif self.settings['save_h5']:
                 if not first_frame_acquired:
                     
-                    self.create_h5_file()
+                    self.create_data_file()
                     first_frame_acquired = True
-                    
-                self.image_h5[frame_idx,:,:] = self.img
-                self.h5file.flush()
+                self.save_frame(frame_idx, self.img)
             
             if self.interrupt_measurement_called:
                 break
-            time.sleep(self.settings['delay'])
+            with self.timer('delay'):
+                time.sleep(self.settings['delay'])
         self.image_gen.camera.acq_stop() 
+        if check is not None:
+            self.retake_frames(check, steps)
+        self.imgs = self.frame_pool.stack
         
-    def update_voltages(self, expected, measured):             
+    def acquisition_plan(self):
+        """ The AcquisitionPlan of the mda settings """
+        z_positions = [self.settings['mda_z_start'] + i * self.settings['mda_z_step']
+                       for i in range(self.settings['mda_z_slices'])]
+        return AcquisitionPlan(time_points = self.settings['mda_time_points'],
+                               interval = self.settings['mda_interval'],
+                               positions = parse_positions(self.settings['mda_positions']),
+                               z_positions = z_positions)
+    
+    def stage_mover(self, *paths):
+        """ Function writing its arguments to the settings at paths, None if a path is not set """
+        if not all(paths):
+            return None
+        lqs = [self.app.get_lq(path) for path in paths]
+        if None in lqs:
+            raise ValueError(f'Stage settings not found: {paths}')
+        def move(*values):
+            for lq, value in zip(lqs, values):
+                lq.update_value(value)
+        return move
+    
+    def acquire_point(self, buffer):
+        """ Acquires a phase stack in buffer (if not None), for the AcquisitionEngine """
+        if buffer is not None:
+            self.frame_pool.attach(buffer)
+        try:
+            self.measure(save_data=False)
+        finally:
+            self.frame_pool.detach()
+        return self.imgs
+    
+    def run_mda(self):
         """
-        Updates the voltage indicated in the table
-        expected : np.array (float) 3x7 
-        measured : np.array (float) 3x7 
+        Acquires the multi-dimensional plan in a new h5 file, one t*/c*/image
+        dataset per point. Writing, compression and reconstruction (if
+        mda_reconstruct) run while the next point is moved to and acquired
         """
-        table = self.ui.tableWidget
-        rows = table.rowCount() # phases (7)
-        cols = table.columnCount() # channels (2)
+        plan = self.acquisition_plan()
+        move_xy = self.stage_mover(self.settings['mda_x_setting'], self.settings['mda_y_setting'])
+        move_z = self.stage_mover(self.settings['mda_z_setting'])
+        self.apply_sensor_roi()
+        self.h5file, self.h5_group = self.open_h5_file()
+        self.data_file = self.h5file.filename
+        self.h5_group.attrs['plan'] = plan.to_json()
+        writer = H5StackWriter(self.h5_group, self.h5file,
+                               queue_size = max(self.settings['writer_queue_size'] // self.settings['num_phases'], 1),
+                               timer = self.timer,
+                               encoder = self.create_encoder())
+        reconstructor = None
+        if self.settings['mda_reconstruct']:
+            rows, cols = self.roi_slices(self.frame_shape())
+            kx = ky = None
+            if getattr(self, 'isCalibrated', False):
+                kx, ky = self.h.kx, self.h.ky
+            xy_sampling = self.settings['pixelsize'] / self.settings['magnification']
+            reconstructor = StackReconstructor(self.reconstructor_params(), rows, cols, kx, ky,
+                                               workers = self.settings['mda_workers'],
+                                               fft = self.fft_args(max(self.settings['fft_workers'] // self.settings['mda_workers'], 1)),
+                                               attrs = {'element_size_um': [1.0, xy_sampling/2, xy_sampling/2],
+                                                        'roi_rows': [rows.start, rows.stop],
+                                                        'roi_cols': [cols.start, cols.stop]})
+        engine = AcquisitionEngine(plan, self.acquire_point, writer, move_xy, move_z,
+                                   reconstructor = reconstructor,
+                                   attrs = self.image_attrs(),
+                                   stack_attrs = self.frame_check_attrs,
+                                   timer = self.timer)
+        def on_point(point):
+            self.settings['mda_point'] = f'{engine.acquired}/{len(plan)}: {point.group}'
+            self.settings['progress'] = engine.acquired * 100 / len(plan)
+        writer.start()
+        try:
+            count = engine.run(should_stop = lambda: self.interrupt_measurement_called, on_point = on_point)
+            print(f'Multi-dimensional acquisition: {count} of {len(plan)} points in {self.h5file.filename}')
+        finally:
+            if reconstructor is not None:
+                reconstructor.shutdown()
+            try:
+                writer.close()
+            finally:
+                self.h5file.close()
+                del self.h5file
+                self.restore_sensor_roi()
+                self.ni_ao_0.stop()
+                self.ni_ao_1.stop()
+    
+    def write_voltages(self, v0, v1):
+        with self.timer('ao_write'):
+            self.ni_ao_0.AO_device.write_constant_voltage(v0)
+            self.ni_ao_1.AO_device.write_constant_voltage(v1)
+        self.ao_previous = self.ao_voltages
+        self.ao_voltages = (v0, v1)
+        self.ao_write_time = time.perf_counter()
         
-        new_values = np.zeros([rows,cols]) # array with the new values, initialized to zero
+    def settle_time(self):
+        """
+        Wait (s) after the last write_voltages: the characterized settle time
+        of the slowest channel, or settle_time in fixed mode and if a
+        step (or the previous voltage) is unknown
+        """
+        fixed = self.settings['settle_time']
+        if self.settings['settle_mode'] == 'fixed' or self.ao_previous is None:
+            return fixed
+        table = self.get_settle_table()
+        times = [table.lookup(channel, v - p) for channel, (p, v) in enumerate(zip(self.ao_previous, self.ao_voltages))]
+        if None in times:
+            return fixed
+        return max(times) * self.settings['settle_margin']
+    
+    def get_settle_table(self):
+        if self.settle_table is None:
+            self.settle_table = SettleTable.load(self.settings['settle_file'])
+        return self.settle_table
+    
+    def reset_settle_table(self):
+        self.settle_table = None
         
-        # error = ......
-              
-        # new_values [i,j]  =  .......
+    def grab_frame(self):
+        """ Acquires a single frame and returns its ROI, as float """
+        camera = self.image_gen.camera
+        camera.acq_start()
+        try:
+            img = camera.get_nparray()
+        finally:
+            camera.acq_stop()
+        self.img = img
+        self.frame_counter += 1
+        rows, cols = self.roi_slices(img.shape)
+        return img[rows, cols].astype(np.float32)
         
+    def characterize_settle(self):
+        """
+        Measures the settle time of each channel for each step size of the 
+        voltage table. For each step, the frame after a delay from the write
+        is compared with the settled frame, and the shortest delay within
+        settle_tolerance (plus the noise) is found by bisection.
+        The table is saved to settle_file
+        """
+        voltages = self.phase_voltages()
+        hold = self.settings['settle_max'] # assumed to be enough to settle
+        delays = np.arange(0, hold + 1e-9, self.settings['settle_resolution'])
+        self.image_gen.settings['acquisition_mode'] = 'MultiFrame'
+        self.image_gen.camera.set_framenum(1)
+        table = SettleTable()
         
-        for j in range(cols): 
-            for i in range(rows):
-                      val = new_values[i,j] 
-                      table.setItem(i,j, QTableWidgetItem(str(val)))  
+        for channel in range(2):
+            for step, (v_from, v_to) in transitions(voltages[channel]).items():
+                if self.interrupt_measurement_called:
+                    return
+                rest = voltages[:, 0]
+                # settled frames averaged, to compare the frames of the probes with less noise
+                initial = self.average_frames(self.step_frame(rest, channel, v_to, v_from, hold))
+                final = self.average_frames(self.step_frame(rest, channel, v_from, v_to, hold))
+                noise = deviation(self.grab_frame(), initial, final)
+                probe = lambda delay: deviation(self.step_frame(rest, channel, v_from, v_to, delay), initial, final)
+                settle = settle_search(probe, delays, self.settings['settle_tolerance'] + 2*noise)
+                if settle is None:
+                    print(f'Channel {channel}, step {step} V: not settled within {hold} s')
+                    settle = hold
+                print(f'Channel {channel}, step {step} V: settle time {settle*1e3:.1f} ms (noise {noise:.3f})')
+                table.set(channel, step, settle)
+        table.save(self.settings['settle_file'])
+        self.settle_table = table
+    
+    def average_frames(self, first, count=4):
+        """ Mean of first and of count-1 frames grabbed after it """
+        return np.mean([first] + [self.grab_frame() for _ in range(count-1)], axis=0)
+    
+    def step_frame(self, rest, channel, v_from, v_to, delay):
+        """
+        Steps channel from v_from (held for settle_max) to v_to, the other 
+        channels being at the rest voltages, and grabs a frame after delay (s)
+        """
+        voltages = [float(v) for v in rest]
+        voltages[channel] = v_from
+        self.write_voltages(*voltages)
+        time.sleep(self.settings['settle_max'])
+        voltages[channel] = v_to
+        self.write_voltages(*voltages)
+        time.sleep(delay)
+        return self.grab_frame()
         
+    def measure_hw_timed(self,save_data):
+        """
+        Acquires the phases with the camera running in MultiFrame mode and the
+        voltage table output as a buffered AO waveform, advanced by the 
+        camera strobe connected to the trigger_source of the AO hardware.
+        """
+        self.image_gen.settings['acquisition_mode'] = 'MultiFrame'
+        self.settings['save_h5'] = save_data
+        ph = self.image_gen.settings['frame_num'] = self.settings['num_phases']
         
+        first_frame_acquired = False
+        frame_num  = self.image_gen.frame_num.val
         
+        sequence = self.load_ao_sequence(self.phase_voltages(frame_num))
+        check = self.create_frame_check(frame_num)
         
+        self.frame_pool.resize(ph)
+        try:
+            sequence.start()
+            self.image_gen.camera.set_framenum(frame_num)
+            self.image_gen.camera.acq_start()
+            for frame_idx in range(frame_num):
+                self.frame_index = frame_idx
+                with self.timer('grab'):
+                    self.img = self.frame_pool.grab(self.image_gen.camera, frame_idx)
+                    self.frame_counter += 1
+                if check is not None:
+                    self.check_frame(check, frame_idx) # saved once the whole stack is checked
+                elif self.settings['save_h5']:
+                    if not first_frame_acquired:
+                        self.create_data_file()
+                        first_frame_acquired = True
+                    self.save_frame(frame_idx, self.img)
+                if self.interrupt_measurement_called:
+                    break
+            sequence.wait_until_done()
+        finally:
+            self.image_gen.camera.acq_stop()
+            sequence.close()
+        if check is not None:
+            # the frames out of tolerance are acquired again one at a time, with software-set voltages
+            steps = [tuple(step) for step in self.sequence.waveform(2, frame_num).T.tolist()]
+            self.retake_frames(check, steps)
+        self.imgs = self.frame_pool.stack
+        
+    def frame_shape(self):
+        """ Shape of the camera frames, (rows, columns), within the sensor ROI if set """
+        if self.sensor_window is not None:
+            return self.sensor_window[3], self.sensor_window[2]
+        return (self.image_gen.settings['image_height'], self.image_gen.settings['image_width'])
+    
+    def create_frame_check(self, frame_num):
+        """
+        The FrameCheck of the next stack of frame_num frames if frame_qc is on, else None.
+        The carrier is that of the reconstructor if calibrated, else that of the calibration cache
+        """
+        self.frame_check = None
+        if not self.settings['frame_qc']:
+            return None
+        kx = ky = expected = None
+        if getattr(self, 'isCalibrated', False):
+            kx, ky = self.h.kx, self.h.ky
+        else:
+            cache = self.get_calibration_cache()
+            cached = None if cache is None else cache.get(self.calibration_params())
+            if cached is not None:
+                kx, ky = cached['kx'], cached['ky']
+        if kx is not None:
+            expected = self.expected_phases(frame_num, np.size(kx))
+        rows, cols = self.roi_slices(self.frame_shape())
+        self.frame_check = FrameCheck(frame_num, rows, cols, kx, ky,
+                                      dx = self.settings['pixelsize'] / self.settings['magnification'],
+                                      NA = self.settings['NA'],
+                                      wavelength = self.settings['wavelength'],
+                                      expected = expected,
+                                      intensity_tolerance = self.settings['qc_intensity_tolerance'],
+                                      modulation_tolerance = self.settings['qc_modulation_tolerance'],
+                                      phase_tolerance = self.settings['qc_phase_tolerance'],
+                                      min_contrast = self.settings['min_carrier_contrast'])
+        return self.frame_check
+    
+    def check_frame(self, check, frame_idx):
+        with self.timer('frame_qc'):
+            check.check(frame_idx, self.img)
+    
+    def retake_frames(self, check, steps):
+        """
+        Acquires again, one at a time, the frames of the stack out of the tolerances
+        of check, at most qc_retries times each. A frame out of tolerance again
+        by about the same deviation is not a transient, and is not acquired again.
+        Then saves the stack if save_h5, with the results of the check as
+        attributes of the image dataset
+        """
+        if check.carrier is not None and not check.carrier_found and not self.qc_carrier_warned:
+            print(f'Frame check: the carrier is not in the frames (contrast below {check.min_contrast}), '
+                  'only the intensity is checked')
+            self.qc_carrier_warned = True
+        camera = self.image_gen.camera
+        camera.set_framenum(1)
+        persistent = set()
+        for attempt in range(self.settings['qc_retries']):
+            bad = [frame_idx for frame_idx in check.bad_frames() if frame_idx not in persistent]
+            if not bad or self.interrupt_measurement_called:
+                break
+            print(f'Frame check: frames {bad} acquired again')
+            scores = check.scores()
+            for frame_idx in bad:
+                self.write_voltages(*steps[frame_idx])
+                with self.timer('settle'):
+                    time.sleep(self.settle_time())
+                self.frame_index = frame_idx
+                with self.timer('grab'):
+                    camera.acq_start()
+                    try:
+                        self.img = self.frame_pool.grab(camera, frame_idx)
+                    finally:
+                        camera.acq_stop()
+                    self.frame_counter += 1
+                check.retakes[frame_idx] += 1
+                self.check_frame(check, frame_idx)
+            persistent.update(frame_idx for frame_idx in bad if check.persistent(frame_idx, scores[frame_idx]))
+        self.settings['qc_retaken'] = int(check.retakes.sum())
+        bad = check.bad_frames()
+        if bad:
+            print(f'Frame check: frames {bad} still out of tolerance after {check.retakes[bad].tolist()} retries')
+        if self.settings['save_h5']:
+            frames = self.frame_pool.stack # the buffer may be replaced by the file (npy)
+            self.create_data_file(check.attrs())
+            for frame_idx in np.flatnonzero(np.isfinite(check.mean)):
+                self.save_frame(int(frame_idx), frames[frame_idx])
+    
+    def frame_check_attrs(self):
+        """ Results of the check of the last stack, for its dataset """
+        return {} if self.frame_check is None else self.frame_check.attrs()
+    
+    def update_voltages(self, expected, measured):             
+        """
+        Updates the voltage indicated in the table with a Newton step of the solver
+        expected : np.array (float) carriers x phases 
+        measured : np.array (float) carriers x phases 
+        """
+        voltages = self.phase_voltages()
+        rejected = self.voltage_solver.rejected
+        new_values = self.voltage_solver.step(voltages, expected, measured)
+        if self.voltage_solver.rejected > rejected:
+            print(f'Phase error above {self.voltage_solver.best_error:.4f} rad: step made again from the best voltages, '
+                  f'gain {self.voltage_solver.gain:.3g}')
+        with np.printoptions(precision=3, suppress=True):
+            print(f'Response (rad/V):\n {self.voltage_solver.response}')
+            print(f'New voltages:\n {new_values}')
+        self.set_phase_voltages(np.round(new_values, 4))
+        
+    def restore_best_voltages(self):
+        """
+        Sets the table to the voltages with the lowest phase error measured
+        by the calibration, if the last voltages measured were worse: the
+        last step, not measured, is then not trusted. After an improvement
+        the last step is kept
+        """
+        solver = self.voltage_solver
+        if solver.best_voltages is None or solver.improved:
+            return
+        self.set_phase_voltages(solver.best_voltages)
+        self.settings['phase_error'] = solver.best_error
+        print(f'Best voltages restored, phase error (rms): {solver.best_error:.4f} rad')
     
     def run(self):
         self.image_gen.read_from_hardware()
         
-        if self.settings['calibrate']:
+        if self.settings['mda']:
+            self.run_mda()
+        elif self.settings['characterize_settle']:
+            self.apply_sensor_roi()
+            try:
+                self.characterize_settle()
+            finally:
+                self.restore_sensor_roi()
+                self.ni_ao_0.stop()
+                self.ni_ao_1.stop()
+        elif self.settings['calibrate']:
             print('Calibration started')
-            for iteration in range(self.settings.iterations.val):
-                if self.interrupt_measurement_called:
-                    break
-                else:
-                    self.measure(save_data=False)
-                    self.ni_ao_0.stop()
-                    self.ni_ao_1.stop()
-                    self.cutRoi()
-                    if iteration == 0:
-                        self.setup_reconstructor()
-                    self.calibrate()
-                    expected, measured = self.find_phaseshifts()
-                    print(f'\nPhases after iteration {iteration}') 
-                    with np.printoptions(precision=3, suppress=False):
-                        print(f'Expected:\n {expected}')
-                        print(f'Measured:\n {measured}')
-                    self.update_voltages(expected,measured)
+            self.voltage_solver = VoltageSolver(initial_response = self.settings['phase_per_volt'],
+                                                gain = self.settings['solver_gain'])
+            field = self.settings['calibration_map']
+            self.calibration_map = None
+            if field:
+                self.start_map_pool() # the tiles are in frame coordinates: no sensor ROI
+            else:
+                self.apply_sensor_roi()
+            converged = False
+            try:
+                for iteration in range(self.settings.iterations.val):
+                    if self.interrupt_measurement_called:
+                        break
+                    else:
+                        t = time.perf_counter()
+                        self.measure(save_data=False)
+                        self.ni_ao_0.stop()
+                        self.ni_ao_1.stop()
+                        if field:
+                            self.calibrate_field()
+                        self.cutRoi()
+                        if iteration == 0:
+                            self.setup_reconstructor()
+                        self.calibrate()
+                        expected, measured = self.find_phaseshifts()
+                        if field:
+                            # the voltages are corrected for the whole field, not only the ROI
+                            measured = self.calibration_map.median_shifts()
+                        print(f'\nPhases after iteration {iteration}') 
+                        with np.printoptions(precision=3, suppress=False):
+                            print(f'Expected:\n {expected}')
+                            print(f'Measured:\n {measured}')
+                        error = self.voltage_solver.rms_error(expected, measured)
+                        self.settings['phase_error'] = error
+                        print(f'Phase error (rms): {error:.4f} rad')
+                        self.timer.add('iteration', time.perf_counter() - t)
+                        if error < self.settings['phase_tolerance']:
+                            print(f'Converged after {iteration+1} iteration(s)')
+                            converged = True
+                            break
+                        self.update_voltages(expected,measured)
+            finally:
+                if not converged:
+                    self.restore_best_voltages()
+                self.restore_sensor_roi()
+                self.stop_map_pool()
+            if field and self.calibration_map is not None:
+                fname = self.data_file_name('_calibration_map.npz')
+                self.calibration_map.save(fname)
+                print(f'Calibration map saved to {fname}')
             print('Calibration ended')       
                     
                        
@@ -240,28 +884,54 @@ class FlirNImeasure(Measurement):
                 self.frame_index = 0
                 self.enableROIselection()
                 """
-                If measure is not active, acquire frames indefinitely. No save in h5 is performed 
+                If measure is not active, acquire frames indefinitely. 
+                Frames are streamed to h5 only if record is active
                 """
                 self.image_gen.settings['acquisition_mode'] = 'Continuous'
+                sequence = None
+                if self.settings['cycle_phases'] or self.settings['live_sim']:
+                    sequence = self.start_phase_cycling()
+                if self.settings['live_sim'] and sequence is not None:
+                    self.start_live_reconstruction()
                 self.image_gen.camera.acq_start() 
+                reader = self.start_camera_reader()
                 while not self.interrupt_measurement_called:
                      
-                    self.img = self.image_gen.camera.get_nparray()
-                    if self.interrupt_measurement_called:
-                        break
+                    with self.timer('frame_wait'):
+                        item = reader.get()
+                    self.update_reader_stats(reader)
+                    if item is None or self.interrupt_measurement_called:
+                        continue
+                    frame_count, self.img = item
+                    self.frame_counter += 1
+                    self.update_stream(frame_count, self.img)
+                    self.update_live_stack(frame_count, self.img)
                     if self.settings['measure']:
                         """
                         If measure is activated, acquisition is interrupted a measurement is run
                         """
+                        self.stop_camera_reader()
                         self.image_gen.camera.acq_stop()
+                        self.close_stream()
+                        self.stop_live_reconstruction()
+                        self.apply_sensor_roi()
+                        if sequence is not None:
+                            sequence.close()
+                            sequence = None
                         self.measure(True)
                         break
             finally:            
                 
+                self.stop_camera_reader()
                 self.image_gen.camera.acq_stop()
-                if self.settings['save_h5'] and hasattr(self, 'h5file'):
+                if sequence is not None:
+                    sequence.close()
+                self.close_stream()
+                self.stop_live_reconstruction()
+                self.restore_sensor_roi()
+                if self.settings['save_h5'] and hasattr(self, 'frame_writer'):
                     # make sure to close the data file
-                    self.h5file.close() 
+                    self.close_data_file()
                     self.settings['save_h5'] = False
                     
                 self.ni_ao_0.stop()
@@ -269,86 +939,235 @@ class FlirNImeasure(Measurement):
         
     
     def setup_UItable(self):
-        cols = self.settings.num_phases.val
-        rows = self.settings.num_channels.val
-        self.set_UItable_row_col(rows, cols)
-        for j in range(cols):    
-            for i in range(rows):
-                self.settings.New(f'table{i,j}', dtype=float, initial=0.0)
+        """ The ui table is a view of self.sequence: edits of its cells are validated into it """
+        self.set_UItable_row_col(self.settings['num_channels'], self.settings['num_phases'])
+        self.ui.tableWidget.itemChanged.connect(self.on_UItable_edit)
+        # the view is refreshed in the gui thread, also when the voltages are set by run()
+        self.settings.voltage_sequence.add_listener(self.write_UItable)
+        self.write_UItable()
                     
     def resize_UItable(self,*args):
         cols = self.settings.num_phases.val
         rows = self.settings.num_channels.val
+        # the voltages of the steps beyond num_phases are kept
+        self.sequence.resize(rows, cols, shrink=False)
         self.set_UItable_row_col(rows, cols)
-        for j in range(cols):    
-            for i in range(rows):
-                if not hasattr(self.settings, f'table{i,j}'):
-                    self.settings.New(f'table{i,j}', dtype=float, initial=0.0)
+        self.settings['voltage_sequence'] = self.sequence.to_string()
+        self.write_UItable()
     
     def set_UItable_row_col(self, rows=2, cols=7):
         """ 
         Changes the ui table to a specified number of rows and columns
 
         """
+        if self.ui is None:
+            return
         amplitude_table = self.ui.tableWidget
         amplitude_table.setColumnCount(cols)
         amplitude_table.setRowCount(rows)
     
-    def read_from_UItable(self):
+    def on_UItable_edit(self, item):
+        """ Sets the voltage of an edited cell, restoring the cell if it is not valid """
+        i, j = item.row(), item.column()
+        try:
+            self.sequence.set_value(i, j, item.text())
+        except VoltageSequenceError as err:
+            print(f'Voltage ({i}, {j}) not set: {err}')
+            self.write_UItable()
+            return
+        self.settings['voltage_sequence'] = self.sequence.to_string()
+    
+    def on_voltage_sequence(self):
+        """ Parses the voltage_sequence setting (e.g. loaded from the ini file) into self.sequence """
+        text = self.settings['voltage_sequence']
+        if text == self.sequence.to_string():
+            return
+        try:
+            self.sequence.from_string(text)
+        except VoltageSequenceError as err:
+            print(f'voltage_sequence not set: {err}')
+            self.settings['voltage_sequence'] = self.sequence.to_string()
+            return
+        self.sequence.resize(self.settings['num_channels'], self.settings['num_phases'], shrink=False)
+        self.settings['voltage_sequence'] = self.sequence.to_string()
+    
+    def write_UItable(self, *args):
         """
-        get the values from the ui table and write them into the settings 
+        write the values of the voltage sequence into the ui table
         """
+        if self.ui is None:
+            return
         table = self.ui.tableWidget
-        rows = table.rowCount()
-        cols = table.columnCount()
-        values = [[0.0] * cols for i in range(rows)]
-        for j in range(cols):
-            for i in range(rows):
-              if table.item(i,j) is not None:
-                  # print(table.item(i,j).text())
-                  values[i][j]  = table.item(i,j).text()  
-              if hasattr(self.settings, f'table{i,j}'):
-                  self.settings[f'table{i,j}'] = values[i][j] 
-        # print(values)
-        return values  
-
-    def write_UItable(self):
+        voltages = self.sequence.waveform(table.rowCount(), table.columnCount())
+        table.blockSignals(True)
+        try:
+            for (i, j), val in np.ndenumerate(voltages):
+                text = np.format_float_positional(val, trim='-')
+                if table.item(i,j) is None:
+                    table.setItem(i,j, QTableWidgetItem(text))
+                elif table.item(i,j).text() != text:
+                    table.item(i,j).setText(text)
+        finally:
+            table.blockSignals(False)
+    
+    def phase_voltages(self, steps=None):
+        """ The voltages (num_channels x steps, num_phases by default) output by the acquisition """
+        return self.sequence.waveform(self.settings['num_channels'], steps or self.settings['num_phases'])
+    
+    def set_phase_voltages(self, voltages):
+        """ Sets the first steps of the sequence, e.g. corrected by the calibration """
+        voltages = np.asarray(voltages, dtype=float)
+        array = self.sequence.waveform(max(self.sequence.channels, voltages.shape[0]),
+                                       max(self.sequence.steps, voltages.shape[1]))
+        array[:voltages.shape[0], :voltages.shape[1]] = voltages
+        self.sequence.set(array)
+        self.settings['voltage_sequence'] = self.sequence.to_string()
+    
+    def import_sequence(self):
+        """ Loads the voltage sequence from sequence_file (.npy or .csv, one row per channel) """
+        fname = self.settings['sequence_file']
+        try:
+            self.sequence.load(fname)
+        except (OSError, ValueError) as err:
+            print(f'Voltage sequence not imported from {fname}: {err}')
+            return
+        self.sequence.resize(self.settings['num_channels'], self.settings['num_phases'], shrink=False)
+        self.settings['voltage_sequence'] = self.sequence.to_string()
+        print(f'Imported a voltage sequence of {self.sequence.channels} channels x {self.sequence.steps} steps '
+              f'(num_phases steps are acquired)')
+    
+    def export_sequence(self):
+        """ Saves the voltage sequence to sequence_file (.npy or .csv, one row per channel) """
+        fname = self.settings['sequence_file']
+        try:
+            self.sequence.save(fname)
+        except OSError as err:
+            print(f'Voltage sequence not exported to {fname}: {err}')
+            return
+        print(f'Voltage sequence saved to {fname}')
+                      
+    def reconstructor_params(self):
         """
-        write the values into the table from the settings
+        Attributes of the HexSimProcessor, also sent to the live reconstruction process
         """
-        table = self.ui.tableWidget
-        rows = table.rowCount()
-        cols = table.columnCount()
-        for j in range(cols): 
-            for i in range(rows):
-                  # print(table.item(i,j).text())
-                  if hasattr(self.settings, f'table{i,j}'):
-                      val = self.settings[f'table{i,j}']
-                      table.setItem(i,j, QTableWidgetItem(str(val)))              
-                      
+        return reconstructor_params(self.settings)
+    
     def setup_reconstructor(self):
-        self.h = HexSimProcessor()  # create reconstruction object 
-        self.h.debug = False
-        self.h.cleanup = True
-        self.h.axial = False
-        self.h.usemodulation = True
-        self.h.magnification = self.settings['magnification']
-        self.h.NA = self.settings['NA']
-        self.h.n = self.settings['n']
-        self.h.wavelength = self.settings['wavelength']
-        self.h.pixelsize = self.settings['pixelsize']
-        self.h.alpha = self.settings['alpha']
-        self.h.beta = self.settings['beta']
-        self.h.w = self.settings['w']
-        self.h.eta = self.settings['eta']
+        self.h = create_reconstructor(self.reconstructor_params())  # create reconstruction object 
+        self.isCalibrated = False
         
     def calibrate(self):
-        isFindCarrier =True
-        if self.settings['gpu']:
-            self.h.calibrate_cupy(self.imageRaw, isFindCarrier)       
+        """
+        Calibrates the reconstructor on imageRaw. The carrier search is skipped if
+        the calibration map has a tile close to the ROI, if find_carrier is off and
+        the calibration cache has an entry for the same optics and ROI whose carrier
+        is in the frames, or if find_carrier is off and the carrier was found in a
+        previous iteration. A carrier found or refined here (not taken from the map)
+        replaces the cached one
+        """
+        params = self.calibration_params()
+        cache = self.get_calibration_cache()
+        use_map = self.calibration_map is not None and self.settings['calibration_map']
+        cached = None
+        if cache is not None and not use_map and not self.settings['find_carrier']:
+            cached = cache.get(params)
+            if cached is not None and not self.carrier_in_frames(self.imageRaw, cached['kx'], cached['ky']):
+                print(f"Cached carrier kx {cached['kx']}, ky {cached['ky']} not found in the frames: "
+                      'removed from the cache, the carrier is searched')
+                cache.invalidate(params)
+                cached = None
+                self.isCalibrated = False
+        if use_map:
+            # carrier of the tile closest to the ROI, found on the same frames
+            tile = self.calibration_map.calibration(self.settings['roiX'], self.settings['roiY'])
+            self.h.kx = tile['kx']
+            self.h.ky = tile['ky']
+            isFindCarrier = False
+            self.settings['calibration_source'] = 'map'
+        elif cached is not None:
+            self.h.kx = cached['kx']
+            self.h.ky = cached['ky']
+            isFindCarrier = False
+            self.settings['calibration_source'] = 'cached'
         else:
-            self.h.calibrate(self.imageRaw, isFindCarrier)          
+            isFindCarrier = self.settings['find_carrier'] or not self.isCalibrated
+            self.settings['calibration_source'] = 'searched' if isFindCarrier else 'refined'
+        with self.timer('calibrate'):
+            imageRaw = self.imageRaw.astype(np.float32) # the frames are in the camera dtype
+            if self.settings['gpu']:
+                self.h.calibrate_cupy(imageRaw, isFindCarrier)       
+            else:
+                fft = self.get_fft()
+                with fft.installed(reconstructor_module(self.h)):
+                    self.h.calibrate(imageRaw, isFindCarrier)
+                fft.single_precision(self.h)
         self.isCalibrated = True
+        if cache is not None and not use_map:
+            # the carrier of a tile is not the calibration of this ROI: it is not cached
+            if self.carrier_in_frames(self.imageRaw, self.h.kx, self.h.ky):
+                cache.put(params, {name: getattr(self.h, name, None) for name in CALIBRATION_ATTRS})
+            else:
+                print(f'Carrier contrast below {self.settings["min_carrier_contrast"]}: calibration not cached')
+        print(f"Calibration ({self.settings['calibration_source']} carrier): kx {self.h.kx}, ky {self.h.ky}")
+    
+    def carrier_in_frames(self, stack, kx, ky):
+        """ True if all the carriers have at least min_carrier_contrast in the ROI of stack """
+        dx = self.settings['pixelsize'] / self.settings['magnification']
+        contrast = carrier_contrast(stack, kx, ky, dx, self.settings['NA'], self.settings['wavelength'])
+        return bool(np.min(contrast) >= self.settings['min_carrier_contrast'])
+    
+    def get_fft(self):
+        """ The FFTBackend of the settings, numpy if the back-end is not installed """
+        if self.fft is None:
+            name = self.settings['fft_backend']
+            try:
+                self.fft = FFTBackend(name, self.settings['fft_workers'], self.settings['fft_wisdom'])
+            except ImportError as err:
+                print(f'{name} FFTs not available ({err}): numpy is used')
+                self.fft = FFTBackend()
+        return self.fft
+    
+    def fft_args(self, workers=None):
+        """ Arguments of the FFTBackend for a worker process, with workers threads. None for numpy """
+        fft = self.get_fft()
+        if fft.name == 'numpy':
+            return None
+        return (fft.name, workers or fft.workers, fft.wisdom)
+    
+    def reset_fft(self):
+        if self.fft is not None:
+            self.fft.save_wisdom()
+        self.fft = None
+    
+    def calibration_params(self):
+        """
+        Parameters identifying a calibration: optics and ROI (position and size) 
+        """
+        params = {key: self.settings[key] for key in RECONSTRUCTOR_SETTINGS}
+        ROIsize = self.settings['ROI_size']
+        if getattr(self, 'imgs', None) is not None:
+            rows, cols = self.roi_slices(self.imgs.shape)
+            offset_x, offset_y = (0, 0) if self.sensor_window is None else self.sensor_window[:2]
+            params['roi'] = [rows.start + offset_y, cols.start + offset_x, ROIsize]
+        else:
+            params['roi'] = [self.settings['roiX']-ROIsize//2, self.settings['roiY']-ROIsize//2, ROIsize]
+        return params
+    
+    def get_calibration_cache(self):
+        if not self.settings['calibration_cache']:
+            return None
+        return CalibrationCache(self.settings['calibration_cache_dir'],
+                                max_entries = self.settings['calibration_cache_size'])
+    
+    def invalidate_calibration(self):
+        """
+        Removes the cached calibration of the current optics and ROI,
+        so that the next calibration searches the carrier
+        """
+        cache = CalibrationCache(self.settings['calibration_cache_dir'])
+        removed = cache.invalidate(self.calibration_params())
+        self.isCalibrated = False
+        print(f'Calibration cache: {removed} entry removed, {len(cache)} left')
         
         
     def enableROIselection(self):
@@ -367,7 +1186,7 @@ class FlirNImeasure(Measurement):
                 
             if self.settings['selectROI'] and (Lx,Ly)!=(ROIsize,ROIsize):
                 event.accept()  
-                pos = event.pos()
+                pos = self.imv.getImageItem().mapToParent(event.pos()) # the displayed image may be decimated
                 x = int(pos.x()) #pyqtgraph is transposed
                 y = int(pos.y())
                 x = max(min(x, Lx-ROIsize//2 ),ROIsize//2 )
@@ -385,48 +1204,98 @@ class FlirNImeasure(Measurement):
         self.settings['selectROI'] = True
                                  
                       
+    def roi_slices(self, shape):
+        """
+        Returns the (row, column) slices of the ROI, kept inside an image of the given shape 
+        """
+        return roi_slices(shape, self.settings['roiX'], self.settings['roiY'], self.settings['ROI_size'])
+    
     def cutRoi(self):        
-        Ly =self.imgs.shape[-1]
-        Lx =self.imgs.shape[-2]
-        x = self.settings['roiX']
-        y = self.settings['roiY']
-        ROIsize = self.settings['ROI_size']
-        x = max(min(x, Lx-ROIsize//2 ),ROIsize//2 )
-        y = max(min(y, Ly-ROIsize//2 ),ROIsize//2 )
-        xmin = x - ROIsize//2
-        ymin = y - ROIsize//2
-        self.imageRaw = self.imgs [:,xmin:xmin+ROIsize, ymin:ymin+ROIsize]
+        rows, cols = self.roi_slices(self.imgs.shape)
+        with self.timer('cut_roi'):
+            self.imageRaw = self.imgs [:, rows, cols]
         
         self.settings['selectROI'] = False
         print(f'ROI set to shape: {self.imageRaw.shape}')   
 
 
     def find_phaseshifts(self):
-        phaseshift = np.zeros((3,7))
-        expected_phase = np.zeros((3,7))
+        """
+        Measures the phase shifts of all the carriers in all the frames of imageRaw.
+        Returns expected and measured phase shifts, carriers x phases 
+        """
+        num_phases = self.imageRaw.shape[0]
+        kx = np.ravel(self.h.kx)
+        ky = np.ravel(self.h.ky)
+        expected_phase = self.expected_phases(num_phases, len(kx))
     
-        for i in range (2):
-            phase, _ = self.h.find_phase(self.h.kx[i],self.h.ky[i],self.imageRaw)
-            expected_phase[i,:] = np.arange(7) * 2*(i+1) * np.pi / 7
-            phaseshift[i,:] = np.unwrap(phase - expected_phase[i,:]) + expected_phase[i,:] - phase[0]
+        with self.timer('find_phaseshifts'):
+            dx = self.settings['pixelsize'] / self.settings['magnification']
+            phase, _ampl = carrier_phases(self.imageRaw, kx, ky, dx,
+                                          self.settings['NA'], self.settings['wavelength'])
+            phaseshift = phase_steps(phase, expected_phase)
     
-        #phaseshift[3] = phaseshift[2]-phaseshift[1]-phaseshift[0]
         return expected_phase, phaseshift
             
+    def expected_phases(self, num_phases, carriers):
+        """ Phase shifts of the carriers for the ideal voltages, carriers x phases """
+        steps = np.resize(self.carrier_phase_steps, carriers)
+        return np.outer(steps, np.arange(num_phases)) * 2*np.pi / num_phases
+    
+    def start_map_pool(self):
+        """ Starts the worker processes of the calibration map, each with its reconstructor """
+        dx = self.settings['pixelsize'] / self.settings['magnification']
+        self.map_pool = ProcessPoolExecutor(max_workers = self.settings['map_workers'],
+                                            mp_context = multiprocessing.get_context('spawn'),
+                                            initializer = init_map_worker,
+                                            initargs = (self.reconstructor_params(), dx,
+                                                        self.settings['NA'], self.settings['wavelength'],
+                                                        self.fft_args(max(self.settings['fft_workers'] // self.settings['map_workers'], 1))))
+    
+    def stop_map_pool(self):
+        pool = getattr(self, 'map_pool', None)
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+            self.map_pool = None
+    
+    def calibrate_field(self):
+        """
+        Calibrates all the tiles of the acquired stack on the map pool. The
+        carriers of the previous map are refined, unless find_carrier is on
+        """
+        previous = self.calibration_map
+        expected = self.expected_phases(self.imgs.shape[0], len(self.carrier_phase_steps))
+        with self.timer('calibration_map'):
+            self.calibration_map = calibrate_map(self.map_pool, self.imgs, self.settings['ROI_size'], expected,
+                                                 find_carrier = self.settings['find_carrier'] or previous is None,
+                                                 previous = previous)
+        field = self.calibration_map
+        self.settings['map_phase_error'] = float(field.phase_error.max())
+        with np.printoptions(precision=3, suppress=True):
+            print(f'Calibration map, {field.grid[0]}x{field.grid[1]} tiles of {field.size} px:')
+            print(f'Carrier frequency (NA/wavelength):\n {field.carrier_frequency}')
+            print(f'Modulation:\n {field.modulation}')
+            print(f'Phase error (rad rms):\n {field.phase_error}')
+    
     def clear_UItable(self):
         """
-        sets all the values of the table to 0
+        sets all the values of the voltage sequence to 0
         
         """
-        table = self.ui.tableWidget
-        table.clearContents()
+        self.set_phase_voltages(np.zeros_like(self.sequence.array))
         
     def create_saving_directory(self):
         
         if not os.path.isdir(self.app.settings['save_dir']):
             os.makedirs(self.app.settings['save_dir'])
          
-    def create_h5_file(self):                   
+    def data_file_name(self, extension, part=None):
+        """
+        Name of a new data file in save_dir, with timestamp and sample.
+        part is appended to the name of the files of a rotated stream.
+        The file does not exist yet: a counter is appended to the name of
+        the files created in the same second
+        """
         self.create_saving_directory()
         # file name creation
         timestamp = time.strftime("%y%m%d_%H%M%S", time.localtime())
@@ -436,18 +1305,283 @@ class FlirNImeasure(Measurement):
             sample_name = '_'.join([timestamp, self.name])
         else:
             sample_name = '_'.join([timestamp, sample, self.name])
-        fname = os.path.join(self.app.settings['save_dir'], sample_name + '.h5')
-        
-        self.h5file = h5_io.h5_base_file(app=self.app, measurement=self, fname = fname)
-        self.h5_group = h5_io.h5_create_measurement_group(measurement=self, h5group=self.h5file)
+        if part is not None:
+            sample_name += f'_{part:03d}'
+        base = os.path.join(self.app.settings['save_dir'], sample_name)
+        fname = base + extension
+        count = 1
+        while os.path.exists(fname):
+            fname = f'{base}_{count}{extension}'
+            count += 1
+        return fname
+         
+    def open_h5_file(self, part=None):
+        """
+        Creates a new h5 file in save_dir, with the ScopeFoundry settings.
+        Returns the file and the measurement group
+        """
+        fname = self.data_file_name('.h5', part)
+        h5py.File(fname, 'w-').close() # h5_base_file opens in append mode: never an existing file
+        h5file = h5_io.h5_base_file(app=self.app, measurement=self, fname = fname)
+        h5_group = h5_io.h5_create_measurement_group(measurement=self, h5group=h5file)
+        return h5file, h5_group
+         
+    def create_data_file(self, attrs=None):
+        """
+        Creates the file of the measured stack with the storage back-end and
+        starts its frame_writer. Called after the first frame, to know its shape.
+        attrs are added to the image_attrs of the dataset
+        """
+        storage = self.settings['storage']
+        attrs = dict(self.image_attrs(), **(attrs or {}))
+        if storage == 'h5':
+            self.create_h5_file(attrs)
+            self.data_file = self.h5file.filename
+            return
+        shape = [self.image_gen.frame_num.val, *self.img.shape]
+        metadata = settings_metadata(self.app, self)
+        if storage == 'npy':
+            self.data_file = self.data_file_name('.npy')
+            self.frame_writer = NpyFrameWriter(self.data_file, shape, self.img.dtype,
+                                               attrs = attrs,
+                                               metadata = metadata)
+            if self.frame_pool.buffer is not None and self.frame_pool.buffer.shape == self.frame_writer.array.shape:
+                self.frame_pool.attach(self.frame_writer.array) # the next frames are grabbed in the file
+        else:
+            self.data_file = self.data_file_name('.zarr')
+            array = open_zarr(self.data_file, shape, self.img.dtype,
+                              attrs = attrs,
+                              metadata = metadata,
+                              level = self.settings['compression_level'])
+            self.frame_writer = ZarrFrameWriter(array,
+                                                queue_size = self.settings['writer_queue_size'],
+                                                timer = self.timer)
+            self.frame_writer.start()
+         
+    def create_h5_file(self, attrs=None):                   
+        self.h5file, self.h5_group = self.open_h5_file()
         
         img_size = self.img.shape
         dtype=self.img.dtype
         
         length = self.image_gen.frame_num.val
+        encoder = self.create_encoder()
+        options = {} if encoder is None else encoder.dataset_options()
         self.image_h5 = self.h5_group.create_dataset(name  = 't0000/c0/image', 
                                                   shape = [length, img_size[0], img_size[1]],
-                                                  dtype = dtype)
+                                                  dtype = dtype,
+                                                  chunks = (1, img_size[0], img_size[1]),
+                                                  **options)
+        
+        for key, val in (attrs or self.image_attrs()).items():
+            self.image_h5.attrs[key] = val
         
+        self.frame_writer = H5FrameWriter(self.image_h5, self.h5file,
+                                          queue_size = self.settings['writer_queue_size'],
+                                          flush_policy = self.settings['flush_policy'],
+                                          flush_every = self.settings['flush_every'],
+                                          flush_interval = self.settings['flush_interval'],
+                                          timer = self.timer,
+                                          encoder = encoder)
+        self.frame_writer.start()
+    
+    def image_attrs(self):
+        """
+        Attributes of the image datasets: sampling and offset of the frames on the sensor
+        """
         xy_sampling = self.settings['pixelsize'] / self.settings['magnification']
-        self.image_h5.attrs['element_size_um'] =  [1.0,xy_sampling,xy_sampling]
\ No newline at end of file
+        offset_x, offset_y = (0, 0) if self.sensor_window is None else self.sensor_window[:2]
+        return {'element_size_um': [1.0,xy_sampling,xy_sampling],
+                'sensor_offset_x': offset_x,
+                'sensor_offset_y': offset_y}
+    
+    def create_encoder(self):
+        return create_encoder(self.settings['compression'],
+                              level = self.settings['compression_level'],
+                              workers = self.settings['compression_workers'])
+        
+    def update_stream(self, frame_count, img):
+        """
+        Streams the frames of the continuous acquisition to h5 while record is active.
+        A recording starts at the beginning of a phase cycle.
+        """
+        cycle_length = self.settings['num_phases']
+        if self.settings['record']:
+            if not hasattr(self, 'stream_writer'):
+                if frame_count % cycle_length != 0:
+                    return
+                self.stream_writer = H5StreamWriter(self.open_h5_file,
+                                                    attrs = self.image_attrs(),
+                                                    layout = self.settings['record_layout'],
+                                                    cycle_length = cycle_length,
+                                                    rotate_size = self.settings['rotate_size'],
+                                                    rotate_time = self.settings['rotate_time'],
+                                                    queue_size = self.settings['writer_queue_size'],
+                                                    flush_policy = self.settings['flush_policy'],
+                                                    flush_every = self.settings['flush_every'],
+                                                    flush_interval = self.settings['flush_interval'],
+                                                    timer = self.timer,
+                                                    encoder = self.create_encoder())
+                self.stream_writer.start()
+                self.stream_start = frame_count
+            with self.timer('h5_queue'):
+                self.stream_writer.put(frame_count - self.stream_start, img)
+            self.settings['writer_queue_depth'] = self.stream_writer.depth
+            self.settings['writer_blocked_time'] = self.stream_writer.blocked_time * 1e3
+        elif hasattr(self, 'stream_writer'):
+            self.close_stream()
+    
+    def close_stream(self):
+        if hasattr(self, 'stream_writer'):
+            writer = self.stream_writer
+            del self.stream_writer
+            writer.close()
+            self.settings['writer_queue_depth'] = 0
+            print(f'Recorded {writer.written} frames in {len(writer.files)} file(s), '
+                  f'blocked {writer.blocked_count} times ({writer.blocked_time*1e3:.1f} ms)')
+    
+    def start_phase_cycling(self):
+        """
+        Outputs the voltage table repeatedly, one phase per camera frame, 
+        with the hardware-timed sequence clocked by the camera strobe
+        """
+        if not self.settings['hw_timed']:
+            print('cycle_phases and live_sim require hw_timed: the AO table is not cycled')
+            return None
+        voltages = self.phase_voltages()
+        sequence = self.load_ao_sequence(voltages, continuous=True)
+        sequence.start()
+        return sequence
+    
+    def apply_sensor_roi(self):
+        """
+        If sensor_roi is active, the camera reads out only the ROI_size square 
+        around roiX, roiY, instead of the full frame 
+        """
+        if not self.settings['sensor_roi']:
+            return
+        shape = (self.image_gen.settings['image_height'], self.image_gen.settings['image_width'])
+        rows, cols = self.roi_slices(shape)
+        size = self.settings['ROI_size']
+        try:
+            self.sensor_window = set_sensor_roi(self.image_gen.camera, cols.start, rows.start, size, size)
+        except SensorROIError as err:
+            print(f'{err}: the full frame is read out')
+            return
+        self.image_gen.read_from_hardware()
+        print(f'Sensor ROI (offset_x, offset_y, width, height): {self.sensor_window}')
+    
+    def restore_sensor_roi(self):
+        if self.sensor_window is not None:
+            reset_sensor_roi(self.image_gen.camera)
+            self.sensor_window = None
+            self.image_gen.read_from_hardware()
+    
+    def start_camera_reader(self):
+        """
+        Starts the thread that reads the frames of the continuous acquisition
+        """
+        period = 1.0 / self.image_gen.settings['frame_rate']
+        self.camera_reader = CameraReader(self.image_gen.camera,
+                                          queue_size = self.settings['reader_queue_size'],
+                                          late_time = period,
+                                          timer = self.timer)
+        self.camera_reader.start()
+        return self.camera_reader
+    
+    def update_reader_stats(self, reader):
+        self.settings['frames_dropped'] = reader.dropped
+        self.settings['frames_late'] = reader.late
+        self.settings['camera_dropped'] = reader.camera_dropped
+    
+    def stop_camera_reader(self):
+        if hasattr(self, 'camera_reader'):
+            reader = self.camera_reader
+            del self.camera_reader
+            reader.stop()
+            self.update_reader_stats(reader)
+            print(f'Camera reader: {reader.read} frames read, {reader.dropped} dropped, {reader.late} late, '
+                  f'{reader.camera_dropped} dropped by the camera')
+    
+    def start_live_reconstruction(self):
+        """
+        Starts the worker process that reconstructs the ROI of each phase cycle.
+        The carrier of the last calibration is used, if available
+        """
+        kx = ky = None
+        if hasattr(self, 'h') and getattr(self.h, 'kx', None) is not None:
+            kx, ky = self.h.kx, self.h.ky
+        live = LiveReconstructor(self.reconstructor_params(), kx, ky, fft=self.fft_args())
+        live.start()
+        self.live_stack = None
+        self.live_next = 0
+        self.live_reconstructor = live
+    
+    def update_live_stack(self, frame_count, img):
+        """
+        Copies the ROI of the frame in the stack of the current phase cycle and 
+        sends the stack to the reconstruction process when it is complete.
+        A new stack is allocated for each cycle, since the process may still be reading the previous one
+        """
+        if not hasattr(self, 'live_reconstructor'):
+            return
+        num_phases = self.settings['num_phases']
+        phase = frame_count % num_phases
+        rows, cols = self.roi_slices(img.shape)
+        roi = img[rows, cols]
+        if phase == 0:
+            self.live_stack = np.empty((num_phases, *roi.shape), dtype=img.dtype)
+        elif frame_count != self.live_next:
+            self.live_stack = None # a frame was dropped
+        self.live_next = frame_count + 1
+        if self.live_stack is None or self.live_stack.shape[1:] != roi.shape:
+            self.live_stack = None # the ROI changed during the cycle
+            return
+        self.live_stack[phase] = roi
+        if phase == num_phases-1:
+            self.live_reconstructor.submit(frame_count // num_phases, self.live_stack)
+            self.live_stack = None
+    
+    def stop_live_reconstruction(self):
+        if hasattr(self, 'live_reconstructor'):
+            live = self.live_reconstructor
+            del self.live_reconstructor
+            live.stop()
+            print(f'Live reconstruction: {live.reconstructed} of {live.submitted} stacks shown, '
+                  f'{live.dropped} dropped, {live.failed} failed')
+    
+    def load_ao_sequence(self, voltages, continuous=False):
+        """
+        Prepares the hardware-timed sequence for the voltages (channels x phases),
+        see ao_sequence.load_phase_sequence
+        """
+        self.ao_voltages = None # the sequence changes the voltages
+        return load_phase_sequence([self.ni_ao_0, self.ni_ao_1], voltages, continuous=continuous)
+    
+    def save_frame(self, frame_idx, img):
+        """
+        Queues the frame to the writer thread (copies it in the memory map for npy)
+        """
+        with self.timer('h5_queue'):
+            self.frame_writer.put(frame_idx, img)
+        self.settings['writer_queue_depth'] = self.frame_writer.depth
+        self.settings['writer_blocked_time'] = self.frame_writer.blocked_time * 1e3
+        
+    def close_data_file(self):
+        """
+        Waits for the writer to empty its queue, then closes the data file
+        """
+        try:
+            if hasattr(self, 'frame_writer'):
+                writer = self.frame_writer
+                del self.frame_writer
+                writer.close()
+                self.settings['writer_queue_depth'] = 0
+                print(f'{self.settings["storage"]} writer: {writer.written} frames, max queue depth {writer.max_depth}, '
+                      f'blocked {writer.blocked_count} times ({writer.blocked_time*1e3:.1f} ms)')
+        finally:
+            # the stack stays readable in self.imgs, but is not overwritten by the next measure
+            self.frame_pool.detach()
+            if hasattr(self, 'h5file'):
+                self.h5file.close()
+                del self.h5file
\ No newline at end of file
@@ -12,6 +12,7 @@ import numpy as np
 import os, time
 #from PyQt5.QtWidgets import QTableWidgetItem
 from qtpy.QtWidgets import QTableWidgetItem
+from HexSIM_Microscope.ao_sequence import load_phase_sequence
 
 
 class FlirNImeasure(Measurement):
@@ -44,6 +45,7 @@ class FlirNImeasure(Measurement):
         self.settings.New('level_max', dtype=int, initial=4000)
         
         self.settings.New('delay', dtype=float, initial = 0.0 , unit = 's')
+        self.settings.New('hw_timed', dtype=bool, initial=False) # AO table clocked by the camera strobe
         
         self.image_gen = self.app.hardware['FLIRhw']
         
@@ -118,6 +120,9 @@ class FlirNImeasure(Measurement):
             
     
     def measure(self):
+        if self.settings['hw_timed']:
+            self.measure_hw_timed()
+            return
         self.image_gen.settings['acquisition_mode'] = 'MultiFrame'
         self.settings['save_h5'] = True
         self.image_gen.settings['frame_num'] = self.settings['num_phases']
@@ -153,6 +158,41 @@ class FlirNImeasure(Measurement):
             time.sleep(self.settings['delay'])
         self.image_gen.camera.acq_stop()  
     
+    def measure_hw_timed(self):
+        """
+        Acquires the phases with the camera running in MultiFrame mode and the
+        voltage table output as a buffered AO waveform, advanced by the 
+        camera strobe connected to the trigger_source of the AO hardware.
+        """
+        self.image_gen.settings['acquisition_mode'] = 'MultiFrame'
+        self.settings['save_h5'] = True
+        self.image_gen.settings['frame_num'] = self.settings['num_phases']
+        
+        voltages = np.array(self.read_from_UItable(), dtype=float)
+        first_frame_acquired = False
+        frame_num  = self.image_gen.frame_num.val
+        
+        sequence = load_phase_sequence([self.ni_ao_0, self.ni_ao_1], voltages[:,:frame_num])
+        try:
+            sequence.start()
+            self.image_gen.camera.set_framenum(frame_num)
+            self.image_gen.camera.acq_start()
+            for frame_idx in range(frame_num):
+                self.frame_index = frame_idx
+                self.img = self.image_gen.camera.get_nparray()
+                if self.settings['save_h5']:
+                    if not first_frame_acquired:
+                        self.create_h5_file()
+                        first_frame_acquired = True
+                    self.image_h5[frame_idx,:,:] = self.img
+                    self.h5file.flush()
+                if self.interrupt_measurement_called:
+                    break
+            sequence.wait_until_done()
+        finally:
+            self.image_gen.camera.acq_stop()
+            sequence.close()
+    
     def run(self):
         self.image_gen.read_from_hardware()
         
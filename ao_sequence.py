@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Hardware-timed, buffered analog output of the phase voltage table.
+The whole table is uploaded once to a single NI-DAQmx task driving both
+AO channels; each sample is clocked by the camera exposure strobe wired to
+the trigger_source of the NI_AO_hw settings (e.g. /Dev1/PFI0).
+"""
+import numpy as np
+
+
+class NIAOSequence():
+    """
+    Two (or more) channel AO waveform, advanced by an external sample clock.
+
+    The strobe edge that clocks the samples marks the end of an exposure,
+    so the voltages for frame k+1 are output while frame k is read out.
+    For this reason the buffer is the table rotated by one step: the first
+    column must already be on the outputs when the sequence is started
+    (see load_phase_sequence).
+    """
+
+    max_rate = 1000.0 # Hz, upper bound for the strobe rate, used by DAQmx to size the timing engine
+
+    def __init__(self, channels, trigger_source, trigger_edge='falling',
+                 continuous=False, vmin=-10.0, vmax=10.0):
+        self.channels = list(channels)
+        self.trigger_source = trigger_source
+        self.trigger_edge = trigger_edge
+        self.continuous = continuous
+        self.vmin = vmin
+        self.vmax = vmax
+        self.task = None
+
+    def load(self, voltages):
+        """
+        voltages : np.array (float) channels x steps, in the order they have
+        to be output at each strobe edge.
+        """
+        # NI-DAQmx is imported here, so that simulated hardware runs without the NI drivers
+        import nidaqmx
+        from nidaqmx.constants import AcquisitionType, Edge, RegenerationMode
+        from nidaqmx.stream_writers import AnalogMultiChannelWriter
+        
+        data = np.ascontiguousarray(voltages, dtype=np.float64)
+        if data.ndim != 2 or data.shape[0] != len(self.channels):
+            raise ValueError(f'Expected a {len(self.channels)} x steps voltage table, got shape {data.shape}')
+        if data.min() < self.vmin or data.max() > self.vmax:
+            raise ValueError(f'Voltages out of the AO range [{self.vmin}, {self.vmax}] V')
+        self.close()
+        self.task = nidaqmx.Task()
+        for channel in self.channels:
+            self.task.ao_channels.add_ao_voltage_chan(channel,
+                                                      min_val=self.vmin,
+                                                      max_val=self.vmax)
+        if self.trigger_edge == 'rising':
+            edge = Edge.RISING
+        else:
+            edge = Edge.FALLING
+        if self.continuous:
+            sample_mode = AcquisitionType.CONTINUOUS
+            self.task.out_stream.regen_mode = RegenerationMode.ALLOW_REGENERATION
+        else:
+            sample_mode = AcquisitionType.FINITE
+        self.task.timing.cfg_samp_clk_timing(rate=self.max_rate,
+                                             source=self.trigger_source,
+                                             active_edge=edge,
+                                             sample_mode=sample_mode,
+                                             samps_per_chan=data.shape[1])
+        writer = AnalogMultiChannelWriter(self.task.out_stream, auto_start=False)
+        writer.write_many_sample(data)
+
+    def start(self):
+        self.task.start()
+
+    def wait_until_done(self, timeout=10.0):
+        if self.task is not None and not self.continuous:
+            self.task.wait_until_done(timeout=timeout)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.stop()
+
+    def close(self):
+        if self.task is not None:
+            self.task.close()
+            self.task = None
+
+
+def create_ao_sequence(ao_hws, continuous=False):
+    """
+    Builds the hardware-timed sequence for the NI_AO_hw components in ao_hws
+    (one channel each), using the trigger settings of the first one.
+    Simulated AO hardware provides its own sequence through create_sequence.
+    """
+    if hasattr(ao_hws[0], 'create_sequence'):
+        return ao_hws[0].create_sequence(ao_hws, continuous=continuous)
+    channels = [hw.settings['channel'] for hw in ao_hws]
+    return NIAOSequence(channels,
+                        trigger_source = ao_hws[0].settings['trigger_source'],
+                        trigger_edge = ao_hws[0].settings['trigger_edge'],
+                        continuous = continuous)
+
+
+def load_phase_sequence(ao_hws, voltages, continuous=False):
+    """
+    Prepares the hardware-timed sequence of the voltages (channels x phases)
+    on the NI_AO_hw components in ao_hws, one channel each.
+    The first phase is set as a constant voltage, then the channels are
+    released to the sequence, which outputs the following phases at each strobe.
+    """
+    for hw, voltage in zip(ao_hws, voltages[:,0]):
+        hw.AO_device.write_constant_voltage(voltage)
+    for hw in ao_hws:
+        hw.stop()
+    sequence = create_ao_sequence(ao_hws, continuous=continuous)
+    sequence.load(np.roll(voltages, -1, axis=1))
+    return sequence
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Batch SIM reconstruction of the h5 files written by FLIR_NI_measurement.
+Every t*/c*/image dataset is split in stacks of num_phases frames, which are
+reconstructed by a pool of worker processes, each reading its stacks from
+the file. The results go to <name>_sim.h5 next to each input, in a
+t*/c*/sim dataset (stacks x 2N x 2N) for each image dataset.
+
+The carrier is found once for the whole batch, on the first stack, and saved
+to batch_calibration.npz in the folder (or taken from --calibration, e.g. a
+file of the calibration cache). The batch is resumable: completed files are
+skipped and the stacks already reconstructed in a partial file are not
+reconstructed again. The FFTs of the reconstructor use --fft_backend (see
+fft_backend), with the cores shared among the workers.
+
+Run from the folder containing HexSIM_Microscope:
+    python -m HexSIM_Microscope.batch_reconstruct D:/data/210507 --workers 8 --fft_backend scipy
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import h5py
+import numpy as np
+
+from HexSIM_Microscope.reconstruction import reconstructor_params, create_reconstructor, reconstructor_module, roi_slices
+from HexSIM_Microscope.fft_backend import FFTBackend, FFT_BACKENDS
+
+
+MEASUREMENT = 'FLIR_NI_measurement'
+SUFFIX = '_sim'
+
+
+def find_inputs(folder):
+    """ The h5 files of the measurement in folder, without the reconstructions """
+    files = glob.glob(os.path.join(folder, f'*{MEASUREMENT}*.h5'))
+    return sorted(f for f in files if not f.endswith(SUFFIX + '.h5'))
+
+
+def output_name(fname):
+    return os.path.splitext(fname)[0] + SUFFIX + '.h5'
+
+
+def image_datasets(h5file):
+    """ Names of the t*/c*/image datasets, in acquisition order """
+    names = []
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and re.search(r'(^|/)c\d+/image$', name):
+            names.append(name)
+    h5file.visititems(visit)
+    return sorted(names)
+
+
+def read_settings(h5file):
+    """ Settings of the measurement stored in the file by ScopeFoundry """
+    return dict(h5file[f'measurement/{MEASUREMENT}/settings'].attrs)
+
+
+def stack_count(dataset, num_phases):
+    frames = int(dataset.attrs.get('num_frames', dataset.shape[0]))
+    return frames // num_phases
+
+
+class Job():
+    """
+    Reads the stacks of the files, in the worker processes.
+    Only the file being read is kept open: the files are processed one after
+    the other, so the handles and chunk caches do not grow with the batch
+    """
+
+    def __init__(self, num_phases, roi):
+        self.num_phases = num_phases
+        self.roi = roi # (x, y, size), in sensor coordinates
+        self.fname = None
+        self.h5file = None
+
+    def open(self, fname):
+        """ The h5 file fname, the previous file is closed """
+        if fname != self.fname:
+            self.close()
+            self.h5file = h5py.File(fname, 'r')
+            self.fname = fname
+        return self.h5file
+
+    def close(self):
+        if self.h5file is not None:
+            self.h5file.close()
+        self.fname = None
+        self.h5file = None
+
+    def read(self, fname, dname, index):
+        dataset = self.open(fname)[dname]
+        x, y, size = self.roi
+        x -= int(dataset.attrs.get('sensor_offset_y', 0))
+        y -= int(dataset.attrs.get('sensor_offset_x', 0))
+        rows, cols = roi_slices(dataset.shape, x, y, size)
+        start = index * self.num_phases
+        return dataset[start:start+self.num_phases, rows, cols].astype(np.float32)
+
+
+_worker = {} # state of each worker process
+
+
+def init_worker(params, num_phases, roi, calibration, calibration_stack, fft=None):
+    from HexSIM_Microscope.h5_compression import load_blosc
+    load_blosc() # to read compressed files
+    h = create_reconstructor(params)
+    backend = FFTBackend(*(fft or ()))
+    backend.install(reconstructor_module(h))
+    h.kx = calibration['kx']
+    h.ky = calibration['ky']
+    h.calibrate(calibration_stack, False)
+    backend.single_precision(h)
+    _worker['h'] = h
+    _worker['job'] = Job(num_phases, roi)
+
+
+def reconstruct(fname, dname, index):
+    stack = _worker['job'].read(fname, dname, index)
+    return np.asarray(_worker['h'].reconstruct_rfftw(stack), dtype=np.float32)
+
+
+def calibrate(params, stack, fname, fft=None):
+    """ Finds the carrier on stack and saves the calibration to fname """
+    h = create_reconstructor(params)
+    with FFTBackend(*(fft or ())).installed(reconstructor_module(h)):
+        h.calibrate(stack, True)
+    calibration = {name: np.asarray(getattr(h, name)) for name in ['kx', 'ky', 'p', 'ampl']
+                   if getattr(h, name, None) is not None}
+    np.savez(fname, **calibration)
+    return calibration
+
+
+def load_calibration(fname):
+    with np.load(fname) as data:
+        return {name: data[name] for name in data.files}
+
+
+class Output():
+    """
+    The reconstruction file of an input, written as fname.part and renamed
+    when complete. Next to each sim dataset, a 'done' dataset marks the
+    stacks already written, so that an interrupted file can be resumed.
+    """
+
+    def __init__(self, fname, attrs, resume=True):
+        self.fname = fname
+        self.part = fname + '.part'
+        self.attrs = attrs
+        self.h5file = h5py.File(self.part, 'a' if resume else 'w')
+
+    def done(self, dname):
+        """ Mask of the stacks of the image dataset dname already reconstructed, or None """
+        name = os.path.dirname(dname) + '/done'
+        if name in self.h5file:
+            return self.h5file[name][()]
+        return None
+
+    def write(self, dname, stacks, index, img):
+        group = os.path.dirname(dname) # .../t0000/c0
+        if group + '/sim' not in self.h5file:
+            sim = self.h5file.create_dataset(group + '/sim', shape=[stacks, *img.shape],
+                                             dtype=img.dtype, chunks=(1, *img.shape))
+            for key, val in self.attrs.items():
+                sim.attrs[key] = val
+            self.h5file.create_dataset(group + '/done', shape=[stacks], dtype=bool)
+        self.h5file[group + '/sim'][index] = img
+        self.h5file[group + '/done'][index] = True
+
+    def close(self, complete):
+        self.h5file.close()
+        if complete:
+            os.replace(self.part, self.fname)
+
+
+def collect(pending, output):
+    """ Waits for at least one reconstruction and writes the finished ones """
+    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in finished:
+        dname, stacks, index = pending.pop(future)
+        output.write(dname, stacks, index, future.result())
+    return len(finished)
+
+
+def process_file(pool, fname, roi, max_pending, resume=True):
+    """
+    Reconstructs the stacks of fname not reconstructed yet (all of them if 
+    not resume), with at most max_pending stacks in flight. Returns their number
+    """
+    with h5py.File(fname, 'r') as h5file:
+        settings = read_settings(h5file)
+        num_phases = int(settings['num_phases'])
+        datasets = [(name, stack_count(h5file[name], num_phases)) for name in image_datasets(h5file)]
+    xy_sampling = settings['pixelsize'] / settings['magnification']
+    output = Output(output_name(fname), {'element_size_um': [1.0, xy_sampling/2, xy_sampling/2],
+                                         'roi': list(roi)}, resume)
+    pending = {}
+    count = 0
+    try:
+        for dname, stacks in datasets:
+            done = output.done(dname)
+            for index in range(stacks):
+                if done is not None and done[index]:
+                    continue
+                while len(pending) >= max_pending:
+                    count += collect(pending, output)
+                pending[pool.submit(reconstruct, fname, dname, index)] = (dname, stacks, index)
+        while pending:
+            count += collect(pending, output)
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        output.close(complete=False)
+        raise
+    output.close(complete=True)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--calibration', default='', help='npz file with kx, ky (e.g. from the calibration cache)')
+    parser.add_argument('--roi', type=int, nargs=3, metavar=('X', 'Y', 'SIZE'),
+                        help='ROI in sensor coordinates, by default roiX, roiY, ROI_size of the files')
+    parser.add_argument('--overwrite', action='store_true', help='reconstruct also the completed files')
+    parser.add_argument('--fft_backend', default='numpy', choices=FFT_BACKENDS)
+    parser.add_argument('--fft_workers', type=int, default=0, help='FFT threads of each worker, by default the cores shared among the workers')
+    parser.add_argument('--fft_wisdom', default='', help='pyfftw wisdom file')
+    args = parser.parse_args()
+    fft = None
+    if args.fft_backend != 'numpy':
+        fft = (args.fft_backend, args.fft_workers or max(os.cpu_count() // args.workers, 1), args.fft_wisdom or None)
+        try:
+            FFTBackend(*fft)
+        except ImportError as err:
+            print(f'{args.fft_backend} FFTs not available ({err}): numpy is used')
+            fft = None
+
+    inputs = find_inputs(args.folder)
+    todo = [f for f in inputs if args.overwrite or not os.path.exists(output_name(f))]
+    print(f'{len(inputs)} files found, {len(todo)} to reconstruct')
+    if not todo:
+        return
+    with h5py.File(todo[0], 'r') as h5file:
+        settings = read_settings(h5file)
+        first = image_datasets(h5file)[0]
+    params = reconstructor_params(settings)
+    num_phases = int(settings['num_phases'])
+    roi = tuple(args.roi) if args.roi else (int(settings['roiX']), int(settings['roiY']), int(settings['ROI_size']))
+    stack = Job(num_phases, roi).read(todo[0], first, 0)
+
+    batch_calibration = os.path.join(args.folder, 'batch_calibration.npz')
+    if args.calibration:
+        calibration = load_calibration(args.calibration)
+    elif os.path.exists(batch_calibration) and not args.overwrite:
+        calibration = load_calibration(batch_calibration) # resumed batch
+    else:
+        t = time.perf_counter()
+        calibration = calibrate(params, stack, batch_calibration, fft)
+        print(f'Calibrated in {time.perf_counter()-t:.1f} s: kx {calibration["kx"]}, ky {calibration["ky"]}')
+
+    t = time.perf_counter()
+    total = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=init_worker,
+                             initargs=(params, num_phases, roi, calibration, stack, fft)) as pool:
+        for fname in todo:
+            count = process_file(pool, fname, roi, max_pending=2*args.workers, resume=not args.overwrite)
+            total += count
+            print(f'{os.path.basename(fname)}: {count} stacks')
+    elapsed = time.perf_counter() - t
+    print(f'{total} stacks reconstructed in {elapsed:.1f} s ({total/max(elapsed, 1e-9):.2f} stacks/s)')
+
+
+if __name__ == '__main__':
+    main()
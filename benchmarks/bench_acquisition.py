@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Benchmark of the acquisition and calibration hot paths of FlirNImeasure,
+run on the simulated hardware (see simulated_hw.py).
+
+For each image size and number of phases it reports the per-frame latency
+of AO write, settle, camera grab (exposure + readout), h5 write and flush,
+the h5 writer queue (h5_queue is the back-pressure on the acquisition),
+the SIM stacks per second of measure(), the frame rate of the continuous
+run(), the time of cutRoi, calibrate and find_phaseshifts, and the peak
+memory. Results are written as json, to compare releases.
+
+Run from the folder containing HexSIM_Microscope:
+    python -m HexSIM_Microscope.benchmarks.bench_acquisition --sizes 600x960 1200x1920 --phases 7 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+
+def make_app(save_dir):
+    from HexSIM_Microscope.FLIR_NI_App import FLIR_NI_App
+    FLIR_NI_App.simulate = True
+    FLIR_NI_App.load_analyser = False # HexSimAnalyser may not be installed
+    app = FLIR_NI_App([])
+    app.settings['save_dir'] = save_dir
+    for hw in app.hardware.values():
+        hw.settings['connected'] = True
+    return app
+
+
+def configure(app, measurement, height, width, phases, exposure, readout, frame_rate):
+    camera = app.hardware['FLIRhw']
+    camera.settings['image_height'] = height
+    camera.settings['image_width'] = width
+    camera.settings['exposure_time'] = exposure
+    camera.settings['readout_time'] = readout
+    camera.settings['frame_rate'] = frame_rate
+    measurement.settings['num_phases'] = phases
+    measurement.settings['calibrate'] = False
+    measurement.settings['measure'] = False
+
+
+def bench_measure(measurement, repeats):
+    camera = measurement.image_gen
+    measurement.timer.reset()
+    tracemalloc.start()
+    t = time.perf_counter()
+    for _ in range(repeats):
+        measurement.measure(True)
+        measurement.close_data_file()
+    elapsed = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stages = measurement.timer.summary()
+    exposure = camera.settings['exposure_time']
+    result = {'stacks_per_s': repeats / elapsed,
+              'frames_per_s': repeats * measurement.settings['num_phases'] / elapsed,
+              'peak_memory_MB': peak / 2**20,
+              'exposure_ms': exposure,
+              'stages_ms': stages}
+    if 'grab' in stages:
+        result['readout_ms'] = max(stages['grab']['p50'] - exposure, 0.0)
+    return result
+
+
+def bench_continuous(measurement, duration):
+    qtapp = measurement.app.qtapp
+    measurement.timer.reset()
+    measurement.start()
+    t = time.perf_counter()
+    while time.perf_counter() - t < duration:
+        qtapp.processEvents() # the measurement thread updates the settings through the Qt event loop
+        time.sleep(0.01)
+    measurement.interrupt()
+    while measurement.acq_thread.isRunning():
+        qtapp.processEvents()
+        time.sleep(0.01)
+    stages = measurement.timer.summary()
+    frames = stages['grab']['n'] if 'grab' in stages else 0 # frames read by the CameraReader
+    return {'frames_per_s': frames / duration,
+            'frames_dropped': measurement.settings['frames_dropped'],
+            'frames_late': measurement.settings['frames_late'],
+            'stages_ms': stages}
+
+
+def bench_analysis(measurement, roi_sizes):
+    results = {}
+    measurement.measure(False)
+    height, width = measurement.imgs.shape[-2:]
+    for roi_size in roi_sizes:
+        if roi_size > min(height, width):
+            continue
+        measurement.settings['ROI_size'] = roi_size
+        measurement.settings['roiX'] = height // 2
+        measurement.settings['roiY'] = width // 2
+        measurement.timer.reset()
+        measurement.cutRoi()
+        measurement.setup_reconstructor()
+        measurement.calibrate()
+        measurement.find_phaseshifts()
+        results[roi_size] = measurement.timer.summary()
+    return results
+
+
+def info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ''
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': commit,
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['600x960', '1200x1920'], help='image sizes, HEIGHTxWIDTH')
+    parser.add_argument('--phases', nargs='+', type=int, default=[7])
+    parser.add_argument('--repeats', type=int, default=5, help='stacks acquired with measure()')
+    parser.add_argument('--continuous', type=float, default=3.0, help='duration (s) of the continuous run, 0 to skip')
+    parser.add_argument('--roi_sizes', nargs='*', type=int, default=[256, 512], help='ROI sizes for the analysis, none to skip')
+    parser.add_argument('--exposure', type=float, default=10.0, help='ms')
+    parser.add_argument('--readout', type=float, default=10.0, help='ms')
+    parser.add_argument('--frame_rate', type=float, default=100.0, help='Hz')
+    parser.add_argument('--output', default='', help='json file, printed to stdout if not given')
+    args = parser.parse_args()
+
+    save_dir = tempfile.mkdtemp(prefix='hexsim_bench_')
+    app = make_app(save_dir)
+    measurement = app.measurements['FLIR_NI_measurement']
+
+    results = []
+    for size in args.sizes:
+        height, width = (int(v) for v in size.split('x'))
+        for phases in args.phases:
+            configure(app, measurement, height, width, phases, args.exposure, args.readout, args.frame_rate)
+            result = {'height': height, 'width': width, 'num_phases': phases}
+            result['measure'] = bench_measure(measurement, args.repeats)
+            if args.continuous > 0:
+                result['continuous'] = bench_continuous(measurement, args.continuous)
+            if args.roi_sizes:
+                result['analysis'] = bench_analysis(measurement, args.roi_sizes)
+            results.append(result)
+            print(f"{height}x{width}, {phases} phases: "
+                  f"{result['measure']['stacks_per_s']:.2f} stacks/s, "
+                  f"peak memory {result['measure']['peak_memory_MB']:.1f} MB", file=sys.stderr)
+
+    report = {'info': info(), 'settings': vars(args), 'results': results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    for hw in app.hardware.values():
+        hw.settings['connected'] = False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Compression ratio and sustained write throughput of the h5 writer, for the
+compression methods of h5_compression against the uncompressed writer.
+The frames are 12-bit simulated SIM images in 16-bit containers.
+
+Run from the folder containing HexSIM_Microscope:
+    python -m HexSIM_Microscope.benchmarks.bench_compression --size 1200x1920 --frames 70 --workers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import h5py
+import numpy as np
+
+from HexSIM_Microscope.simulated_hw import SimPattern
+from HexSIM_Microscope.h5_writer import H5FrameWriter
+from HexSIM_Microscope.h5_compression import create_encoder, COMPRESSIONS, load_blosc
+
+
+def make_frames(height, width, num_phases=7, counts=2000, read_noise=3.0, seed=0):
+    rng = np.random.default_rng(seed)
+    pattern = SimPattern(height, width, period=8.0)
+    frames = []
+    for i in range(num_phases):
+        phases = [0, 2*np.pi*i/num_phases, 4*np.pi*i/num_phases]
+        photons = pattern.sample * pattern.illumination(phases, 0.8) * counts
+        img = rng.poisson(photons) + 60 + rng.normal(0, read_noise, photons.shape)
+        frames.append(np.clip(img, 0, 4095).astype(np.uint16))
+    return frames
+
+
+def bench(method, frames, num_frames, level, workers, queue_size, folder):
+    fname = os.path.join(folder, f'bench_{method}.h5')
+    encoder = create_encoder(method, level, workers)
+    options = {} if encoder is None else encoder.dataset_options()
+    height, width = frames[0].shape
+    t = time.perf_counter()
+    with h5py.File(fname, 'w') as h5file:
+        dataset = h5file.create_dataset('t0000/c0/image', shape=[num_frames, height, width],
+                                        dtype=frames[0].dtype, chunks=(1, height, width), **options)
+        writer = H5FrameWriter(dataset, h5file, queue_size=queue_size, encoder=encoder)
+        writer.start()
+        for i in range(num_frames):
+            writer.put(i, frames[i % len(frames)])
+        writer.close()
+    elapsed = time.perf_counter() - t
+    raw_bytes = num_frames * frames[0].nbytes
+    file_bytes = os.path.getsize(fname)
+    os.remove(fname)
+    return {'method': method,
+            'ratio': raw_bytes / file_bytes,
+            'MB_per_s': raw_bytes / elapsed / 2**20,
+            'frames_per_s': num_frames / elapsed,
+            'blocked_ms': writer.blocked_time * 1e3}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='1200x1920', help='HEIGHTxWIDTH')
+    parser.add_argument('--frames', type=int, default=70)
+    parser.add_argument('--level', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue_size', type=int, default=16)
+    parser.add_argument('--dir', default='', help='folder for the test files (e.g. the network save_dir)')
+    parser.add_argument('--output', default='', help='json file, printed to stdout if not given')
+    args = parser.parse_args()
+
+    height, width = (int(v) for v in args.size.split('x'))
+    frames = make_frames(height, width)
+    folder = args.dir or tempfile.mkdtemp(prefix='hexsim_bench_')
+    methods = [m for m in COMPRESSIONS if m != 'blosc_lz4' or load_blosc()]
+    results = [bench(method, frames, args.frames, args.level, args.workers, args.queue_size, folder)
+               for method in methods]
+    text = json.dumps({'settings': vars(args), 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Benchmark of the FFT back-ends of fft_backend (numpy, scipy, pyfftw) on
+SIM stacks of ROI_size x ROI_size: the 2D FFTs of the stack and of the
+2N x 2N reconstruction, and, if HexSimProcessor is installed, its
+calibrate (carrier search) and reconstruct_rfftw, with the deviation of
+the reconstruction from the numpy one. Times are medians in ms, after a
+first call that plans the FFTs. The back-ends that are not installed are
+skipped.
+
+Run from the folder containing HexSIM_Microscope:
+    python -m HexSIM_Microscope.benchmarks.bench_fft --roi_sizes 256 512 1024 --workers 8 --output bench_fft.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from HexSIM_Microscope.fft_backend import FFTBackend, FFT_BACKENDS
+from HexSIM_Microscope.reconstruction import RECONSTRUCTOR_OPTIONS, create_reconstructor, reconstructor_module
+from HexSIM_Microscope.benchmarks.bench_compression import make_frames
+from HexSIM_Microscope.benchmarks.bench_acquisition import info
+
+
+# initial optics settings of FlirNImeasure
+OPTICS = {'magnification': 63, 'NA': 0.75, 'n': 1.0, 'wavelength': 0.532, 'pixelsize': 5.86,
+          'alpha': 0.5, 'beta': 0.95, 'w': 5.0, 'eta': 0.7}
+
+
+def median_time(function, repeats):
+    function() # plans the FFTs
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times)) * 1e3
+
+
+def bench_fft(stack, repeats):
+    size = stack.shape[-1]
+    image = np.zeros((2*size, 2*size), dtype=np.float32)
+    image[::2, ::2] = stack[0]
+    spectrum = np.fft.fft2(stack)
+    half = np.fft.rfft2(image)
+    return {'fft2_stack_ms': median_time(lambda: np.fft.fft2(stack), repeats),
+            'ifft2_stack_ms': median_time(lambda: np.fft.ifft2(spectrum), repeats),
+            'rfft2_2N_ms': median_time(lambda: np.fft.rfft2(image), repeats),
+            'irfft2_2N_ms': median_time(lambda: np.fft.irfft2(half, s=image.shape), repeats),
+            'dtype': str(spectrum.dtype)}
+
+
+def fft_total(result):
+    return sum(val for key, val in result['fft'].items() if key.endswith('_ms'))
+
+
+def bench_hexsim(stack, repeats, backend):
+    """ Times of the HexSimProcessor, and its reconstruction of stack """
+    h = create_reconstructor(dict(RECONSTRUCTOR_OPTIONS, **OPTICS))
+    result = {'calibrate_ms': median_time(lambda: h.calibrate(stack, True), repeats)}
+    backend.single_precision(h)
+    result['reconstruct_ms'] = median_time(lambda: h.reconstruct_rfftw(stack), repeats)
+    return result, np.asarray(h.reconstruct_rfftw(stack))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--roi_sizes', nargs='+', type=int, default=[256, 512, 1024])
+    parser.add_argument('--phases', type=int, default=7)
+    parser.add_argument('--backends', nargs='+', default=FFT_BACKENDS, choices=FFT_BACKENDS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='FFT threads')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', default='', help='json file, printed to stdout if not given')
+    args = parser.parse_args()
+
+    backends = {}
+    for name in args.backends:
+        try:
+            backends[name] = FFTBackend(name, args.workers)
+        except ImportError as err:
+            print(f'{name} skipped: {err}', file=sys.stderr)
+    modules = [sys.modules[__name__]] # the FFTs of bench_fft
+    try:
+        modules.append(reconstructor_module(create_reconstructor({})))
+        hexsim = True
+    except ImportError as err:
+        print(f'HexSimProcessor not installed, FFTs only: {err}', file=sys.stderr)
+        hexsim = False
+
+    results = []
+    for size in args.roi_sizes:
+        stack = np.array(make_frames(size, size, args.phases), dtype=np.float32)
+        reference = None
+        for name, backend in backends.items():
+            result = {'roi_size': size, 'backend': name}
+            with backend.installed(*modules):
+                result['fft'] = bench_fft(stack, args.repeats)
+                if hexsim:
+                    result['hexsim'], img = bench_hexsim(stack, args.repeats, backend)
+            if hexsim:
+                if reference is None:
+                    reference = img
+                result['hexsim']['max_deviation'] = float(np.max(np.abs(img - reference)) /
+                                                          max(np.max(np.abs(reference)), 1e-12))
+            results.append(result)
+            line = ', '.join(f'{key} {val:.1f}' for key, val in result['fft'].items() if key.endswith('_ms'))
+            if hexsim:
+                line += f", calibrate {result['hexsim']['calibrate_ms']:.1f}, reconstruct {result['hexsim']['reconstruct_ms']:.1f}"
+            print(f'{size}x{size} {name}: {line} (ms)', file=sys.stderr)
+        # speed-up relative to numpy
+        sized = [r for r in results if r['roi_size'] == size]
+        numpy = [r for r in sized if r['backend'] == 'numpy']
+        for result in sized if numpy else []:
+            result['fft']['speedup'] = fft_total(numpy[0]) / fft_total(result)
+            if hexsim:
+                result['hexsim']['speedup'] = numpy[0]['hexsim']['reconstruct_ms'] / result['hexsim']['reconstruct_ms']
+        for backend in backends.values():
+            backend.save_wisdom()
+
+    report = {'info': info(), 'settings': vars(args), 'results': results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+On-disk cache of the SIM carrier (kx, ky of the HexSimProcessor), keyed by
+the optical parameters and the ROI. The phases and amplitudes are not
+cached: the calibration measures them again on the current frames.
+Each entry is a npz file; index.json keeps the parameters and the last use
+of each entry, and the least recently used entries are evicted.
+"""
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+
+CALIBRATION_ATTRS = ['kx', 'ky']
+
+
+class CalibrationCache():
+
+    def __init__(self, folder, max_entries=32):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.index_file = os.path.join(folder, 'index.json')
+
+    @staticmethod
+    def key(params):
+        """ Hash of the parameters. Floats are rounded, so that spinbox noise does not matter """
+        normalized = {k: round(v, 6) if isinstance(v, float) else v
+                      for k, v in sorted(params.items())}
+        return hashlib.sha1(json.dumps(normalized).encode()).hexdigest()[:16]
+
+    def get(self, params):
+        """ Returns a dict with the cached calibration arrays, or None """
+        key = self.key(params)
+        index = self._load_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+        fname = os.path.join(self.folder, entry['file'])
+        try:
+            with np.load(fname) as data:
+                values = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            del index[key] # missing or corrupted file
+            self._save_index(index)
+            return None
+        entry['last_used'] = time.time()
+        self._save_index(index)
+        return values
+
+    def put(self, params, values):
+        """ Stores the calibration arrays (dict) for params, evicting the oldest entries """
+        os.makedirs(self.folder, exist_ok=True)
+        key = self.key(params)
+        fname = key + '.npz'
+        np.savez(os.path.join(self.folder, fname),
+                 **{name: np.asarray(val) for name, val in values.items() if val is not None})
+        index = self._load_index()
+        index[key] = {'file': fname, 'params': params, 'last_used': time.time()}
+        oldest = sorted(index, key=lambda k: index[k]['last_used'])
+        for old_key in oldest[:max(len(index) - self.max_entries, 0)]:
+            self._remove(index, old_key)
+        self._save_index(index)
+
+    def invalidate(self, params=None):
+        """
+        Removes the entry of params, or all the entries if params is None.
+        Returns the number of entries removed
+        """
+        index = self._load_index()
+        keys = list(index) if params is None else [self.key(params)]
+        removed = 0
+        for key in keys:
+            if key in index:
+                self._remove(index, key)
+                removed += 1
+        self._save_index(index)
+        return removed
+
+    def __len__(self):
+        return len(self._load_index())
+
+    def _remove(self, index, key):
+        entry = index.pop(key)
+        try:
+            os.remove(os.path.join(self.folder, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    def _load_index(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, index):
+        if not os.path.isdir(self.folder):
+            return
+        tmp = self.index_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, self.index_file)
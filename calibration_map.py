@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Calibration of the whole field of view: the frames are tiled in squares of
+ROI_size, each calibrated by a pool of worker processes. For each tile the
+carrier frequencies, the modulation and the phase shifts of the carriers
+(see phase_estimation) are collected in maps, to correct the voltage table
+on the whole field and to reconstruct any ROI with the calibration of the
+closest tile.
+"""
+import numpy as np
+
+from HexSIM_Microscope.reconstruction import create_reconstructor, reconstructor_module, roi_slices
+from HexSIM_Microscope.fft_backend import FFTBackend
+from HexSIM_Microscope.phase_estimation import carrier_phases, phase_steps
+from HexSIM_Microscope.voltage_solver import wrap_phase
+
+
+def tile_centres(shape, size):
+    """
+    Centres (x, y) of the size x size tiles covering a frame of the given
+    shape, x being the row and y the column as for roiX and roiY.
+    Returns the grid shape (rows, columns) and the centres, row by row
+    """
+    rows = max(shape[-2] // size, 1)
+    cols = max(shape[-1] // size, 1)
+    # tiles spread evenly, the margins left by the division are shared
+    xs = np.linspace(size//2, shape[-2] - size//2, rows).astype(int)
+    ys = np.linspace(size//2, shape[-1] - size//2, cols).astype(int)
+    return (rows, cols), [(int(x), int(y)) for x in xs for y in ys]
+
+
+_worker = {} # state of each worker process
+
+
+def init_worker(params, dx, NA, wavelength, fft=None):
+    """ fft are the arguments of the FFTBackend of the worker, if any """
+    _worker['h'] = create_reconstructor(params)
+    _worker['fft'] = FFTBackend(*(fft or ()))
+    _worker['fft'].install(reconstructor_module(_worker['h']))
+    _worker['optics'] = (dx, NA, wavelength)
+
+
+def calibrate_tile(stack, find_carrier, kx, ky, expected):
+    """
+    Calibrates the reconstructor of the worker on the stack of a tile and
+    measures the phase shifts of its carriers. kx, ky is the previous carrier
+    of the tile, used if not find_carrier
+    """
+    h = _worker['h']
+    if not find_carrier:
+        h.kx = kx
+        h.ky = ky
+    h.calibrate(stack.astype(np.float32), find_carrier)
+    _worker['fft'].single_precision(h)
+    phases, amplitudes = carrier_phases(stack, np.ravel(h.kx), np.ravel(h.ky), *_worker['optics'])
+    return {'kx': np.ravel(h.kx), 'ky': np.ravel(h.ky),
+            'p': np.ravel(getattr(h, 'p', np.nan)),
+            'ampl': np.ravel(getattr(h, 'ampl', np.nan)),
+            'modulation': amplitudes.mean(axis=-1) / max(float(np.mean(stack)), 1e-9),
+            'shifts': phase_steps(phases, expected)}
+
+
+class CalibrationMap():
+    """
+    Results of calibrate_tile for each tile of the grid (rows x columns).
+    The maps are arrays carriers x rows x columns (rows x columns for phase_error)
+    """
+
+    def __init__(self, grid, centres, size, results, expected):
+        self.grid = grid
+        self.centres = centres
+        self.size = size
+        self.results = results
+        self.expected = expected
+
+    def _map(self, name):
+        values = np.array([r[name] for r in self.results]) # tiles x carriers
+        return values.T.reshape(-1, *self.grid)
+
+    @property
+    def kx(self):
+        return self._map('kx')
+
+    @property
+    def ky(self):
+        return self._map('ky')
+
+    @property
+    def carrier_frequency(self):
+        """ Modulus of the carrier frequencies (NA/wavelength) """
+        return np.hypot(self.kx, self.ky)
+
+    @property
+    def modulation(self):
+        """ Amplitude of the carriers relative to the mean intensity of the tile """
+        return self._map('modulation')
+
+    def phase_errors(self):
+        """ Deviation of the phase shifts from the expected ones, tiles x carriers x phases """
+        shifts = np.array([r['shifts'] for r in self.results])
+        return wrap_phase(shifts - self.expected)
+
+    @property
+    def phase_error(self):
+        """ rms phase error (rad) of each tile """
+        errors = self.phase_errors()
+        return np.sqrt(np.mean(errors**2, axis=(1, 2))).reshape(self.grid)
+
+    def median_shifts(self):
+        """ Phase shifts (carriers x phases) of the whole field: median of the tiles """
+        return self.expected + np.median(self.phase_errors(), axis=0)
+
+    def nearest(self, x, y):
+        """ Index of the tile closest to (x, y) """
+        centres = np.array(self.centres)
+        return int(np.argmin(np.hypot(centres[:, 0] - x, centres[:, 1] - y)))
+
+    def calibration(self, x, y):
+        """ Calibration (kx, ky, p, ampl) of the tile closest to (x, y) """
+        result = self.results[self.nearest(x, y)]
+        return {name: result[name] for name in ['kx', 'ky', 'p', 'ampl']}
+
+    def save(self, fname):
+        np.savez(fname, centres=np.array(self.centres), size=self.size,
+                 kx=self.kx, ky=self.ky,
+                 carrier_frequency=self.carrier_frequency,
+                 modulation=self.modulation,
+                 phase_error=self.phase_error,
+                 expected=self.expected,
+                 shifts=np.array([r['shifts'] for r in self.results]))
+
+
+def calibrate_map(pool, stack, size, expected, find_carrier=True, previous=None):
+    """
+    Calibrates all the tiles of stack (frames x rows x columns) on pool, a
+    ProcessPoolExecutor initialized with init_worker. Without find_carrier,
+    the carriers of the previous map (same tiles) are refined.
+    Returns the CalibrationMap
+    """
+    grid, centres = tile_centres(stack.shape, size)
+    if previous is not None and previous.centres != centres:
+        previous = None
+    futures = []
+    for index, (x, y) in enumerate(centres):
+        rows, cols = roi_slices(stack.shape, x, y, size)
+        kx = ky = None
+        search = find_carrier or previous is None
+        if not search:
+            kx, ky = previous.results[index]['kx'], previous.results[index]['ky']
+        futures.append(pool.submit(calibrate_tile, np.ascontiguousarray(stack[:, rows, cols]),
+                                   search, kx, ky, expected))
+    results = [future.result() for future in futures]
+    return CalibrationMap(grid, centres, size, results, expected)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Producer thread that drains the camera into a bounded ring of frames, so
+that the continuous acquisition keeps up with the camera even when the
+consumer loop (display, recording, live reconstruction) stalls.
+"""
+import queue
+import threading
+import time
+
+
+class CameraReader(threading.Thread):
+    """
+    Calls camera.get_nparray() in a loop and queues (index, timestamp, frame).
+    The index is the number of the frame in the acquisition, so that it gives
+    the phase of a hardware-timed sequence: the camera frame_id if the camera
+    has one (counted from acq_start), else the frames read plus those the
+    camera dropped (their strobes still advanced the sequence).
+    If the ring is full, the oldest frame is discarded and counted in dropped:
+    the PC, not the camera, is limiting the frame rate.
+    A frame taken by get() more than late_time (s) after it was read is counted in late.
+    Each get_nparray() is timed as the 'grab' stage of timer, if given.
+    The camera acquisition must be started before and stopped after the reader.
+    """
+
+    def __init__(self, camera, queue_size=8, late_time=0.1, timer=None):
+        super().__init__(name='CameraReader', daemon=True)
+        self.camera = camera
+        self.ring = queue.Queue(maxsize=queue_size)
+        self.late_time = late_time
+        self.timer = timer
+        self.read = 0
+        self.dropped = 0
+        self.late = 0
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            start_dropped = self.camera_dropped
+            while not self._stop_event.is_set():
+                t = time.perf_counter()
+                img = self.camera.get_nparray()
+                now = time.perf_counter()
+                if self.timer is not None:
+                    self.timer.add('grab', now - t)
+                item = (self.frame_index(start_dropped), now, img)
+                self.read += 1
+                try:
+                    self.ring.put_nowait(item)
+                except queue.Full:
+                    try:
+                        self.ring.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+                    self.ring.put_nowait(item)
+        except Exception as err:
+            if not self._stop_event.is_set():
+                self.error = err
+
+    def frame_index(self, start_dropped):
+        """ Index of the frame just read (see the class) """
+        frame_id = getattr(self.camera, 'frame_id', None)
+        if frame_id is not None:
+            return frame_id
+        return self.read + self.camera_dropped - start_dropped
+
+    def get(self, timeout=0.1):
+        """
+        Returns the oldest (index, frame) in the ring, or None if no frame
+        arrives within timeout. The frames dropped by the reader or by the
+        camera leave a gap in the indices.
+        """
+        if self.error is not None:
+            raise self.error
+        try:
+            index, t, img = self.ring.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if time.perf_counter() - t > self.late_time:
+            self.late += 1
+        return index, img
+
+    @property
+    def depth(self):
+        return self.ring.qsize()
+
+    @property
+    def camera_dropped(self):
+        """ Frames dropped by the camera itself, if it counts them """
+        return getattr(self.camera, 'dropped_frames', 0)
+
+    def stop(self, timeout=2.0):
+        """ Stops reading. Returns after the frame being read, at most after timeout """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Cheap display path for the camera frames: the frames are reduced to about
+the resolution of the image widget before they are drawn, and the levels are
+estimated on a strided subsample and smoothed over time, instead of computing
+the histogram of the full frame at each refresh.
+"""
+import numpy as np
+
+
+DISPLAY_MODES = ['subsample', 'bin', 'full']
+
+
+class DisplayDecimator():
+    """
+    mode:
+        'subsample' takes one pixel every factor pixels (cheapest)
+        'bin'       averages factor x factor blocks (less aliasing and noise)
+        'full'      displays the full frame
+    The levels are the percentiles of one pixel every level_stride pixels,
+    averaged with the previous ones with weight 1-smoothing.
+    """
+
+    def __init__(self, mode='subsample', level_stride=8, percentiles=(0.1, 99.9), smoothing=0.5):
+        self.mode = mode
+        self.level_stride = level_stride
+        self.percentiles = percentiles
+        self.smoothing = smoothing
+        self._levels = None
+
+    def factor(self, shape, target):
+        """
+        Integer decimation factor that brings the shape to about the target (widget) size.
+        With the aspect ratio locked, the image is fitted to the most constrained axis
+        """
+        if self.mode == 'full' or min(target) <= 0:
+            return 1
+        return max(1, int(max(shape[0] / target[0], shape[1] / target[1])))
+
+    def reduce(self, img, factor):
+        if factor == 1:
+            return img
+        if self.mode == 'bin':
+            rows = img.shape[0] // factor
+            cols = img.shape[1] // factor
+            blocks = img[:rows*factor, :cols*factor].reshape(rows, factor, cols, factor)
+            return blocks.mean(axis=(1, 3), dtype=np.float32)
+        return img[::factor, ::factor]
+
+    def levels(self, img):
+        sample = img[::self.level_stride, ::self.level_stride]
+        lmin, lmax = np.percentile(sample, self.percentiles)
+        if self._levels is not None:
+            w = self.smoothing
+            lmin = w * self._levels[0] + (1-w) * lmin
+            lmax = w * self._levels[1] + (1-w) * lmax
+        self._levels = (lmin, lmax)
+        return lmin, lmax
+
+    def reset(self):
+        self._levels = None
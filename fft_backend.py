@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Multithreaded CPU FFTs for the HexSimProcessor, which computes its FFTs
+with numpy.fft. While a back-end is installed in the module of the
+processor, the numpy.fft functions it uses are replaced with:
+    'scipy'  scipy.fft with workers threads, in the precision of the input
+    'pyfftw' pyFFTW with threads, cached plans and the FFTW wisdom saved
+             to a file, so that the plans are measured only once
+    'numpy'  nothing is replaced
+Only the names of the module are replaced (see install): numpy.fft is not
+changed, so the other threads of the process keep the numpy FFTs.
+With scipy and pyfftw the reconstruction runs in single precision: the
+frames are float32 and, after each calibration, the arrays precomputed by
+the processor are cast to float32 and complex64 (see single_precision).
+"""
+import functools
+import os
+import pickle
+from contextlib import contextmanager
+import numpy as np
+
+
+FFT_BACKENDS = ['numpy', 'scipy', 'pyfftw']
+FFT_FUNCTIONS = ['fft', 'ifft', 'fft2', 'ifft2', 'fftn', 'ifftn',
+                 'rfft', 'irfft', 'rfft2', 'irfft2', 'rfftn', 'irfftn']
+
+# the original numpy.fft functions
+_NUMPY_FFT = {name: getattr(np.fft, name) for name in FFT_FUNCTIONS}
+
+
+def _numpy_name(value):
+    """ Name of value if it is an original numpy.fft function, else None """
+    for name, function in _NUMPY_FFT.items():
+        if value is function:
+            return name
+    return None
+
+
+class _Namespace():
+    """ The attributes of module, except those given: replaces numpy or numpy.fft in a module """
+
+    def __init__(self, module, **replaced):
+        self._module = module
+        self.__dict__.update(replaced)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+class FFTBackend():
+    """
+    FFT functions of the back-end name, with workers threads (all the
+    cores if None). wisdom is the file of the pyFFTW wisdom
+    """
+
+    def __init__(self, name='numpy', workers=None, wisdom=None):
+        if name not in FFT_BACKENDS:
+            raise ValueError(f'Unknown FFT back-end {name}, expected one of {FFT_BACKENDS}')
+        self.name = name
+        self.workers = workers or os.cpu_count()
+        self.wisdom = wisdom
+        self.functions = {}
+        if name == 'scipy':
+            import scipy.fft # optional dependency, imported on first use
+            self.functions = {f: functools.partial(getattr(scipy.fft, f), workers=self.workers)
+                              for f in FFT_FUNCTIONS}
+        elif name == 'pyfftw':
+            import pyfftw
+            import pyfftw.interfaces.numpy_fft as fftw
+            pyfftw.interfaces.cache.enable()
+            pyfftw.interfaces.cache.set_keepalive_time(60)
+            self.load_wisdom()
+            self.functions = {f: functools.partial(getattr(fftw, f), threads=self.workers,
+                                                   planner_effort='FFTW_MEASURE')
+                              for f in FFT_FUNCTIONS}
+
+    def install(self, *modules):
+        """
+        Replaces the numpy.fft functions used by modules: those imported by
+        name, and numpy and numpy.fft themselves with namespaces where the
+        FFTs are those of the back-end.
+        Returns the replaced (module, name, value), see restore
+        """
+        if not self.functions:
+            return []
+        fft = _Namespace(np.fft, **self.functions)
+        numpy = _Namespace(np, fft=fft)
+        replaced = []
+        for module in modules:
+            for key, value in list(vars(module).items()):
+                if value is np:
+                    new = numpy
+                elif value is np.fft:
+                    new = fft
+                elif _numpy_name(value) in self.functions:
+                    new = self.functions[_numpy_name(value)]
+                else:
+                    continue
+                replaced.append((module, key, value))
+                setattr(module, key, new)
+        return replaced
+
+    @staticmethod
+    def restore(replaced):
+        for module, key, value in reversed(replaced):
+            setattr(module, key, value)
+
+    @contextmanager
+    def installed(self, *modules):
+        """ Context in which the FFTs of modules use the back-end """
+        replaced = self.install(*modules)
+        try:
+            yield self
+        finally:
+            self.restore(replaced)
+
+    def single_precision(self, h):
+        """
+        Casts the float64 and complex128 arrays (2 or more dimensions) of the
+        reconstructor h to float32 and complex64, so that its FFTs run in
+        single precision. The carrier and the other parameters are kept.
+        Nothing is changed with numpy. Call after each calibration of h
+        """
+        if self.name == 'numpy':
+            return
+        for key, value in list(vars(h).items()):
+            if isinstance(value, np.ndarray) and value.ndim >= 2:
+                if value.dtype == np.float64:
+                    setattr(h, key, value.astype(np.float32))
+                elif value.dtype == np.complex128:
+                    setattr(h, key, value.astype(np.complex64))
+
+    def load_wisdom(self):
+        if self.name == 'pyfftw' and self.wisdom and os.path.exists(self.wisdom):
+            import pyfftw
+            with open(self.wisdom, 'rb') as f:
+                pyfftw.import_wisdom(pickle.load(f))
+
+    def save_wisdom(self):
+        """ Saves the FFTW plans measured so far, for the next sessions """
+        if self.name == 'pyfftw' and self.wisdom:
+            import pyfftw
+            folder = os.path.dirname(self.wisdom)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(self.wisdom, 'wb') as f:
+                pickle.dump(pyfftw.export_wisdom(), f)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Preallocated stack of frames in the native dtype of the camera, reused by
+each measure(), so that memory stays flat across calibration iterations.
+"""
+import inspect
+import numpy as np
+
+
+class FramePool():
+    """
+    Buffer of length frames, allocated on the first grab with the shape and
+    dtype of the camera frames, and reallocated only if they change.
+    The frames of the previous stack are overwritten by the next one: they
+    must be copied (or written to file) before the next measure().
+    """
+
+    def __init__(self, length=7):
+        self.length = length
+        self.buffer = None
+        self.attached = False
+        self._own_buffer = None
+        self._in_place = {}
+
+    def resize(self, length):
+        self.length = length
+
+    @property
+    def stack(self):
+        """ The current stack of frames (a view of the buffer) """
+        if self.buffer is None:
+            return None
+        return self.buffer[:self.length]
+
+    def grab(self, camera, index):
+        """
+        Acquires the next camera frame into the slot index and returns the slot.
+        If the camera get_nparray accepts an out array, the frame is written
+        directly in the slot, otherwise it is copied once.
+        """
+        if self.buffer is not None and not self.attached and self.buffer.shape[0] < self.length:
+            # grown by resize(): an attached buffer is the caller's, it is never reallocated
+            self.buffer = np.empty((self.length, *self.buffer.shape[1:]), dtype=self.buffer.dtype)
+        if self.buffer is not None and self.supports_out(camera):
+            slot = self.buffer[index]
+            img = camera.get_nparray(out=slot)
+            if img is slot:
+                return slot
+        else:
+            img = camera.get_nparray()
+        self._allocate(img.shape, img.dtype)
+        slot = self.buffer[index]
+        slot[...] = img
+        return slot
+
+    def attach(self, buffer):
+        """
+        Grabs the next frames directly in buffer (e.g. the memory map of the
+        file the stack is saved to), instead of the pool's own memory
+        """
+        if not self.attached:
+            self._own_buffer = self.buffer
+        self.buffer = buffer
+        self.attached = True
+
+    def detach(self):
+        """ Goes back to the pool's own memory, leaving the attached buffer untouched """
+        if self.attached:
+            self.buffer = self._own_buffer
+            self._own_buffer = None
+            self.attached = False
+
+    def _allocate(self, shape, dtype):
+        if self.buffer is None or self.buffer.shape[0] < self.length or \
+           self.buffer.shape[1:] != shape or self.buffer.dtype != dtype:
+            self.buffer = np.empty((self.length, *shape), dtype=dtype)
+
+    def supports_out(self, camera):
+        key = type(camera)
+        if key not in self._in_place:
+            try:
+                params = inspect.signature(camera.get_nparray).parameters
+                self._in_place[key] = 'out' in params
+            except (TypeError, ValueError):
+                self._in_place[key] = False
+        return self._in_place[key]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Quality check of the frames of a phase stack, run on each frame as it
+arrives: the mean intensity of the ROI and, if the carrier is known, the
+modulation depth and phase of each carrier (see phase_estimation). Once the
+stack is acquired, a frame is out of tolerance if its intensity or its
+modulation deviates from the median of the stack (laser flicker, motion),
+or if its phase is off the expected phase step (voltage not settled).
+The modulation and the phase are checked only if the carrier stands out of
+the background of the frames: with a wrong carrier they are only noise.
+The frames out of tolerance are acquired again by the measurement.
+"""
+import numpy as np
+
+from HexSIM_Microscope.phase_estimation import carrier_phases, off_carrier
+from HexSIM_Microscope.voltage_solver import wrap_phase
+
+
+# a frame out of tolerance again, with a score within this fraction of the
+# previous one, is not a transient: it is not acquired again
+REPEAT_TOLERANCE = 0.2
+
+
+class FrameCheck():
+    """
+    Statistics of the num_frames frames of a stack in the ROI (rows, cols).
+    kx, ky are the carrier frequencies (NA/wavelength), None if the carrier
+    is unknown: only the intensity is checked then. expected are the phase
+    shifts of the carriers (carriers x frames), needed for the phase check.
+    The tolerances are relative for intensity and modulation, in rad for the
+    phase (0: not checked). The carrier is checked if its amplitude is at
+    least min_contrast times that of the carrier rotated by 90 degrees
+    """
+
+    def __init__(self, num_frames, rows, cols, kx=None, ky=None, dx=None, NA=None, wavelength=None,
+                 expected=None, intensity_tolerance=0.1, modulation_tolerance=0.3, phase_tolerance=0.0,
+                 min_contrast=3.0):
+        self.rows = rows
+        self.cols = cols
+        self.carrier = None
+        self.background = None
+        carriers = 0
+        if kx is not None:
+            self.carrier = (np.ravel(kx), np.ravel(ky), dx, NA, wavelength)
+            self.background = (*off_carrier(kx, ky), dx, NA, wavelength)
+            carriers = np.size(kx)
+        self.expected = expected
+        self.intensity_tolerance = intensity_tolerance
+        self.modulation_tolerance = modulation_tolerance
+        self.phase_tolerance = phase_tolerance
+        self.min_contrast = min_contrast
+        self.mean = np.full(num_frames, np.nan)
+        self.modulation = np.full((carriers, num_frames), np.nan)
+        self.phase = np.full((carriers, num_frames), np.nan)
+        self.contrast = np.full((carriers, num_frames), np.nan)
+        self.retakes = np.zeros(num_frames, dtype=int)
+
+    def check(self, index, frame):
+        """ Measures the frame index of the stack (the full camera frame) """
+        roi = np.asarray(frame[self.rows, self.cols], dtype=np.float32)[None]
+        mean = float(roi.mean())
+        self.mean[index] = mean
+        if self.carrier is not None:
+            phase, amplitude = carrier_phases(roi, *self.carrier)
+            _phase, background = carrier_phases(roi, *self.background)
+            self.phase[:, index] = phase[:, 0]
+            # depth of the cosine: twice the Fourier coefficient, relative to the mean
+            self.modulation[:, index] = 2 * amplitude[:, 0] / max(mean, 1e-12)
+            self.contrast[:, index] = amplitude[:, 0] / np.maximum(background[:, 0], 1e-12)
+
+    @property
+    def carrier_found(self):
+        """ True if every carrier stands out of the background in the median frame """
+        if self.carrier is None or np.all(np.isnan(self.contrast)):
+            return False
+        return bool(np.min(np.nanmedian(self.contrast, axis=1)) >= self.min_contrast)
+
+    def deviations(self):
+        """
+        Relative deviation of the intensity from the median, relative loss of
+        modulation (worst carrier) and phase error (rad, worst carrier) of
+        each frame. NaN for the frames not measured or not checked
+        """
+        frames = len(self.mean)
+        intensity = np.abs(self.mean / np.nanmedian(self.mean) - 1)
+        modulation = np.full(frames, np.nan)
+        phase = np.full(frames, np.nan)
+        if self.carrier_found:
+            median = np.nanmedian(self.modulation, axis=1, keepdims=True)
+            modulation = np.max(1 - self.modulation / median, axis=0)
+            if self.expected is not None and self.phase_tolerance > 0:
+                # the phase of the first frame is arbitrary: remove the mean offset of each carrier
+                error = self.phase - self.expected
+                measured = np.isfinite(error)
+                offset = np.angle(np.nansum(np.exp(1j*np.where(measured, error, 0)) * measured,
+                                            axis=1, keepdims=True))
+                phase = np.max(np.abs(wrap_phase(error - offset)), axis=0)
+        return intensity, modulation, phase
+
+    def scores(self):
+        """ Worst deviation of each frame relative to its tolerance: above 1 if out of tolerance """
+        if np.all(np.isnan(self.mean)):
+            return np.full(len(self.mean), np.nan)
+        intensity, modulation, phase = self.deviations()
+        ratios = [intensity / max(self.intensity_tolerance, 1e-12),
+                  modulation / max(self.modulation_tolerance, 1e-12)]
+        if self.phase_tolerance > 0:
+            ratios.append(phase / self.phase_tolerance)
+        with np.errstate(invalid='ignore'):
+            return np.fmax.reduce(ratios)
+
+    def bad_frames(self):
+        """ Indices of the measured frames out of tolerance """
+        with np.errstate(invalid='ignore'):
+            return [int(index) for index in np.flatnonzero(self.scores() > 1)]
+
+    def persistent(self, index, previous):
+        """ True if the frame index is out of tolerance with about its previous score """
+        score = self.scores()[index]
+        return bool(score > 1 and abs(score - previous) <= REPEAT_TOLERANCE * previous)
+
+    def attrs(self):
+        """ Attributes of the image dataset with the results of the check """
+        bad = self.bad_frames()
+        attrs = {'qc_mean': self.mean,
+                 'qc_retakes': self.retakes,
+                 'qc_passed': not bad,
+                 'qc_bad_frames': np.array(bad, dtype=int),
+                 'qc_tolerances': np.array([self.intensity_tolerance, self.modulation_tolerance,
+                                            self.phase_tolerance]),
+                 'qc_carrier_checked': self.carrier_found}
+        if self.carrier is not None:
+            attrs['qc_modulation'] = self.modulation
+            attrs['qc_phase'] = self.phase
+            attrs['qc_carrier_contrast'] = self.contrast
+        return attrs
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Lossless compression of the camera frames, encoded on a pool of threads and
+written to h5 as pre-compressed chunks (one chunk per frame), so that the
+encoding never runs on the acquisition thread.
+The 12-bit data of the camera, stored in 16-bit containers, compress well
+after a (bit or byte) shuffle.
+
+    'gzip'      byte shuffle + deflate, readable by any HDF5 installation
+    'blosc_lz4' Blosc with bitshuffle and LZ4, needs the blosc package to
+                write and hdf5plugin to write and read the files
+blosc and hdf5plugin are imported on first use (see load_blosc), since
+they slow down the start of the application.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+blosc = None
+hdf5plugin = None
+
+
+COMPRESSIONS = ['none', 'gzip', 'blosc_lz4']
+
+
+def load_blosc():
+    """
+    Imports blosc and hdf5plugin (which registers the Blosc filter in h5py).
+    Returns False if they are not installed
+    """
+    global blosc, hdf5plugin
+    if blosc is None:
+        try:
+            import blosc as _blosc
+            import hdf5plugin as _hdf5plugin
+        except ImportError:
+            return False
+        blosc, hdf5plugin = _blosc, _hdf5plugin
+    return True
+
+
+class ChunkEncoder():
+    """
+    Compresses frames into h5 chunks, in the format expected by the filters
+    returned by dataset_options(), on a pool of worker threads.
+    zlib and blosc release the GIL, so the workers run in parallel.
+    """
+
+    def __init__(self, method='gzip', level=4, workers=4):
+        if method not in COMPRESSIONS[1:]:
+            raise ValueError(f'Unknown compression {method}, use one of {COMPRESSIONS}')
+        if method == 'blosc_lz4' and not load_blosc():
+            raise ImportError('blosc_lz4 compression requires the blosc and hdf5plugin packages')
+        self.method = method
+        self.level = level
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ChunkEncoder')
+
+    def dataset_options(self):
+        """ Keyword arguments for h5py create_dataset """
+        if self.method == 'gzip':
+            return {'shuffle': True, 'compression': 'gzip', 'compression_opts': self.level}
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=self.level,
+                                     shuffle=hdf5plugin.Blosc.BITSHUFFLE))
+
+    def encode(self, frame):
+        frame = np.ascontiguousarray(frame)
+        if self.method == 'gzip':
+            # same byte order as the HDF5 shuffle filter: all first bytes, then all second bytes...
+            shuffled = frame.view(np.uint8).reshape(-1, frame.itemsize).T.tobytes()
+            return zlib.compress(shuffled, self.level)
+        return blosc.compress(frame.tobytes(), typesize=frame.itemsize, clevel=self.level,
+                              shuffle=blosc.BITSHUFFLE, cname='lz4')
+
+    def submit(self, frame):
+        """ Returns a future with the compressed chunk """
+        return self.pool.submit(self.encode, frame)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+def create_encoder(method, level=4, workers=4):
+    """ Returns a ChunkEncoder, or None for uncompressed data """
+    if method == 'none':
+        return None
+    return ChunkEncoder(method, level, workers)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Writes the acquired frames to the h5 file on a separate thread, so that the
+acquisition loop is not blocked by the disk (e.g. a network-mounted save_dir).
+H5FrameWriter fills a preallocated dataset, H5StreamWriter records an
+unbounded stream of frames, rotating the files by size or time, H5StackWriter
+writes whole stacks as new datasets (multi-dimensional acquisitions).
+"""
+import queue
+import threading
+import time
+
+
+FLUSH_POLICIES = ['on_close', 'every_frame', 'every_n', 'interval']
+STREAM_LAYOUTS = ['cycles', 'single']
+
+
+class H5FrameWriter(threading.Thread):
+    """
+    Takes (index, frame) items from a bounded queue and writes them into
+    dataset[index], one chunk per frame. The h5 file is flushed according to
+    flush_policy:
+        'on_close'    only when the writer is closed
+        'every_frame' after each frame
+        'every_n'     every flush_every frames
+        'interval'    at most every flush_interval seconds
+    If the queue is full, put() blocks: the time spent waiting (back-pressure)
+    is accumulated in blocked_time.
+    With an encoder (see h5_compression), the frames are compressed by its
+    thread pool as soon as they are queued, and written as raw chunks:
+    the dataset must be created with encoder.dataset_options().
+    """
+
+    def __init__(self, dataset, h5file, queue_size=16, flush_policy='on_close',
+                 flush_every=7, flush_interval=1.0, timer=None, encoder=None):
+        super().__init__(name='H5FrameWriter', daemon=True)
+        if flush_policy not in FLUSH_POLICIES:
+            raise ValueError(f'Unknown flush policy {flush_policy}, use one of {FLUSH_POLICIES}')
+        self.dataset = dataset
+        self.h5file = h5file
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_policy = flush_policy
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.timer = timer
+        self.encoder = encoder
+        self.written = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0
+        self.blocked_count = 0
+        self.error = None
+        self._last_flush = time.perf_counter()
+
+    def put(self, index, frame):
+        """
+        Queues a frame to be written in dataset[index]. The frame must not
+        be modified by the caller afterwards.
+        """
+        encoded = None
+        if self.encoder is not None:
+            encoded = self.encoder.submit(frame)
+        self._queue((index, frame, encoded))
+
+    def _queue(self, item):
+        if self.error is not None:
+            raise self.error
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            t = time.perf_counter()
+            self.queue.put(item)
+            self.blocked_time += time.perf_counter() - t
+            self.blocked_count += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue # drain the queue, so that put() never blocks forever
+            try:
+                t = time.perf_counter()
+                self._write(*item)
+                if self.timer is not None:
+                    self.timer.add('h5_write', time.perf_counter() - t)
+            except Exception as err:
+                self.error = err
+
+    def _write(self, index, frame, encoded):
+        self._store(self.dataset, index, frame, encoded)
+        self._write_done()
+
+    def _store(self, dataset, position, frame, encoded):
+        if encoded is None:
+            dataset[position] = frame
+        else:
+            dataset.id.write_direct_chunk((position,) + (0,) * frame.ndim, encoded.result())
+
+    def _write_done(self):
+        self.written += 1
+        policy = self.flush_policy
+        if policy == 'every_frame' or \
+           policy == 'every_n' and self.written % self.flush_every == 0 or \
+           policy == 'interval' and time.perf_counter() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        t = time.perf_counter()
+        self.h5file.flush()
+        self._last_flush = time.perf_counter()
+        if self.timer is not None:
+            self.timer.add('h5_flush', self._last_flush - t)
+
+    def close(self):
+        """
+        Writes the frames still in the queue, flushes and stops the thread.
+        The h5 file is left open.
+        """
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+        if self.encoder is not None:
+            self.encoder.shutdown()
+        if self.error is None:
+            self.flush()
+        else:
+            raise self.error
+
+
+class H5StreamWriter(H5FrameWriter):
+    """
+    Appends frames to h5 files opened by open_file(), a function returning
+    (h5file, h5_group). The index passed to put() is the frame number of the
+    stream. Depending on layout, the frames go:
+        'cycles' in one t{cycle:04d}/c0/image dataset for each phase cycle
+                 of cycle_length frames, at the position of their phase
+        'single' in a single t0000/c0/image dataset, grown as needed
+    A new file is started, at the beginning of a cycle, when the current one
+    exceeds rotate_size (MB) or rotate_time (s); 0 disables the rotation.
+    Memory use is bounded by the queue size, however long the stream is.
+    The num_frames attribute of each dataset counts the frames written:
+    a cycle with dropped frames has fewer than cycle_length.
+    """
+
+    grow_step = 64 # frames added each time the single dataset is resized
+
+    def __init__(self, open_file, attrs=None, layout='cycles', cycle_length=7,
+                 rotate_size=0.0, rotate_time=0.0, queue_size=16,
+                 flush_policy='interval', flush_every=7, flush_interval=1.0, timer=None, encoder=None):
+        super().__init__(None, None, queue_size, flush_policy, flush_every, flush_interval, timer, encoder)
+        if layout not in STREAM_LAYOUTS:
+            raise ValueError(f'Unknown layout {layout}, use one of {STREAM_LAYOUTS}')
+        self.name = 'H5StreamWriter'
+        self.open_file = open_file
+        self.attrs = attrs or {}
+        self.layout = layout
+        self.cycle_length = cycle_length
+        self.rotate_size = rotate_size
+        self.rotate_time = rotate_time
+        self.h5_group = None
+        self.files = []
+        self.cycle = None
+
+    def _write(self, index, frame, encoded):
+        cycle, phase = divmod(index, self.cycle_length)
+        new_cycle = cycle != self.cycle
+        self.cycle = cycle
+        if new_cycle and self._rotation_due():
+            self._close_file()
+        if self.h5file is None:
+            self._new_file()
+        if self.layout == 'cycles':
+            # a cycle may start after phase 0, if frames were dropped
+            if new_cycle or self.dataset is None:
+                self.dataset = self._create_dataset(f't{cycle:04d}/c0/image', frame,
+                                                    [self.cycle_length, *frame.shape])
+                self.dataset_frames = 0
+            self._store(self.dataset, phase, frame, encoded)
+        else:
+            if self.dataset is None:
+                self.dataset = self._create_dataset('t0000/c0/image', frame,
+                                                    [self.grow_step, *frame.shape],
+                                                    maxshape=[None, *frame.shape])
+                self.dataset_frames = 0
+            if self.dataset_frames == self.dataset.shape[0]:
+                self.dataset.resize(self.dataset_frames + self.grow_step, axis=0)
+            self._store(self.dataset, self.dataset_frames, frame, encoded)
+        self.dataset_frames += 1
+        self.file_bytes += frame.nbytes
+        self._write_done()
+
+    def _rotation_due(self):
+        if self.h5file is None:
+            return False
+        too_big = self.rotate_size > 0 and self.file_bytes >= self.rotate_size * 2**20
+        too_old = self.rotate_time > 0 and time.perf_counter() - self.file_start >= self.rotate_time
+        return too_big or too_old
+
+    def _new_file(self):
+        self.h5file, self.h5_group = self.open_file(len(self.files))
+        self.files.append(self.h5file.filename)
+        self.file_start = time.perf_counter()
+        self.file_bytes = 0
+        self.dataset = None
+
+    def _create_dataset(self, name, frame, shape, maxshape=None):
+        self._finish_dataset()
+        options = {} if self.encoder is None else self.encoder.dataset_options()
+        dataset = self.h5_group.create_dataset(name, shape=shape, dtype=frame.dtype,
+                                               chunks=(1, *frame.shape), maxshape=maxshape,
+                                               **options)
+        for key, val in self.attrs.items():
+            dataset.attrs[key] = val
+        return dataset
+
+    def _finish_dataset(self):
+        """ Trims the single dataset and records the frames actually written """
+        if self.dataset is not None:
+            if self.layout == 'single':
+                self.dataset.resize(self.dataset_frames, axis=0)
+            self.dataset.attrs['num_frames'] = self.dataset_frames
+
+    def _close_file(self):
+        if self.h5file is not None:
+            self._finish_dataset()
+            self.dataset = None
+            self.h5file.close()
+            self.h5file = None
+
+    def flush(self):
+        if self.h5file is not None:
+            super().flush()
+
+    def close(self):
+        """
+        Writes the frames still in the queue and closes the current file
+        """
+        try:
+            super().close()
+        finally:
+            self._close_file()
+
+
+class H5StackWriter(H5FrameWriter):
+    """
+    Writes each array passed to put() as a new dataset of h5_group, with its
+    attributes. Stacks of frames (3D) are chunked by frame and compressed
+    by the encoder, if any; other arrays are written as they are.
+    written counts the datasets.
+    """
+
+    def __init__(self, h5_group, h5file, queue_size=4, flush_policy='every_frame',
+                 timer=None, encoder=None):
+        super().__init__(None, h5file, queue_size, flush_policy, timer=timer, encoder=encoder)
+        self.name = 'H5StackWriter'
+        self.h5_group = h5_group
+
+    def put(self, name, array, attrs=None):
+        """
+        Queues array to be written in the dataset name. The array must not
+        be modified by the caller until written: at most queue_size arrays
+        are queued, plus the one being written.
+        """
+        encoded = None
+        if self.encoder is not None and array.ndim == 3:
+            encoded = [self.encoder.submit(frame) for frame in array]
+        self._queue(((name, attrs or {}), array, encoded))
+
+    def _write(self, index, array, encoded):
+        name, attrs = index
+        if array.ndim == 3:
+            options = {} if encoded is None else self.encoder.dataset_options()
+            dataset = self.h5_group.create_dataset(name, shape=array.shape, dtype=array.dtype,
+                                                   chunks=(1, *array.shape[1:]), **options)
+            for position, frame in enumerate(array):
+                self._store(dataset, position, frame, None if encoded is None else encoded[position])
+        else:
+            dataset = self.h5_group.create_dataset(name, data=array)
+        for key, val in attrs.items():
+            dataset.attrs[key] = val
+        self._write_done()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Headless runner of FlirNImeasure, for overnight and scripted runs: the app
+is created without window, figures and voltage table, and the jobs run one
+after the other in the calling thread, without display updates.
+
+A job is a dict:
+    {"name": "stack", "mode": "measure", "repeats": 10,
+     "settings": {"num_phases": 7, "hw/FLIRhw/exposure_time": 5.0}}
+mode is 'measure' (repeats stacks, each in its own data file unless
+"save": false), 'calibrate', 'mda' or 'settle' (characterize_settle).
+The settings are names of the measurement, or paths (hw/..., app/...),
+and are kept by the next jobs. Each job returns a dict with the
+duration, the stage timings, the data files and, for a calibration,
+the phase error and the voltage sequence.
+
+Run from the folder containing HexSIM_Microscope:
+    python -m HexSIM_Microscope.headless Settings/hexSIM.ini --jobs jobs.json --output log/headless.jsonl
+    python -m HexSIM_Microscope.headless Settings/hexSIM.ini --mode measure --repeats 100 --set storage=npy
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+
+from HexSIM_Microscope.timing import append_json_line
+
+
+JOB_MODES = {'measure': 'measure', 'calibrate': 'calibrate', 'mda': 'mda', 'settle': 'characterize_settle'}
+MEASUREMENT = 'FLIR_NI_measurement'
+
+
+def create_app(ini=None, simulate=False):
+    """
+    The FLIR_NI_App without user interface, with the settings of ini loaded
+    and all the hardware connected
+    """
+    # no display is needed: Qt draws nothing on the offscreen platform
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from HexSIM_Microscope.FLIR_NI_App import FLIR_NI_App
+    FLIR_NI_App.headless = True
+    FLIR_NI_App.simulate = simulate
+    FLIR_NI_App.load_analyser = False
+    app = FLIR_NI_App([])
+    if ini:
+        app.settings_load_ini(ini)
+    for hw in app.hardware.values():
+        hw.settings['connected'] = True
+    return app
+
+
+class HeadlessRunner():
+    """
+    Runs the jobs on the FlirNImeasure of a headless app (see create_app).
+    interrupt(), e.g. from another thread, stops the current job and the queue
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.measurement = app.measurements[MEASUREMENT]
+        self.stopped = False
+
+    def apply(self, settings):
+        """ Writes settings: {name of the measurement or path: value} """
+        for key, value in settings.items():
+            if '/' in key:
+                lq = self.app.get_lq(key)
+                if lq is None:
+                    raise KeyError(f'Setting not found: {key}')
+                lq.update_value(value)
+            else:
+                self.measurement.settings[key] = value
+
+    def run(self, job):
+        """ Runs a job, returns its result """
+        m = self.measurement
+        mode = job.get('mode', 'measure')
+        if mode not in JOB_MODES:
+            raise ValueError(f'Unknown job mode {mode}, expected one of {list(JOB_MODES)}')
+        result = {'name': job.get('name', mode), 'mode': mode,
+                  'start': time.strftime('%Y-%m-%d %H:%M:%S'), 'files': []}
+        m.interrupt_measurement_called = False
+        m.pre_run()
+        t = time.perf_counter()
+        try:
+            self.apply(job.get('settings', {}))
+            for name, setting in JOB_MODES.items():
+                m.settings[setting] = name == mode
+            if mode == 'measure':
+                self.run_measure(job.get('repeats', 1), job.get('save', True), result)
+            else:
+                m.run()
+                if m.data_file is not None:
+                    result['files'].append(m.data_file)
+            result['ok'] = True
+        except Exception as err:
+            traceback.print_exc()
+            result['ok'] = False
+            result['error'] = f'{type(err).__name__}: {err}'
+        finally:
+            result['duration_s'] = time.perf_counter() - t
+            result['interrupted'] = m.interrupt_measurement_called
+            m.post_run()
+        if mode == 'calibrate':
+            result['phase_error'] = m.settings['phase_error']
+            result['voltage_sequence'] = m.settings['voltage_sequence']
+        result['stages_ms'] = m.timer.summary()
+        return result
+
+    def run_measure(self, repeats, save, result):
+        """ Acquires repeats stacks back to back, as measure in run() """
+        m = self.measurement
+        m.image_gen.read_from_hardware()
+        m.apply_sensor_roi()
+        stacks = 0
+        t = time.perf_counter()
+        try:
+            for _ in range(repeats):
+                if m.interrupt_measurement_called:
+                    break
+                m.measure(save)
+                if save:
+                    m.close_data_file()
+                    result['files'].append(m.data_file)
+                stacks += 1
+        finally:
+            if hasattr(m, 'frame_writer'):
+                m.close_data_file()
+            m.settings['save_h5'] = False
+            m.restore_sensor_roi()
+            m.ni_ao_0.stop()
+            m.ni_ao_1.stop()
+            elapsed = time.perf_counter() - t
+            result['stacks'] = stacks
+            result['stacks_per_s'] = stacks / max(elapsed, 1e-9)
+            result['frames_per_s'] = stacks * m.settings['num_phases'] / max(elapsed, 1e-9)
+
+    def run_jobs(self, jobs, stop_on_error=False):
+        """ Runs the jobs in order, yields their results. Stops when interrupted """
+        self.stopped = False
+        for job in jobs:
+            if self.stopped:
+                break
+            result = self.run(job)
+            yield result
+            if stop_on_error and not result['ok']:
+                break
+
+    def interrupt(self):
+        self.stopped = True
+        self.measurement.interrupt_measurement_called = True
+
+
+def load_jobs(fname):
+    """ Jobs of a .json file (a list) or of a .jsonl file (one job per line) """
+    with open(fname) as f:
+        if fname.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def parse_setting(text):
+    """ 'name=value' to (name, value), value parsed as json if possible """
+    key, _, value = text.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return key.strip(), value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('ini', nargs='?', default='', help='settings file, e.g. Settings/hexSIM.ini')
+    parser.add_argument('--jobs', default='', help='.json list or .jsonl file of jobs')
+    parser.add_argument('--mode', default='measure', choices=list(JOB_MODES), help='single job, without --jobs')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='setting of the single job')
+    parser.add_argument('--simulate', action='store_true', help='simulated camera and analog outputs')
+    parser.add_argument('--output', default='', help='results appended as json lines')
+    parser.add_argument('--stop-on-error', action='store_true')
+    args = parser.parse_args()
+
+    if args.jobs:
+        jobs = load_jobs(args.jobs)
+    else:
+        jobs = [{'mode': args.mode, 'repeats': args.repeats, 'settings': dict(map(parse_setting, args.set))}]
+    runner = HeadlessRunner(create_app(args.ini, args.simulate))
+    try:
+        for result in runner.run_jobs(jobs, args.stop_on_error):
+            status = 'ok' if result['ok'] else result['error']
+            print(f'{result["name"]}: {status} in {result["duration_s"]:.2f} s', end='')
+            if 'stacks_per_s' in result:
+                print(f', {result["stacks"]} stacks ({result["stacks_per_s"]:.2f} stacks/s)', end='')
+            print()
+            if args.output:
+                append_json_line(args.output, result)
+    except KeyboardInterrupt:
+        runner.interrupt()
+        print('Interrupted')
+    finally:
+        for hw in runner.app.hardware.values():
+            hw.settings['connected'] = False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Live SIM reconstruction in a separate process. The phase stacks acquired in
+continuous mode are sent to a worker process, which reconstructs them with a
+HexSimProcessor and sends back the super-resolved images. Stale stacks and
+images are dropped when the worker or the display can't keep up, so the
+acquisition never waits and the display shows the latest image.
+"""
+import multiprocessing
+import queue
+import time
+import numpy as np
+
+
+def send_latest(outputs, item):
+    """ Puts item in the outputs queue, replacing the result not collected yet """
+    try:
+        while True:
+            outputs.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        outputs.put_nowait(item)
+    except queue.Full:
+        pass
+
+
+def reconstruction_worker(params, kx, ky, inputs, outputs, fft=None):
+    """
+    Runs in the worker process. params are the HexSimProcessor attributes
+    (see FlirNImeasure.reconstructor_params). If the carrier kx, ky is given,
+    the first stack is calibrated with it, otherwise the carrier is searched.
+    fft are the arguments of the FFTBackend of the process, if any.
+    A failed calibration or reconstruction is sent as (None, message, 0), and
+    the next stack is calibrated again.
+    """
+    from HexSIM_Microscope.reconstruction import create_reconstructor, reconstructor_module
+    from HexSIM_Microscope.fft_backend import FFTBackend
+    h = create_reconstructor(params)
+    backend = FFTBackend(*(fft or ()))
+    backend.install(reconstructor_module(h))
+    calibrated = False
+    while True:
+        item = inputs.get()
+        if item is None:
+            break
+        index, stack = item
+        t = time.perf_counter()
+        stack = stack.astype(np.float32)
+        try:
+            if not calibrated:
+                if kx is not None:
+                    h.kx = kx
+                    h.ky = ky
+                h.calibrate(stack, kx is None)
+                backend.single_precision(h)
+                calibrated = True
+            img = h.reconstruct_rfftw(stack)
+        except Exception as err:
+            calibrated = False
+            send_latest(outputs, (None, f'{type(err).__name__}: {err}', 0.0))
+            continue
+        send_latest(outputs, (index, img, time.perf_counter() - t))
+
+
+class LiveReconstructor():
+    """
+    Handles the worker process and its queues. submit() and result() never block.
+    """
+
+    def __init__(self, params, kx=None, ky=None, fft=None):
+        context = multiprocessing.get_context('spawn')
+        self.inputs = context.Queue(maxsize=1)
+        self.outputs = context.Queue(maxsize=1)
+        self.process = context.Process(target=reconstruction_worker,
+                                       args=(params, kx, ky, self.inputs, self.outputs, fft),
+                                       name='LiveReconstructor', daemon=True)
+        self.submitted = 0
+        self.dropped = 0
+        self.reconstructed = 0
+        self.failed = 0
+        self.last_duration = 0.0
+        self.last_error = None
+
+    def start(self):
+        self.process.start()
+
+    def submit(self, index, stack):
+        """
+        Sends a stack (phases x N x N) to the worker. If the previous stack
+        has not been taken yet, it is replaced by this one.
+        The stack must not be modified afterwards.
+        """
+        try:
+            self.inputs.put_nowait((index, stack))
+        except queue.Full:
+            try:
+                self.inputs.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self.inputs.put_nowait((index, stack))
+            except queue.Full:
+                self.dropped += 1
+                return
+        self.submitted += 1
+
+    def result(self):
+        """
+        Returns (index, image) of the latest reconstruction, or None.
+        If the worker failed, its message is in last_error
+        """
+        try:
+            index, img, duration = self.outputs.get_nowait()
+        except queue.Empty:
+            return None
+        if index is None:
+            self.failed += 1
+            self.last_error = img
+            return None
+        self.reconstructed += 1
+        self.last_duration = duration
+        return index, img
+
+    def stop(self, timeout=5.0):
+        try:
+            while True:
+                self.inputs.get_nowait() # discard the pending stack
+        except queue.Empty:
+            pass
+        try:
+            self.inputs.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.inputs.cancel_join_thread()
+        self.outputs.cancel_join_thread()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Multi-dimensional acquisition: time points, stage positions and z slices
+around the phase sequence of measure(). AcquisitionPlan describes the loops,
+AcquisitionEngine runs them. The stack of each point goes to its own
+t{time:04d}/c{N}/image dataset, N counting the positions and z slices of
+the time point. While the next point moves the stage or waits for its time,
+the previous stack is compressed and written by an H5StackWriter thread,
+and optionally reconstructed by a pool of worker processes (t*/c*/sim).
+"""
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from HexSIM_Microscope.reconstruction import create_reconstructor, reconstructor_module
+from HexSIM_Microscope.fft_backend import FFTBackend
+
+
+def parse_positions(text):
+    """ Stage positions from a string 'x0, y0; x1, y1; ...'. Returns a list of (x, y) """
+    positions = []
+    for item in text.split(';'):
+        if item.strip():
+            x, y = (float(v) for v in item.split(','))
+            positions.append((x, y))
+    return positions
+
+
+class PlanPoint():
+    """ A point of the plan: indices, start time (s from the start of the run), stage position and z """
+
+    def __init__(self, t_index, c_index, time, position=None, z=None):
+        self.t_index = t_index
+        self.c_index = c_index
+        self.time = time
+        self.position = position
+        self.z = z
+
+    @property
+    def group(self):
+        return f't{self.t_index:04d}/c{self.c_index}'
+
+    def attrs(self):
+        attrs = {'t_index': self.t_index, 'c_index': self.c_index, 'planned_time': self.time}
+        if self.position is not None:
+            attrs['stage_x'], attrs['stage_y'] = self.position
+        if self.z is not None:
+            attrs['stage_z'] = self.z
+        return attrs
+
+
+class AcquisitionPlan():
+    """
+    Nested loops of a multi-dimensional acquisition: time points (outer
+    loop, every interval s), stage positions (x, y), z slices (inner loop).
+    Empty positions or z_positions leave the stage where it is.
+    """
+
+    def __init__(self, time_points=1, interval=0.0, positions=None, z_positions=None):
+        self.time_points = int(time_points)
+        self.interval = float(interval)
+        self.positions = [tuple(p) for p in positions or []]
+        self.z_positions = [float(z) for z in z_positions or []]
+
+    def __len__(self):
+        return self.time_points * max(len(self.positions), 1) * max(len(self.z_positions), 1)
+
+    def points(self):
+        for t_index in range(self.time_points):
+            c_index = 0
+            for position in self.positions or [None]:
+                for z in self.z_positions or [None]:
+                    yield PlanPoint(t_index, c_index, t_index * self.interval, position, z)
+                    c_index += 1
+
+    def to_dict(self):
+        return {'time_points': self.time_points, 'interval': self.interval,
+                'positions': [list(p) for p in self.positions], 'z_positions': self.z_positions}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+
+_worker = {} # state of each reconstruction worker process
+
+
+def init_reconstruction(params, kx, ky, stack, fft=None):
+    """
+    Calibrates the reconstructor of the worker on stack, searching the carrier
+    if kx is None. fft are the arguments of the FFTBackend of the worker, if any
+    """
+    h = create_reconstructor(params)
+    backend = FFTBackend(*(fft or ()))
+    backend.install(reconstructor_module(h))
+    if kx is not None:
+        h.kx = kx
+        h.ky = ky
+    h.calibrate(stack.astype(np.float32), kx is None)
+    backend.single_precision(h)
+    _worker['h'] = h
+
+
+def reconstruct_stack(stack):
+    return np.asarray(_worker['h'].reconstruct_rfftw(stack.astype(np.float32)), dtype=np.float32)
+
+
+class StackReconstructor():
+    """
+    Reconstructs the ROI (rows, cols slices) of the stacks on a pool of
+    worker processes, calibrated on the first stack submitted.
+    attrs are written with the reconstructed images
+    """
+
+    def __init__(self, params, rows, cols, kx=None, ky=None, workers=1, attrs=None, fft=None):
+        self.params = params
+        self.fft = fft
+        self.attrs = attrs or {}
+        self.rows = rows
+        self.cols = cols
+        self.kx = kx
+        self.ky = ky
+        self.workers = workers
+        self.pool = None
+        self.pending = {}
+
+    def submit(self, name, stack):
+        roi = np.ascontiguousarray(stack[:, self.rows, self.cols])
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_reconstruction,
+                                            initargs=(self.params, self.kx, self.ky, roi, self.fft))
+        self.pending[self.pool.submit(reconstruct_stack, roi)] = name
+
+    def ready(self, wait=False):
+        """ Returns the (name, image) reconstructed so far, all of them if wait """
+        done = [f for f in self.pending if wait or f.done()]
+        return [(self.pending.pop(f), f.result()) for f in done]
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+class AcquisitionEngine():
+    """
+    Runs the points of plan:
+        move_xy(x, y) and move_z(z), if given, move the stage
+        acquire(buffer) acquires the phase stack, in buffer if not None, and returns it
+        writer (H5StackWriter) writes the stacks, with the attrs of each point
+        stack_attrs(), optional, returns attributes of the stack just acquired
+        reconstructor (StackReconstructor), optional, reconstructs them
+    The stacks are acquired in a ring of buffers, reused once written, so
+    the frames are not copied.
+    """
+
+    def __init__(self, plan, acquire, writer, move_xy=None, move_z=None,
+                 reconstructor=None, attrs=None, stack_attrs=None, timer=None):
+        self.plan = plan
+        self.acquire = acquire
+        self.writer = writer
+        self.move_xy = move_xy
+        self.move_z = move_z
+        self.reconstructor = reconstructor
+        self.attrs = attrs or {}
+        self.stack_attrs = stack_attrs
+        self.timer = timer
+        self.ring = None
+        self.acquired = 0
+
+    def run(self, should_stop=lambda: False, on_point=None):
+        """
+        Runs the plan until done or should_stop() is True. on_point(point) is
+        called after each acquisition. Returns the number of stacks acquired
+        """
+        start = time.perf_counter()
+        position = None
+        for point in self.plan.points():
+            if should_stop():
+                break
+            t = time.perf_counter()
+            if self.move_xy is not None and point.position is not None and point.position != position:
+                self.move_xy(*point.position)
+                position = point.position
+            if self.move_z is not None and point.z is not None:
+                self.move_z(point.z)
+            self._add('mda_move', time.perf_counter() - t)
+            t = time.perf_counter()
+            while time.perf_counter() < start + point.time and not should_stop():
+                time.sleep(max(min(0.01, start + point.time - time.perf_counter()), 0))
+            self._add('mda_wait', time.perf_counter() - t)
+            if should_stop():
+                break
+            buffer = None if self.ring is None else self.ring[self.acquired % len(self.ring)]
+            stack = self.acquire(buffer)
+            if self.ring is None:
+                # queue_size stacks queued, one being written, one being acquired
+                self.ring = [np.empty_like(stack) for _ in range(self.writer.queue.maxsize + 2)]
+            attrs = dict(self.attrs, **point.attrs(), timestamp=time.time())
+            if self.stack_attrs is not None:
+                attrs.update(self.stack_attrs())
+            self.writer.put(point.group + '/image', stack, attrs)
+            if self.reconstructor is not None:
+                self.reconstructor.submit(point.group + '/sim', stack)
+                self._write_reconstructions()
+            self.acquired += 1
+            if on_point is not None:
+                on_point(point)
+        if self.reconstructor is not None:
+            self._write_reconstructions(wait=not should_stop())
+        return self.acquired
+
+    def _write_reconstructions(self, wait=False):
+        for name, img in self.reconstructor.ready(wait):
+            self.writer.put(name, img, self.reconstructor.attrs)
+
+    def _add(self, stage, duration):
+        if self.timer is not None:
+            self.timer.add(stage, duration)
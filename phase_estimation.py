@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Phases of the illumination pattern in a stack of SIM frames, for all the
+carriers at once. The carriers are generally not on the FFT grid, so the
+Fourier coefficient of each carrier is evaluated exactly, with a separable
+DFT: two matrix products over the whole stack.
+The units are those of HexSimProcessor: carrier frequencies kx, ky in NA/wavelength,
+kx along the columns (last axis) and ky along the rows of the frames.
+"""
+import numpy as np
+
+
+def carrier_phases(stack, kx, ky, dx, NA, wavelength):
+    """
+    stack : frames x rows x columns
+    kx, ky : carrier frequencies (NA/wavelength), one per carrier
+    dx : pixel size in the sample (um)
+    Returns phases and amplitudes of the carriers, carriers x frames
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    kx = np.atleast_1d(np.asarray(kx, dtype=float)).ravel()
+    ky = np.atleast_1d(np.asarray(ky, dtype=float)).ravel()
+    nz, ny, nx = stack.shape
+    x = (np.arange(nx) - nx/2) * dx
+    y = (np.arange(ny) - ny/2) * dx
+    scale = 2*np.pi*NA/wavelength
+    ex = np.exp(-1j*scale*np.outer(x, kx)).astype(np.complex64) # columns x carriers
+    ey = np.exp(-1j*scale*np.outer(ky, y)).astype(np.complex64) # carriers x rows
+    # sum over the columns for every carrier, then over the rows
+    partial = stack @ ex # frames x rows x carriers
+    coeffs = np.einsum('zrc,cr->cz', partial, ey)
+    return np.angle(coeffs), np.abs(coeffs) / (nx*ny)
+
+
+def phase_steps(phases, expected):
+    """
+    Phase shifts relative to the first frame, unwrapped around the expected ones.
+    phases, expected : carriers x frames
+    """
+    shifts = np.unwrap(phases - expected, axis=-1) + expected
+    return shifts - phases[:, :1]
+
+
+def off_carrier(kx, ky):
+    """ The carriers rotated by 90 degrees: same distance from the origin, no illumination pattern """
+    return -np.ravel(ky), np.ravel(kx)
+
+
+def carrier_contrast(stack, kx, ky, dx, NA, wavelength):
+    """
+    Amplitude of each carrier relative to the amplitude at the carrier rotated
+    by 90 degrees (the background of the sample and the noise), median over
+    the frames. About 1 if the carrier is not in the stack
+    """
+    _phases, amplitudes = carrier_phases(stack, kx, ky, dx, NA, wavelength)
+    _phases, background = carrier_phases(stack, *off_carrier(kx, ky), dx, NA, wavelength)
+    return np.median(amplitudes / np.maximum(background, 1e-12), axis=1)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Helpers shared by the measurement, the live reconstruction process and the
+batch reconstruction: the HexSimProcessor settings and the ROI of the frames.
+"""
+import sys
+
+# settings of the measurement copied to the HexSimProcessor
+RECONSTRUCTOR_SETTINGS = ['magnification', 'NA', 'n', 'wavelength', 'pixelsize',
+                          'alpha', 'beta', 'w', 'eta']
+
+# fixed HexSimProcessor options
+RECONSTRUCTOR_OPTIONS = {'debug': False,
+                         'cleanup': True,
+                         'axial': False,
+                         'usemodulation': True}
+
+
+def reconstructor_params(settings):
+    """ HexSimProcessor attributes from a mapping with the measurement settings """
+    params = dict(RECONSTRUCTOR_OPTIONS)
+    for key in RECONSTRUCTOR_SETTINGS:
+        params[key] = settings[key]
+    return params
+
+
+def create_reconstructor(params):
+    """ Returns a HexSimProcessor with the given attributes """
+    # imported on first use: HexSimProcessor (and its optional cupy path) is slow to import
+    from HexSimProcessor.SIM_processing.hexSimProcessor import HexSimProcessor
+    h = HexSimProcessor()
+    for key, val in params.items():
+        setattr(h, key, val)
+    return h
+
+
+def reconstructor_module(h):
+    """ The module of the HexSimProcessor h, whose FFTs the FFTBackend replaces """
+    return sys.modules[type(h).__module__]
+
+
+def roi_slices(shape, x, y, size):
+    """
+    Returns the (row, column) slices of the size x size ROI centred in (x, y),
+    kept inside an image of the given shape. x is the row, y the column
+    (pyqtgraph is transposed)
+    """
+    Ly = shape[-1]
+    Lx = shape[-2]
+    x = max(min(x, Lx-size//2 ),size//2 )
+    y = max(min(y, Ly-size//2 ),size//2 )
+    xmin = x - size//2
+    ymin = y - size//2
+    return slice(xmin, xmin+size), slice(ymin, ymin+size)
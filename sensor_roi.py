@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Hardware ROI of the camera: only a window of the sensor is read out, which
+reduces the USB bandwidth and the readout time. Cameras with set_roi/reset_roi
+methods (e.g. the simulated one) are used directly; otherwise the
+OffsetX/OffsetY/Width/Height nodes of the Spinnaker (PySpin) camera
+object camera.cam are programmed. The acquisition must be stopped.
+"""
+
+
+class SensorROIError(RuntimeError):
+    pass
+
+
+def set_sensor_roi(camera, offset_x, offset_y, width, height):
+    """
+    Reads out only the window of the sensor at (offset_x, offset_y), in pixels.
+    x is horizontal (the column index of the frames), y vertical (the row index).
+    The values are rounded to the increments allowed by the camera.
+    Returns the actual (offset_x, offset_y, width, height)
+    """
+    if hasattr(camera, 'set_roi'):
+        return camera.set_roi(offset_x, offset_y, width, height)
+    cam = _spinnaker_camera(camera)
+    # offsets to 0 first, so that any width and height are allowed
+    cam.OffsetX.SetValue(cam.OffsetX.GetMin())
+    cam.OffsetY.SetValue(cam.OffsetY.GetMin())
+    width = _set_node(cam.Width, width)
+    height = _set_node(cam.Height, height)
+    offset_x = _set_node(cam.OffsetX, offset_x)
+    offset_y = _set_node(cam.OffsetY, offset_y)
+    return offset_x, offset_y, width, height
+
+
+def reset_sensor_roi(camera):
+    """ Restores the full frame readout """
+    if hasattr(camera, 'reset_roi'):
+        camera.reset_roi()
+        return
+    cam = _spinnaker_camera(camera)
+    cam.OffsetX.SetValue(cam.OffsetX.GetMin())
+    cam.OffsetY.SetValue(cam.OffsetY.GetMin())
+    cam.Width.SetValue(cam.Width.GetMax())
+    cam.Height.SetValue(cam.Height.GetMax())
+
+
+def _spinnaker_camera(camera):
+    cam = getattr(camera, 'cam', None)
+    if cam is None or not hasattr(cam, 'OffsetX'):
+        raise SensorROIError(f'{type(camera).__name__} does not support a hardware ROI')
+    return cam
+
+
+def _set_node(node, value):
+    """ Sets an integer GenICam node to the closest allowed value and returns it """
+    vmin = node.GetMin()
+    inc = max(node.GetInc(), 1)
+    value = vmin + (int(value) - vmin) // inc * inc
+    value = min(max(value, vmin), node.GetMax())
+    node.SetValue(value)
+    return value
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Settle time of the phase shifters after a voltage step, measured on the
+camera: the step is repeated with increasing delays between the voltage
+write and the frame, until the frame no longer differs from the settled one.
+The settle times are stored per AO channel and per step size, and used by
+measure() instead of a fixed sleep.
+"""
+import json
+import os
+import threading
+import time
+import numpy as np
+
+
+SETTLE_MODES = ['fixed', 'adaptive']
+
+
+def transitions(voltages, decimals=2):
+    """
+    The voltage steps between consecutive phases (last to first included)
+    of a channel. Returns {step size (V): (v_from, v_to)}, one transition per
+    step size rounded to decimals
+    """
+    voltages = np.asarray(voltages, dtype=float)
+    result = {}
+    for v_from, v_to in zip(np.roll(voltages, 1), voltages):
+        step = round(abs(v_to - v_from), decimals)
+        if step > 0 and step not in result:
+            result[step] = (float(v_from), float(v_to))
+    return dict(sorted(result.items()))
+
+
+def deviation(frame, initial, final):
+    """ Distance of frame from the final (settled) frame, relative to the change caused by the step """
+    step = np.linalg.norm(final - initial)
+    if step == 0:
+        return 0.0
+    return float(np.linalg.norm(frame - final) / step)
+
+
+def settle_search(probe, delays, threshold):
+    """
+    Bisection for the shortest of delays (sorted) after which probe(delay),
+    the deviation of a frame taken delay after the step, is below threshold.
+    The deviation is assumed to decrease with the delay.
+    Returns the delay, or None if even the longest one is not enough
+    """
+    low, high = 0, len(delays) - 1
+    if probe(delays[high]) > threshold:
+        return None
+    while low < high:
+        mid = (low + high) // 2
+        if probe(delays[mid]) <= threshold:
+            high = mid
+        else:
+            low = mid + 1
+    return float(delays[low])
+
+
+class PipelinedWrite(threading.Thread):
+    """
+    Writes the voltages of the next phase once the exposure of the current
+    frame is over, so that they settle during its readout: guard (s) after
+    the end-of-exposure strobe, if the camera reports it (strobe_callbacks),
+    else delay (s) after start(). Without strobe and without delay (None),
+    the voltages are written by finish(), after the readout.
+    Start the writer before the acquisition of the frame, and call finish()
+    once the frame is read.
+    """
+
+    def __init__(self, write, voltages, camera, delay=None, guard=0.0):
+        super().__init__(name='PipelinedWrite', daemon=True)
+        self.write = write
+        self.voltages = voltages
+        self.delay = delay
+        self.guard = guard
+        self.exposed = threading.Event()
+        self.callbacks = getattr(camera, 'strobe_callbacks', None)
+        if self.callbacks is not None:
+            self.callbacks.append(self.exposed.set)
+
+    def run(self):
+        if self.callbacks is None and self.delay is not None:
+            self.exposed.wait(self.delay)
+        else:
+            if self.exposed.wait():
+                time.sleep(self.guard)
+        self.write(*self.voltages)
+
+    def finish(self):
+        """ Called once the frame is read: the exposure is over. Waits for the write """
+        self.exposed.set()
+        self.join()
+        if self.callbacks is not None and self.exposed.set in self.callbacks:
+            self.callbacks.remove(self.exposed.set)
+
+
+class SettleTable():
+    """
+    Settle times (s) per channel and step size (V). A step is given the
+    settle time of the smallest characterized step not smaller than it,
+    or of the largest one.
+    """
+
+    def __init__(self, times=None):
+        # {channel: {step: time}}
+        self.times = {int(ch): {float(step): float(t) for step, t in steps.items()}
+                      for ch, steps in (times or {}).items()}
+
+    def set(self, channel, step, settle):
+        self.times.setdefault(channel, {})[float(step)] = round(float(settle), 6)
+
+    def lookup(self, channel, step):
+        """ Settle time of a step of the channel, None if the channel was not characterized """
+        steps = self.times.get(channel)
+        if not steps:
+            return None
+        step = abs(step)
+        if step == 0:
+            return 0.0
+        for size in sorted(steps):
+            if size >= step:
+                return steps[size]
+        return steps[max(steps)]
+
+    def __len__(self):
+        return sum(len(steps) for steps in self.times.values())
+
+    def save(self, fname):
+        folder = os.path.dirname(fname)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(fname, 'w') as f:
+            json.dump({str(ch): {str(step): t for step, t in steps.items()}
+                       for ch, steps in self.times.items()}, f, indent=1)
+
+    @classmethod
+    def load(cls, fname):
+        """ Returns the table saved in fname, or an empty table if there is none """
+        if not os.path.exists(fname):
+            return cls()
+        with open(fname) as f:
+            return cls(json.load(f))
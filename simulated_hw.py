@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Simulated FLIR camera and NI analog outputs, drop-in replacements for
+FlirHW and NI_AO_hw. The camera renders hexagonal 3-beam SIM illumination
+on a synthetic sample, with the phases of two beams set by the voltages
+last written on the two AO channels. Alternatively it replays the
+t*/c0/image stacks of a previously saved h5 file.
+Start the app with the --simulate argument to use them.
+"""
+from ScopeFoundry import HardwareComponent
+import numpy as np
+import h5py
+import time
+
+
+class SimAODevice():
+    """
+    Analog output with a first order settling of time constant tau (s)
+    """
+
+    def __init__(self, tau=0.0):
+        self.tau = tau
+        self.voltage = 0.0
+        self._previous = 0.0
+        self._t_write = 0.0
+
+    def write_constant_voltage(self, value):
+        now = time.perf_counter()
+        self._previous = self.voltage_at(now)
+        self.voltage = float(value)
+        self._t_write = now
+
+    def voltage_at(self, t):
+        if self.tau <= 0:
+            return self.voltage
+        decay = np.exp(-max(t - self._t_write, 0.0) / self.tau)
+        return self.voltage + (self._previous - self.voltage) * decay
+
+
+class SimAOSequence():
+    """
+    Simulated counterpart of ao_sequence.NIAOSequence: each column of the
+    table is written to the AO devices on the end-of-exposure strobe
+    of the simulated camera.
+    """
+
+    def __init__(self, devices, camera, continuous=False):
+        self.devices = devices
+        self.camera = camera
+        self.continuous = continuous
+        self.data = None
+        self.index = 0
+
+    def load(self, voltages):
+        data = np.asarray(voltages, dtype=float)
+        if data.ndim != 2 or data.shape[0] != len(self.devices):
+            raise ValueError(f'Expected a {len(self.devices)} x steps voltage table, got shape {data.shape}')
+        self.data = data
+        self.index = 0
+
+    def strobe(self):
+        steps = self.data.shape[1]
+        if self.index >= steps and not self.continuous:
+            return
+        for device, value in zip(self.devices, self.data[:, self.index % steps]):
+            device.write_constant_voltage(value)
+        self.index += 1
+
+    def start(self):
+        self.camera.strobe_callbacks.append(self.strobe)
+
+    def wait_until_done(self, timeout=10.0):
+        pass
+
+    def stop(self):
+        if self.strobe in self.camera.strobe_callbacks:
+            self.camera.strobe_callbacks.remove(self.strobe)
+
+    def close(self):
+        self.stop()
+        self.data = None
+
+
+class SimNI_AO_hw(HardwareComponent):
+
+    name = 'NI_AO_hw'
+
+    def setup(self):
+        self.settings.New('device', dtype=str, initial='Simulated', ro=True)
+        self.settings.New('channel', dtype=str, initial='Sim/ao0')
+        self.settings.New('trigger_source', dtype=str, initial='/Sim/PFI0')
+        self.settings.New('trigger_edge', dtype=str, initial='rising', choices=['rising','falling'])
+        self.settings.New('phase_per_volt', dtype=float, initial=2*np.pi/5, spinbox_decimals=3, unit='rad/V')
+        self.settings.New('settling_tau', dtype=float, initial=0.002, spinbox_decimals=4, unit='s')
+        self.settings.New('voltage', dtype=float, initial=0.0, ro=True, unit='V')
+        self.settings.settling_tau.add_listener(self.update_tau)
+
+    def connect(self):
+        self.AO_device = SimAODevice(tau=self.settings['settling_tau'])
+        self.settings.voltage.connect_to_hardware(read_func=lambda: self.AO_device.voltage)
+
+    def update_tau(self):
+        if hasattr(self, 'AO_device'):
+            self.AO_device.tau = self.settings['settling_tau']
+
+    def phase(self, t):
+        """ Phase (rad) of the beam driven by this channel at time t """
+        return self.settings['phase_per_volt'] * self.AO_device.voltage_at(t)
+
+    def create_sequence(self, ao_hws, continuous=False):
+        camera = self.app.hardware['FLIRhw'].camera
+        return SimAOSequence([hw.AO_device for hw in ao_hws], camera, continuous)
+
+    def stop(self):
+        pass
+
+    def disconnect(self):
+        self.settings.disconnect_all_from_hardware()
+        if hasattr(self, 'AO_device'):
+            del self.AO_device
+
+
+class SimCameraDevice():
+    """
+    Mimics the camera object of FlirHW: set_framenum, acq_start, acq_stop
+    and get_nparray, with exposure and readout timing.
+    """
+
+    def __init__(self, hw):
+        self.hw = hw
+        self.framenum = 1
+        self.running = False
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.strobe_callbacks = []
+        self.replay_frames = None
+        self.roi = None
+        self.rng = np.random.default_rng()
+
+    def set_framenum(self, num):
+        self.framenum = num
+
+    def acq_start(self):
+        self.running = True
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.t0 = time.perf_counter()
+
+    def acq_stop(self):
+        self.running = False
+
+    def frame_period(self):
+        s = self.hw.settings
+        busy = (s['exposure_time'] + self.readout_time()) * 1e-3
+        return max(1.0/s['frame_rate'], busy)
+
+    def readout_time(self):
+        """ Readout time (ms), proportional to the number of rows read """
+        s = self.hw.settings
+        if self.roi is None:
+            return s['readout_time']
+        return s['readout_time'] * self.roi[3] / s['image_height']
+
+    def set_roi(self, offset_x, offset_y, width, height):
+        """
+        Reads out only the given window of the sensor, with offsets and size 
+        rounded to multiples of 4 px as in the FLIR cameras.
+        Returns the actual (offset_x, offset_y, width, height)
+        """
+        if self.running:
+            raise RuntimeError('Simulated camera: the ROI cannot change during the acquisition')
+        s = self.hw.settings
+        width = min(max(width // 4 * 4, 16), s['image_width'])
+        height = min(max(height // 4 * 4, 16), s['image_height'])
+        offset_x = min(offset_x // 4 * 4, s['image_width'] - width)
+        offset_y = min(offset_y // 4 * 4, s['image_height'] - height)
+        self.roi = (offset_x, offset_y, width, height)
+        return self.roi
+
+    def reset_roi(self):
+        self.roi = None
+
+    def get_nparray(self, out=None):
+        """
+        Returns the next frame. If out has the frame shape, the frame is
+        written in it and out is returned.
+        """
+        if not self.running:
+            raise RuntimeError('Simulated camera: acquisition not started')
+        mode = self.hw.settings['acquisition_mode']
+        if mode == 'SingleFrame' and self.frame_count >= 1 or \
+           mode == 'MultiFrame' and self.frame_count >= self.framenum:
+            raise RuntimeError('Simulated camera: no more frames in this acquisition')
+        exposure = self.hw.settings['exposure_time'] * 1e-3
+        readout = self.readout_time() * 1e-3
+        period = self.frame_period()
+        # frames not read within buffer_frames periods are overwritten, as in the camera buffer
+        behind = int((time.perf_counter() - self.t0) / period) - self.frame_count
+        if mode == 'Continuous' and behind > self.hw.settings['buffer_frames']:
+            skip = behind - self.hw.settings['buffer_frames']
+            self.frame_count += skip
+            self.dropped_frames += skip
+            # the overwritten frames were exposed: their strobes advanced the AO sequence
+            for _ in range(skip):
+                for callback in list(self.strobe_callbacks):
+                    callback()
+        t_start = self.t0 + self.frame_count * period
+        self._sleep_until(t_start)
+        img = self.render(t_start + exposure/2, out) # rendering time is hidden in the exposure
+        self._sleep_until(t_start + exposure)
+        for callback in list(self.strobe_callbacks):
+            callback()
+        self._sleep_until(t_start + exposure + readout)
+        self.frame_count += 1
+        return img
+
+    def _sleep_until(self, t):
+        dt = t - time.perf_counter()
+        if dt > 0:
+            time.sleep(dt)
+
+    def render(self, t, out=None):
+        if self.replay_frames is not None:
+            img = self.replay(self.frame_count)
+            if self.roi is not None:
+                offset_x, offset_y, width, height = self.roi
+                img = img[offset_y:offset_y+height, offset_x:offset_x+width]
+            if out is not None and out.shape == img.shape:
+                out[...] = img
+                return out
+            return img
+        s = self.hw.settings
+        phases = [0.0]
+        for hw in self.hw.ao_hws():
+            phases.append(hw.phase(t))
+        pattern = self.pattern if self.roi is None else self.pattern.crop(*self.roi)
+        illumination = pattern.illumination(phases, s['modulation'])
+        photons = pattern.sample * illumination * (s['brightness'] * s['exposure_time'])
+        gain = 10**(s['gain']/20)
+        counts = photons * gain + s['black_level']
+        # gaussian approximation of shot and read noise, drawn once per frame
+        variance = s['read_noise']**2
+        if s['shot_noise']:
+            variance = photons * gain**2 + variance
+        counts += np.sqrt(variance) * self.rng.standard_normal(counts.shape, dtype=np.float32)
+        np.clip(counts, 0, 4095, out=counts)
+        if out is not None and out.shape == counts.shape:
+            out[...] = counts
+            return out
+        return counts.astype(np.uint16)
+
+    def load_replay(self, fname):
+        """
+        Collects the t*/c0/image datasets of an h5 file written by create_h5_file
+        """
+        from HexSIM_Microscope.h5_compression import load_blosc
+        load_blosc() # registers the Blosc filter, if installed, for compressed files
+        self.close_replay()
+        self.replay_file = h5py.File(fname, 'r')
+        stacks = []
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset) and name.endswith('c0/image'):
+                stacks.append(obj)
+        self.replay_file.visititems(visit)
+        if len(stacks) == 0:
+            raise ValueError(f'No t*/c0/image dataset found in {fname}')
+        self.replay_frames = [(stack, i) for stack in stacks for i in range(stack.shape[0])]
+
+    def replay(self, index):
+        stack, i = self.replay_frames[index % len(self.replay_frames)]
+        return stack[i, :, :]
+
+    def close_replay(self):
+        if self.replay_frames is not None:
+            self.replay_file.close()
+            self.replay_frames = None
+
+
+class SimPattern():
+    """
+    Hexagonal illumination from 3 beams at 120 degrees, on a synthetic sample.
+    The spatial cos/sin terms of the 3 beam interferences are precomputed,
+    so that each frame only combines them with the beam phases.
+    """
+
+    def __init__(self, height, width, period, angle=0.0, seed=0):
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        k = 2*np.pi / period / np.sqrt(3) # beam wavevector, in px^-1, giving fringes with the given period
+        thetas = angle + np.arange(3) * 2*np.pi/3
+        beams = [k * (np.cos(th)*x + np.sin(th)*y) for th in thetas]
+        self.pairs = [(0,1), (1,2), (2,0)]
+        self.cos = []
+        self.sin = []
+        for b, c in self.pairs:
+            arg = beams[b] - beams[c]
+            self.cos.append(np.cos(arg))
+            self.sin.append(np.sin(arg))
+        rng = np.random.default_rng(seed)
+        noise = rng.random((height, width))
+        ky = np.fft.fftfreq(height)[:, None]
+        kx = np.fft.rfftfreq(width)[None, :]
+        lowpass = np.exp(-(kx**2 + ky**2) / (2 * 0.02**2))
+        structure = np.fft.irfft2(np.fft.rfft2(noise) * lowpass, s=(height, width))
+        structure = (structure - structure.min()) / np.ptp(structure)
+        self.sample = (0.3 + 0.7 * structure).astype(np.float32)
+
+    def crop(self, offset_x, offset_y, width, height):
+        """ Pattern of a window of the sensor, sharing the precomputed terms """
+        window = (slice(offset_y, offset_y + height), slice(offset_x, offset_x + width))
+        cropped = SimPattern.__new__(SimPattern)
+        cropped.pairs = self.pairs
+        cropped.cos = [cos[window] for cos in self.cos]
+        cropped.sin = [sin[window] for sin in self.sin]
+        cropped.sample = self.sample[window]
+        return cropped
+
+    def illumination(self, phases, modulation=1.0):
+        """ Normalized intensity of the 3 beams with the given phases (rad) """
+        total = np.full(self.sample.shape, 3.0/9.0, dtype=np.float32)
+        term = np.empty_like(total)
+        for (b, c), cos, sin in zip(self.pairs, self.cos, self.sin):
+            dphi = phases[b] - phases[c]
+            np.multiply(cos, np.float32(2 * modulation * np.cos(dphi) / 9.0), out=term)
+            total += term
+            np.multiply(sin, np.float32(-2 * modulation * np.sin(dphi) / 9.0), out=term)
+            total += term
+        return total
+
+
+class SimFlirHW(HardwareComponent):
+
+    name = 'FLIRhw'
+
+    def setup(self):
+        self.settings.New('name', dtype=str, initial='Simulated Grasshopper3', ro=True)
+        self.settings.New('temperature', dtype=float, initial=40.0, ro=True, unit='C')
+        self.image_width = self.settings.New('image_width', dtype=int, initial=1920, vmin=16, unit='px')
+        self.image_height = self.settings.New('image_height', dtype=int, initial=1200, vmin=16, unit='px')
+        self.gain = self.settings.New('gain', dtype=float, initial=0.0, unit='dB')
+        self.frame_rate = self.settings.New('frame_rate', dtype=float, initial=10.0, vmin=0.1, unit='Hz')
+        self.frame_num = self.settings.New('frame_num', dtype=int, initial=7, vmin=1)
+        self.exposure_time = self.settings.New('exposure_time', dtype=float, initial=20.0, vmin=0.01, unit='ms')
+        self.acquisition_mode = self.settings.New('acquisition_mode', dtype=str, initial='Continuous',
+                                                  choices=['Continuous', 'SingleFrame', 'MultiFrame'])
+        self.settings.New('readout_time', dtype=float, initial=25.0, vmin=0, unit='ms')
+        self.settings.New('buffer_frames', dtype=int, initial=10, vmin=1)
+        self.settings.New('pattern_period', dtype=float, initial=8.0, vmin=2.0, unit='px')
+        self.settings.New('pattern_angle', dtype=float, initial=0.1, spinbox_decimals=3, unit='rad')
+        self.settings.New('modulation', dtype=float, initial=0.8, vmin=0, vmax=1)
+        self.settings.New('brightness', dtype=float, initial=50.0, vmin=0, unit='counts/ms')
+        self.settings.New('black_level', dtype=float, initial=60.0, vmin=0)
+        self.settings.New('shot_noise', dtype=bool, initial=True)
+        self.settings.New('read_noise', dtype=float, initial=3.0, vmin=0)
+        self.settings.New('replay_file', dtype='file', initial='')
+        self.settings.New('ao_names', dtype=str, initial='Analog_Output_0,Analog_Output_1')
+        for name in ('image_width', 'image_height', 'pattern_period', 'pattern_angle'):
+            getattr(self.settings, name).add_listener(self.new_pattern)
+        self.settings.replay_file.add_listener(self.update_replay)
+
+    def connect(self):
+        self.camera = SimCameraDevice(self)
+        self.new_pattern()
+        self.update_replay()
+
+    def ao_hws(self):
+        return [self.app.hardware[name.strip()] for name in self.settings['ao_names'].split(',')]
+
+    def new_pattern(self):
+        if hasattr(self, 'camera'):
+            s = self.settings
+            self.camera.pattern = SimPattern(s['image_height'], s['image_width'],
+                                             s['pattern_period'], s['pattern_angle'])
+
+    def update_replay(self):
+        if not hasattr(self, 'camera'):
+            return
+        fname = self.settings['replay_file']
+        if fname:
+            self.camera.load_replay(fname)
+            height, width = self.camera.replay(0).shape
+            self.settings['image_height'] = height
+            self.settings['image_width'] = width
+        else:
+            self.camera.close_replay()
+
+    def disconnect(self):
+        self.settings.disconnect_all_from_hardware()
+        if hasattr(self, 'camera'):
+            self.camera.acq_stop()
+            self.camera.close_replay()
+            del self.camera
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Storage back-ends for the measured frames, besides the ScopeFoundry h5 file:
+    'npy'  raw memory-mapped .npy file, the fastest path to disk: the frames
+           are grabbed directly in the mapped file (see FramePool.attach)
+    'zarr' chunked Zarr store, one chunk per frame, readable in parallel.
+           Needs the zarr package (version 2)
+The metadata (settings of the app, hardware and measurement, and the
+attributes of the image dataset, e.g. element_size_um) are stored in a
+<name>.json file next to the .npy file, or in the attributes of the Zarr store.
+convert_to_h5 writes them back to the h5 layout of create_h5_file.
+
+Converter, run from the folder containing HexSIM_Microscope:
+    python -m HexSIM_Microscope.storage D:/data/210507_120000_FLIR_NI_measurement.npy
+"""
+import argparse
+import json
+import os
+import h5py
+import numpy as np
+
+from HexSIM_Microscope.h5_writer import H5FrameWriter
+
+
+STORAGE_BACKENDS = ['h5', 'npy', 'zarr']
+IMAGE_PATH = 't0000/c0/image'
+
+
+def _json_value(val):
+    if isinstance(val, np.generic):
+        return val.item()
+    if isinstance(val, np.ndarray):
+        return val.tolist()
+    return val
+
+
+def settings_metadata(app, measurement):
+    """ Settings of the app, of the hardware and of the measurement, as saved by ScopeFoundry in h5 """
+    return {'app': app.settings.as_value_dict(),
+            'hardware': {name: hw.settings.as_value_dict() for name, hw in app.hardware.items()},
+            'measurement': {'name': measurement.name,
+                            'settings': measurement.settings.as_value_dict()}}
+
+
+class NpyFrameWriter():
+    """
+    Writes the frames in a memory-mapped .npy file, with the metadata in a
+    .json file. put() copies the frame in the mapped file, unless the frame
+    already is the slot of the file (zero copy). The operating system
+    writes the pages to disk in the background.
+    Same interface as H5FrameWriter: put, close and the statistics.
+    """
+
+    def __init__(self, fname, shape, dtype, attrs=None, metadata=None):
+        self.fname = fname
+        open(fname, 'xb').close() # never overwrites a capture
+        self.array = np.lib.format.open_memmap(fname, mode='w+', dtype=dtype, shape=tuple(shape))
+        self.metadata = dict(metadata or {})
+        self.metadata['attrs'] = {key: _json_value(val) for key, val in (attrs or {}).items()}
+        self.metadata['num_frames'] = 0
+        self.written = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0
+        self.blocked_count = 0
+
+    def slot(self, index):
+        """ The frame index of the mapped file, to grab the camera frame directly in it """
+        return self.array[index]
+
+    def put(self, index, frame):
+        slot = self.array[index]
+        if not np.shares_memory(slot, frame):
+            slot[...] = frame
+        self.written += 1
+
+    def close(self):
+        self.array.flush()
+        self.metadata['num_frames'] = self.written
+        with open(os.path.splitext(self.fname)[0] + '.json', 'w') as f:
+            json.dump(self.metadata, f, indent=1, default=_json_value)
+        del self.array
+
+
+def open_zarr(fname, shape, dtype, attrs=None, metadata=None, level=4):
+    """ Creates the Zarr store with the image array. Returns the array """
+    import zarr # optional dependency, imported on first use
+    from numcodecs import Blosc
+    root = zarr.open_group(fname, mode='w-') # never overwrites a capture
+    for key, val in (metadata or {}).items():
+        root.attrs[key] = _json_value(val) if not isinstance(val, dict) else json.loads(
+            json.dumps(val, default=_json_value))
+    compressor = Blosc(cname='lz4', clevel=level, shuffle=Blosc.BITSHUFFLE)
+    array = root.create_dataset(IMAGE_PATH, shape=shape, chunks=(1, *shape[1:]),
+                                dtype=dtype, compressor=compressor)
+    array.attrs.update({key: _json_value(val) for key, val in (attrs or {}).items()})
+    return array
+
+
+class ZarrFrameWriter(H5FrameWriter):
+    """
+    Writes the frames in a Zarr array on a separate thread, as H5FrameWriter.
+    Each chunk is complete on disk when written, so there is nothing to flush.
+    """
+
+    def __init__(self, array, queue_size=16, timer=None):
+        super().__init__(array, None, queue_size, timer=timer)
+        self.name = 'ZarrFrameWriter'
+
+    def flush(self):
+        pass
+
+    def close(self):
+        super().close()
+        self.dataset.attrs['num_frames'] = self.written
+
+
+def read_frames(fname):
+    """
+    Opens a .npy or .zarr capture. Returns (frames, attrs, metadata),
+    frames being a memory map or a Zarr array (read lazily)
+    """
+    if fname.rstrip('/\\').endswith('.zarr'):
+        import zarr
+        root = zarr.open_group(fname, mode='r')
+        frames = root[IMAGE_PATH]
+        return frames, dict(frames.attrs), dict(root.attrs)
+    frames = np.load(fname, mmap_mode='r')
+    with open(os.path.splitext(fname)[0] + '.json') as f:
+        metadata = json.load(f)
+    return frames, metadata.pop('attrs', {}), metadata
+
+
+def _write_settings(group, settings):
+    settings_group = group.require_group('settings')
+    for key, val in settings.items():
+        if val is None:
+            continue
+        try:
+            settings_group.attrs[key] = val
+        except TypeError:
+            settings_group.attrs[key] = str(val)
+
+
+def convert_to_h5(fname, h5_fname=None):
+    """
+    Writes a .npy or .zarr capture to an h5 file with the layout of
+    create_h5_file: measurement/<name>/t0000/c0/image, with the settings.
+    Returns the name of the h5 file
+    """
+    frames, attrs, metadata = read_frames(fname)
+    if h5_fname is None:
+        h5_fname = os.path.splitext(fname.rstrip('/\\'))[0] + '.h5'
+    num_frames = int(attrs.pop('num_frames', metadata.get('num_frames', frames.shape[0])) or frames.shape[0])
+    measurement = metadata.get('measurement', {'name': 'FLIR_NI_measurement', 'settings': {}})
+    with h5py.File(h5_fname, 'w') as h5file:
+        _write_settings(h5file.require_group('app'), metadata.get('app', {}))
+        for name, settings in metadata.get('hardware', {}).items():
+            _write_settings(h5file.require_group(f'hardware/{name}'), settings)
+        group = h5file.require_group(f'measurement/{measurement["name"]}')
+        _write_settings(group, measurement['settings'])
+        dataset = group.create_dataset(IMAGE_PATH, shape=(num_frames, *frames.shape[1:]),
+                                       dtype=frames.dtype, chunks=(1, *frames.shape[1:]))
+        for key, val in attrs.items():
+            dataset.attrs[key] = val
+        for i in range(num_frames):
+            dataset[i] = frames[i]
+    return h5_fname
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help='.npy or .zarr captures')
+    args = parser.parse_args()
+    for fname in args.files:
+        print(f'{fname} -> {convert_to_h5(fname)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Fixtures of the tests: the FLIR_NI_App on the simulated hardware, without
+user interface (see headless.create_app), shared by all the tests.
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+# the repository is the HexSIM_Microscope package: its parent folder must be importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+pytest.importorskip('ScopeFoundry')
+
+
+# voltages (channels x phases) giving distinct phases on the simulated pattern
+VOLTAGES = np.array([[0.0, 0.7, 1.4, 2.1, 2.8, 3.5, 4.2],
+                     [0.0, 1.2, 2.4, 3.6, 4.8, 6.0, 7.2]])
+
+
+@pytest.fixture(scope='session')
+def app():
+    from HexSIM_Microscope.headless import create_app
+    app = create_app(simulate=True)
+    yield app
+    for hw in app.hardware.values():
+        hw.settings['connected'] = False
+
+
+@pytest.fixture
+def voltages():
+    return VOLTAGES.copy()
+
+
+@pytest.fixture
+def measurement(app, tmp_path):
+    """
+    The FlirNImeasure with small, noise-free frames, saving in tmp_path.
+    The analog outputs settle immediately, so that every frame is deterministic
+    """
+    app.settings['save_dir'] = str(tmp_path)
+    app.settings['sample'] = ''
+    camera = app.hardware['FLIRhw']
+    camera.settings['image_height'] = 64
+    camera.settings['image_width'] = 80
+    camera.settings['exposure_time'] = 1.0
+    camera.settings['readout_time'] = 1.0
+    camera.settings['frame_rate'] = 200.0
+    camera.settings['shot_noise'] = False
+    camera.settings['read_noise'] = 0.0
+    for name in ('Analog_Output_0', 'Analog_Output_1'):
+        app.hardware[name].settings['settling_tau'] = 0.0
+    m = app.measurements['FLIR_NI_measurement']
+    for key, value in {'num_phases': 7, 'calibrate': False, 'measure': False, 'frame_qc': False,
+                       'hw_timed': False, 'storage': 'h5', 'compression': 'none'}.items():
+        m.settings[key] = value
+    m.set_phase_voltages(VOLTAGES)
+    m.interrupt_measurement_called = False
+    m.pre_run()
+    m.image_gen.read_from_hardware()
+    yield m
+    m.close_data_file()
+    m.settings['save_h5'] = False
+    m.ni_ao_0.stop()
+    m.ni_ao_1.stop()
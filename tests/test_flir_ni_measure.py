@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Hardware-timed acquisition of FLIR_NI_measure on the simulated camera and
+analog outputs: the stack must be that of the software-timed acquisition.
+"""
+import h5py
+import numpy as np
+import pytest
+
+from HexSIM_Microscope.FLIR_NI_measure import FlirNImeasure
+
+
+class FlirNImeasureUnderTest(FlirNImeasure):
+    name = 'FLIR_NI_measure_test' # the app already has a FLIR_NI_measurement
+
+
+@pytest.fixture
+def old_measurement(app, measurement, voltages):
+    """ FLIR_NI_measure in the app, with the camera and outputs set up by the measurement fixture """
+    if not hasattr(app.measurements, FlirNImeasureUnderTest.name):
+        app.add_measurement(FlirNImeasureUnderTest(app))
+    m = app.measurements[FlirNImeasureUnderTest.name]
+    for (i, j), voltage in np.ndenumerate(voltages):
+        m.settings[f'table{i,j}'] = voltage
+    m.write_UItable()
+    m.interrupt_measurement_called = False
+    yield m
+    m.settings['hw_timed'] = False
+
+
+def measure_stack(measurement):
+    measurement.measure() # always saved
+    fname = measurement.h5file.filename
+    measurement.h5file.close()
+    with h5py.File(fname, 'r') as h5file:
+        return h5file[f'measurement/{measurement.name}/t0/c0/image'][:]
+
+
+def test_hw_timed_matches_sw_timed(app, old_measurement):
+    app.settings['sample'] = 'sw_timed' # file names are unique only to the second
+    sw_timed = measure_stack(old_measurement)
+    old_measurement.settings['hw_timed'] = True
+    app.settings['sample'] = 'hw_timed'
+    hw_timed = measure_stack(old_measurement)
+    assert hw_timed.shape == (7, 64, 80)
+    assert not np.array_equal(hw_timed[1], hw_timed[0])
+    np.testing.assert_array_equal(hw_timed, sw_timed)
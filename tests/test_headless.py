@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Queue of headless jobs on the simulated hardware: jobs run back to back,
+within the same second, must each write their own data files.
+"""
+import os
+import pytest
+
+from HexSIM_Microscope.headless import HeadlessRunner
+from HexSIM_Microscope.storage import read_frames
+
+
+@pytest.mark.parametrize('storage', ['h5', 'npy', 'zarr'])
+def test_back_to_back_jobs(measurement, storage):
+    if storage == 'zarr':
+        pytest.importorskip('zarr')
+    runner = HeadlessRunner(measurement.app)
+    jobs = [{'name': f'job{index}', 'mode': 'measure', 'repeats': 2, 'settings': {'storage': storage}}
+            for index in range(4)]
+    results = list(runner.run_jobs(jobs))
+    assert all(result['ok'] for result in results)
+    files = [fname for result in results for fname in result['files']]
+    assert len(files) == 8
+    assert len(set(files)) == len(files)
+    assert all(os.path.exists(fname) for fname in files)
+    if storage != 'h5':
+        assert all(read_frames(fname)[0].shape[0] == 7 for fname in files)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Regression tests of the acquisition on the simulated camera and analog
+outputs (see simulated_hw.py): hardware- and software-timed stacks, the
+npy and zarr storage back-ends and the compressed h5 writer.
+
+Run from the folder containing HexSIM_Microscope:
+    python -m pytest HexSIM_Microscope/tests
+"""
+import h5py
+import numpy as np
+import pytest
+
+from HexSIM_Microscope.h5_compression import create_encoder, load_blosc
+from HexSIM_Microscope.h5_writer import H5FrameWriter
+from HexSIM_Microscope.storage import convert_to_h5, read_frames, IMAGE_PATH
+
+
+def measure_stack(measurement, save_data=False):
+    measurement.measure(save_data)
+    if save_data:
+        measurement.close_data_file()
+    return np.array(measurement.imgs)
+
+
+def test_phases_follow_the_voltages(measurement):
+    stack = measure_stack(measurement)
+    assert stack.shape == (7, 64, 80)
+    for index in range(1, len(stack)):
+        assert not np.array_equal(stack[index], stack[0])
+
+
+def test_hw_timed_matches_sw_timed(measurement):
+    sw_timed = measure_stack(measurement)
+    measurement.settings['hw_timed'] = True
+    hw_timed = measure_stack(measurement)
+    np.testing.assert_array_equal(hw_timed, sw_timed)
+
+
+@pytest.mark.parametrize('storage', ['npy', 'zarr'])
+def test_convert_to_h5(measurement, storage):
+    if storage == 'zarr':
+        pytest.importorskip('zarr')
+    measurement.settings['storage'] = storage
+    stack = measure_stack(measurement, save_data=True)
+    frames, attrs, metadata = read_frames(measurement.data_file)
+    np.testing.assert_array_equal(frames, stack)
+    with h5py.File(convert_to_h5(measurement.data_file), 'r') as h5file:
+        dataset = h5file[f'measurement/{measurement.name}/{IMAGE_PATH}']
+        np.testing.assert_array_equal(dataset[:], stack)
+        np.testing.assert_allclose(dataset.attrs['element_size_um'], attrs['element_size_um'])
+
+
+@pytest.mark.parametrize('method', ['gzip', 'blosc_lz4'])
+def test_direct_chunk_writer(tmp_path, method):
+    if method == 'blosc_lz4' and not load_blosc():
+        pytest.skip('blosc and hdf5plugin are not installed')
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 4096, size=(5, 48, 64), dtype=np.uint16) # 12-bit camera data
+    encoder = create_encoder(method, level=4, workers=2)
+    fname = str(tmp_path / f'{method}.h5')
+    with h5py.File(fname, 'w') as h5file:
+        dataset = h5file.create_dataset('image', shape=frames.shape, dtype=frames.dtype,
+                                        chunks=(1, *frames.shape[1:]), **encoder.dataset_options())
+        writer = H5FrameWriter(dataset, h5file, encoder=encoder)
+        writer.start()
+        for index, frame in enumerate(frames):
+            writer.put(index, frame)
+        writer.close()
+        assert writer.written == len(frames)
+    with h5py.File(fname, 'r') as h5file:
+        np.testing.assert_array_equal(h5file['image'][:], frames)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Low-overhead timers for the stages of the acquisition and calibration
+(AO write, settle, camera grab, h5 write and flush, ROI cut, calibration...)
+and the JSON lines log of their statistics
+"""
+import json
+import numpy as np
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+class StageTimer():
+    """
+    Collects the durations (s) of named stages.
+    Use as:
+        with timer('ao_write'):
+            ...
+    Only the last window durations of each stage are kept (rolling histogram),
+    the count and total time are cumulative since reset().
+    """
+
+    def __init__(self, enabled=True, window=1000):
+        self.enabled = enabled
+        self.records = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.totals = defaultdict(float)
+
+    @contextmanager
+    def __call__(self, stage):
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t)
+
+    def add(self, stage, duration):
+        if self.enabled:
+            self.records[stage].append(duration)
+            self.counts[stage] += 1
+            self.totals[stage] += duration
+
+    def reset(self):
+        self.records.clear()
+        self.counts.clear()
+        self.totals.clear()
+
+    def summary(self):
+        """
+        Returns a dict {stage: {n, total, mean, p50, p95, max}} with times in ms.
+        n, total and mean are since reset(), p50, p95 and max over the window
+        """
+        result = {}
+        for stage, values in list(self.records.items()):
+            ms = np.array(tuple(values)) * 1e3 # copied at once, other threads may be adding
+            if ms.size == 0:
+                continue
+            total = self.totals[stage] * 1e3
+            result[stage] = {'n': self.counts[stage],
+                             'total': total,
+                             'mean': total / self.counts[stage],
+                             'p50': float(np.percentile(ms, 50)),
+                             'p95': float(np.percentile(ms, 95)),
+                             'max': float(ms.max())}
+        return result
+
+
+def append_json_line(fname, record):
+    """ Appends record (a dict) as a line of the JSON lines file fname """
+    folder = os.path.dirname(fname)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(fname, 'a') as f:
+        f.write(json.dumps(record) + '\n')
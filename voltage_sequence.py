@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+The phase voltage sequence: a float array channels x steps, validated on
+every change, that the acquisition reads without parsing. The table of the
+user interface is only a view of it. In the ini and h5 settings the sequence
+is a single string, one row per channel separated by ';':
+    voltage_sequence = 0 4.5 5.9 7.5; 0 3.32 4.7 5.8
+Sequences are imported and exported as .npy or .csv (one row per channel).
+"""
+import os
+import numpy as np
+
+
+class VoltageSequenceError(ValueError):
+    pass
+
+
+class VoltageSequence():
+    """
+    Voltages (V) of each AO channel at each step of the phase sequence,
+    within [vmin, vmax]
+    """
+
+    def __init__(self, voltages=None, channels=2, steps=7, vmin=-10.0, vmax=10.0):
+        self.vmin = vmin
+        self.vmax = vmax
+        if voltages is None:
+            voltages = np.zeros((channels, steps))
+        self.array = self.validate(voltages)
+
+    @property
+    def channels(self):
+        return self.array.shape[0]
+
+    @property
+    def steps(self):
+        return self.array.shape[1]
+
+    def validate(self, voltages):
+        """ Returns voltages as a C-contiguous 2D float64 array, or raises VoltageSequenceError """
+        try:
+            array = np.array(voltages, dtype=np.float64, ndmin=2)
+        except (TypeError, ValueError) as err:
+            raise VoltageSequenceError(f'Not a voltage sequence: {err}') from None
+        if array.ndim != 2:
+            raise VoltageSequenceError(f'Expected channels x steps voltages, got shape {array.shape}')
+        if not np.all(np.isfinite(array)):
+            raise VoltageSequenceError('Voltages must be finite')
+        if array.size and (array.min() < self.vmin or array.max() > self.vmax):
+            raise VoltageSequenceError(f'Voltages out of the AO range [{self.vmin}, {self.vmax}] V')
+        return array
+
+    def set(self, voltages):
+        self.array = self.validate(voltages)
+
+    def set_value(self, channel, step, value):
+        """ Sets a single voltage, growing the sequence if needed """
+        self.resize(max(self.channels, channel+1), max(self.steps, step+1), shrink=False)
+        self.array[channel, step] = self.validate(value)[0, 0]
+
+    def resize(self, channels, steps, shrink=True):
+        """ Pads with zeros to channels x steps, and if shrink crops the voltages outside """
+        if not shrink:
+            channels = max(channels, self.channels)
+            steps = max(steps, self.steps)
+        array = np.zeros((channels, steps))
+        c = min(channels, self.channels)
+        s = min(steps, self.steps)
+        array[:c, :s] = self.array[:c, :s]
+        self.array = array
+
+    def waveform(self, channels=None, steps=None, repeats=1):
+        """
+        The voltages output by the acquisition: the first channels x steps
+        (padded with zeros if the sequence is shorter), repeated repeats
+        times. Returns a new C-contiguous float64 array
+        """
+        channels = self.channels if channels is None else channels
+        steps = self.steps if steps is None else steps
+        array = np.zeros((channels, steps))
+        c = min(channels, self.channels)
+        s = min(steps, self.steps)
+        array[:c, :s] = self.array[:c, :s]
+        return np.ascontiguousarray(np.tile(array, (1, repeats)))
+
+    @classmethod
+    def interleave(cls, sequences):
+        """
+        The steps of the sequences (same channels) alternated: the first step of
+        each, then the second of each... The shorter sequences are padded with zeros
+        """
+        steps = max(s.steps for s in sequences)
+        channels = sequences[0].channels
+        array = np.stack([s.waveform(channels, steps) for s in sequences], axis=-1)
+        return cls(array.reshape(channels, -1), vmin=sequences[0].vmin, vmax=sequences[0].vmax)
+
+    def to_string(self):
+        """ Compact form stored in the ini file, the shortest representation of each voltage """
+        return '; '.join(' '.join(np.format_float_positional(v, trim='-') for v in row)
+                         for row in self.array)
+
+    def from_string(self, text):
+        """ Sets the voltages from the form of to_string """
+        rows = [row.split() for row in text.split(';') if row.strip()]
+        if not rows:
+            raise VoltageSequenceError('Empty voltage sequence')
+        if len(set(len(row) for row in rows)) > 1:
+            raise VoltageSequenceError('The channels of the voltage sequence have different lengths')
+        self.set(rows)
+
+    def save(self, fname):
+        """ Saves the voltages to a .npy or .csv file """
+        if os.path.splitext(fname)[1].lower() == '.npy':
+            np.save(fname, self.array)
+        else:
+            np.savetxt(fname, self.array, delimiter=',', fmt='%.10g')
+
+    def load(self, fname):
+        """ Sets the voltages from a .npy or .csv file """
+        if os.path.splitext(fname)[1].lower() == '.npy':
+            self.set(np.load(fname))
+        else:
+            self.set(np.loadtxt(fname, delimiter=',', ndmin=2))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Closed-loop correction of the voltage table from the measured phase shifts.
+The phases of the carriers are modelled as linear in the voltages of the
+channels: phase = A @ voltages + offset. The response A (carriers x channels)
+is fitted by least squares on the phase steps measured in all the iterations,
+and each iteration makes a Newton step towards the expected phases.
+A step that increases the phase error is rejected: the next step is made
+from the best voltages measured, with half the gain.
+"""
+import numpy as np
+
+
+def wrap_phase(phase):
+    """ Wraps the phases to [-pi, pi) """
+    return (np.asarray(phase) + np.pi) % (2*np.pi) - np.pi
+
+
+class VoltageSolver():
+    """
+    voltages are (channels x phases) arrays, expected and measured phases are
+    (carriers x phases) arrays relative to the first phase, as returned by
+    find_phaseshifts. The voltages of the first phase are never changed.
+    initial_response is the phase per volt (rad/V) of each channel on the
+    corresponding carrier, used until the measured steps span all channels.
+    best_voltages are the voltages with the lowest rms error measured so far.
+    """
+
+    fit_passes = 3 # the 2pi ambiguity of the phases is resolved again after each fit
+
+    def __init__(self, initial_response=1.0, gain=1.0, vmin=-10.0, vmax=10.0, rcond=1e-3):
+        self.initial_response = initial_response
+        self.gain = gain
+        self.max_gain = gain
+        self.vmin = vmin
+        self.vmax = vmax
+        self.rcond = rcond
+        self.response = None
+        self.best_voltages = None
+        self.best_error = np.inf
+        self.rejected = 0 # steps that increased the error
+        self.improved = False # the last measured voltages are best_voltages
+        self._best_phases = None # expected and measured phases of best_voltages
+        self._steps_v = [] # voltage steps, (channels x samples) for each iteration
+        self._steps_p = [] # phase steps, (carriers x samples) for each iteration
+
+    @staticmethod
+    def error(expected, measured):
+        """ Phase error (rad), wrapped, carriers x phases """
+        return wrap_phase(np.asarray(expected) - np.asarray(measured))
+
+    def rms_error(self, expected, measured):
+        return float(np.sqrt(np.mean(self.error(expected, measured)**2)))
+
+    def fit(self, voltages, measured):
+        """
+        Adds the phase steps of this iteration to the data and fits the response A.
+        Returns A, the initial guess while the voltage steps do not span all the channels
+        """
+        voltages = np.asarray(voltages, dtype=float)
+        measured = np.asarray(measured, dtype=float)
+        self._steps_v.append(voltages[:,1:] - voltages[:,:1])
+        self._steps_p.append(measured[:,1:] - measured[:,:1])
+        dv = np.concatenate(self._steps_v, axis=1)
+        dp = np.concatenate(self._steps_p, axis=1)
+        channels = voltages.shape[0]
+        if self.response is None:
+            self.response = self.initial_response * np.eye(measured.shape[0], channels)
+        if np.linalg.matrix_rank(dv, tol=1e-6) == channels:
+            A = self.response
+            for _ in range(self.fit_passes):
+                # the phases are known modulo 2pi: take the branch closest to the model
+                predicted = A @ dv
+                dp = predicted + wrap_phase(dp - predicted)
+                # dp = A @ dv for all the samples: solve dv.T @ A.T = dp.T
+                A = np.linalg.lstsq(dv.T, dp.T, rcond=None)[0].T
+            self.response = A
+        return self.response
+
+    def step(self, voltages, expected, measured):
+        """
+        Returns the corrected voltages (channels x phases): the Newton step
+        that cancels the phase error with the fitted response.
+        If the rms error of voltages is not below that of best_voltages, the
+        gain is halved and the step is made again from best_voltages
+        (the response is fitted on all the measurements, also the rejected ones).
+        The gain is doubled again, up to its initial value, after each improvement
+        """
+        voltages = np.asarray(voltages, dtype=float)
+        A = self.fit(voltages, measured)
+        if self.rms_error(expected, measured) < self.best_error:
+            self.best_voltages = voltages.copy()
+            self.best_error = self.rms_error(expected, measured)
+            self._best_phases = (expected, measured)
+            self.gain = min(2 * self.gain, self.max_gain)
+            self.improved = True
+        else:
+            self.improved = False
+            self.rejected += 1
+            self.gain /= 2
+            voltages = self.best_voltages
+            expected, measured = self._best_phases
+        error = self.error(expected, measured)
+        error -= error[:,:1] # the first phase is the reference
+        correction = np.linalg.pinv(A, rcond=self.rcond) @ error
+        return np.clip(voltages + self.gain * correction, self.vmin, self.vmax)